@@ -0,0 +1,235 @@
+# python benchmarks/bench_break_detection.py --series 20 --noise 0 0.05 --breaks 0 -0.15 -0.3
+"""
+Accuracy and speed benchmark for the break detection and scoring modes.
+
+Builds a library of synthetic daily count series with a known level shift
+(break size 0 = no break) placed near the ICD-10 transition, at several noise
+levels. Each series goes through the pipeline's own builders
+(timeseries_from_daily_counts / daily_counts_frame) and through every mode in
+MODES, and judge_break decides whether the mode calls it an artificial break.
+Per mode, noise level and break size it reports
+    detect_rate  power on break series, false-alarm rate on no-break series
+    date_error   median |estimated - true break date| in days, detected series
+    latency      median / p95 seconds per series (detection call only)
+and writes one JSON file per run to benchmarks/results/ tagged with the current
+git commit, like bench_pipeline.py.
+"""
+
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import sys
+import time
+from contextlib import redirect_stdout
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.abspath(os.path.join(HERE, ".."))
+sys.path.insert(0, os.path.join(REPO_ROOT, "mapping"))
+
+from bench_pipeline import git_commit  # noqa: E402
+from break_detection.break_detector import BreakDetector  # noqa: E402
+from hypothesis_refinement.refinement_loop import judge_break  # noqa: E402
+from time_series_evaluator.create_time_series import (  # noqa: E402
+    daily_counts_frame,
+    timeseries_from_daily_counts,
+)
+from time_series_evaluator.itsa_evaluator import ITSADetector  # noqa: E402
+
+TRANSITION = pd.Timestamp("2015-10-01")
+VALUE_COL = "flag_count364"
+
+
+def _rolling(detector):
+    """Mode scored on the 364-day rolling sums (detect_breaks)."""
+
+    def run(ts, daily):
+        return detector.detect_breaks(ts, "date", VALUE_COL, plot_results=False)
+
+    return run
+
+
+def _with_count_model(detector):
+    """Mode scored by the daily count model, as evaluate_hypothesis does it."""
+
+    def run(ts, daily):
+        analysis = detector.detect_breaks(ts, "date", VALUE_COL, plot_results=False)
+        analysis["count_model"] = detector.detect_breaks_daily(daily, date_col="date")
+        return analysis
+
+    return run
+
+
+# mode name -> run(ts, daily) -> break_analysis
+MODES = {
+    "forced_chow": _rolling(BreakDetector()),
+    "auto_chow": _rolling(BreakDetector(force_icd_segments=False)),
+    "seasonal_chow": _rolling(BreakDetector(seasonality="both")),
+    "rate_chow": _rolling(BreakDetector(use_rate=True)),
+    "quasipoisson": _with_count_model(BreakDetector(count_model="quasipoisson", seasonality="both")),
+    "negbin": _with_count_model(BreakDetector(count_model="negbin", seasonality="both")),
+    "itsa": _rolling(ITSADetector()),
+}
+
+
+def make_series(rng, args, break_size: float, noise: float) -> dict:
+    """
+    One synthetic series: flagged daily counts with annual / weekly seasonality,
+    a level shift of break_size at a day within break_jitter of the transition,
+    and day-level gamma noise of variance `noise` (0 = pure Poisson).
+    """
+    start = pd.Timestamp(args.start)
+    dates = pd.date_range(start, args.end, freq="D")
+    t = np.arange(len(dates))
+    season = 1 + args.seasonal * np.cos(2 * np.pi * (dates.dayofyear.to_numpy() - 1) / 365.25)
+    season *= np.where(dates.dayofweek.to_numpy() >= 5, 1 - args.weekly, 1.0)
+    break_date = TRANSITION + pd.Timedelta(
+        days=int(rng.integers(-args.break_jitter, args.break_jitter + 1))
+    )
+    level = np.where(t >= (break_date - start).days, 1 + break_size, 1.0)
+    lam = args.base * season * level
+    if noise > 0:
+        lam = lam * rng.gamma(1 / noise, noise, size=len(t))
+    flag_daily = rng.poisson(lam)
+    all_daily = flag_daily + rng.poisson(args.base * 20 * season)
+    return {
+        "break_size": break_size,
+        "noise": noise,
+        "break_date": break_date if break_size else None,
+        "ts": timeseries_from_daily_counts(
+            flag_daily, all_daily, start, "date", "flag_bench", cap_year=None
+        ),
+        "daily": daily_counts_frame(flag_daily, all_daily, start, "date", "flag_bench"),
+    }
+
+
+def date_error(analysis: dict, true_date: pd.Timestamp) -> float:
+    """Days from the true break to the nearest reported break (the ICD cut if none)."""
+    candidates = list(analysis.get("break_dates") or []) or [TRANSITION]
+    return float(min(abs((pd.Timestamp(d) - true_date).days) for d in candidates))
+
+
+def run_benchmarks(args) -> dict:
+    rng = np.random.default_rng(args.seed)
+    library = [
+        make_series(rng, args, size, noise)
+        for noise in args.noise
+        for size in args.breaks
+        for _ in range(args.series)
+    ]
+    print(f"Built {len(library)} series ({len(library[0]['ts'])} rolling points each).")
+
+    results = []
+    for mode in args.modes:
+        run = MODES[mode]
+        cells = {}
+        for s in library:
+            with redirect_stdout(io.StringIO()):
+                t0 = time.perf_counter()
+                analysis = run(s["ts"], s["daily"])
+                latency = time.perf_counter() - t0
+            artificial = judge_break(analysis)[0]
+            cell = cells.setdefault((s["noise"], s["break_size"]), {"hits": [], "errors": [], "latency": []})
+            cell["hits"].append(artificial)
+            cell["latency"].append(latency)
+            if artificial and s["break_date"] is not None:
+                cell["errors"].append(date_error(analysis, s["break_date"]))
+        for (noise, size), cell in sorted(cells.items()):
+            row = {
+                "mode": mode,
+                "noise": noise,
+                "break_size": size,
+                "metric": "power" if size else "false_alarm",
+                "n_series": len(cell["hits"]),
+                "detect_rate": float(np.mean(cell["hits"])),
+                "date_error_days_median": float(np.median(cell["errors"])) if cell["errors"] else None,
+                "latency_s_median": float(np.median(cell["latency"])),
+                "latency_s_p95": float(np.percentile(cell["latency"], 95)),
+            }
+            results.append(row)
+            err = row["date_error_days_median"]
+            print(
+                f"{mode:<14} noise={noise:<5g} break={size:<+6g} {row['metric']:<11} "
+                f"{row['detect_rate']:6.0%}  date err {'-' if err is None else f'{err:5.0f}d':>6}  "
+                f"{row['latency_s_median'] * 1e3:8.1f}ms (p95 {row['latency_s_p95'] * 1e3:.1f}ms)"
+            )
+    return {
+        "commit": git_commit(),
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+        },
+        "params": {k: v for k, v in vars(args).items() if k != "out"},
+        "results": results,
+        "summary": summarize(results),
+    }
+
+
+def _fmt(value, spec: str) -> str:
+    return "-" if value is None else format(value, spec)
+
+
+def summarize(results: list[dict]) -> list[dict]:
+    """Per mode: mean power over break sizes, false-alarm rate, median latency."""
+    summary = []
+    for mode in dict.fromkeys(r["mode"] for r in results):
+        rows = [r for r in results if r["mode"] == mode]
+        power = [r["detect_rate"] for r in rows if r["break_size"]]
+        alarms = [r["detect_rate"] for r in rows if not r["break_size"]]
+        errors = [r["date_error_days_median"] for r in rows if r["date_error_days_median"] is not None]
+        summary.append(
+            {
+                "mode": mode,
+                "power": float(np.mean(power)) if power else None,
+                "false_alarm": float(np.mean(alarms)) if alarms else None,
+                "date_error_days_median": float(np.median(errors)) if errors else None,
+                "latency_s_median": float(np.median([r["latency_s_median"] for r in rows])),
+            }
+        )
+    print("\n📊 Summary (power averaged over break sizes)")
+    for s in summary:
+        print(
+            f"{s['mode']:<14} power {_fmt(s['power'], '6.0%')}  false alarm {_fmt(s['false_alarm'], '6.0%')}  "
+            f"date err {_fmt(s['date_error_days_median'], '5.0f')}d  {s['latency_s_median'] * 1e3:8.1f}ms"
+        )
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--series", type=int, default=20, help="series per noise level and break size")
+    parser.add_argument("--breaks", type=float, nargs="+", default=[0.0, -0.15, -0.3],
+                        help="relative level shifts (0 = no break)")
+    parser.add_argument("--noise", type=float, nargs="+", default=[0.0, 0.05],
+                        help="variance of the day-level gamma noise (0 = Poisson only)")
+    parser.add_argument("--base", type=float, default=30.0, help="flagged claims per day before the break")
+    parser.add_argument("--seasonal", type=float, default=0.1, help="annual amplitude (winter peak)")
+    parser.add_argument("--weekly", type=float, default=0.2, help="weekend volume drop")
+    parser.add_argument("--break-jitter", type=int, default=90, help="max days between break and transition")
+    parser.add_argument("--start", default="2014-01-01")
+    parser.add_argument("--end", default="2020-12-31")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=os.path.join(HERE, "results"))
+    args = parser.parse_args()
+
+    report = run_benchmarks(args)
+    os.makedirs(args.out, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    out_path = os.path.join(args.out, f"break_detection_{stamp}_{report['commit']}.json")
+    with open(out_path, "w") as fh:
+        json.dump(report, fh, indent=2)
+    print(f"\nSaved {out_path}")
+
+
+if __name__ == "__main__":
+    main()
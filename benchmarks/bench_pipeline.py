@@ -0,0 +1,216 @@
+# python benchmarks/bench_pipeline.py --sizes 10000 100000 1000000
+"""
+Pipeline benchmark on synthetic claims (see mapping/utils/synthetic_claims.py).
+
+Times each stage separately for every claim count:
+    generate -> ingest (CSV read) -> clean_data -> flag_dataframe
+    -> create_timeseries_function -> BreakDetector.detect_breaks
+and writes one JSON file per run to benchmarks/results/ tagged with the current
+git commit, so results can be compared across commits with --compare.
+--scaling-workers 1 2 4 also times partitioned_daily_counts alone per worker
+count on the largest size and reports the speed-up over one worker.
+"""
+
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.abspath(os.path.join(HERE, ".."))
+sys.path.insert(0, os.path.join(REPO_ROOT, "mapping"))
+
+from utils.profiler import Profiler  # noqa: E402
+from utils.synthetic_claims import generate_claims, diag_colnames  # noqa: E402
+from time_series_evaluator.create_time_series import (  # noqa: E402
+    clean_data,
+    claim_flags,
+    flag_dataframe,
+    create_timeseries_function,
+    partitioned_daily_counts,
+)
+from break_detection.break_detector import BreakDetector  # noqa: E402
+
+STAGES = ["generate", "ingest", "clean", "flag", "series", "detect"]
+
+
+def git_commit() -> str:
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True
+            ).strip()
+            or "unknown"
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_once(n_claims: int, args, prof: Profiler) -> None:
+    """One pass over all stages; timings land in `prof`."""
+    cols = diag_colnames(args.diag_cols)
+    with prof.span("generate", rows=n_claims):
+        claims_df, truth = generate_claims(
+            n_claims=n_claims,
+            n_diag_cols=args.diag_cols,
+            vocab_size=args.vocab,
+            start_date=args.start,
+            end_date=args.end,
+            artifact_share=args.artifact_share,
+            seed=args.seed,
+        )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "claims.csv")
+        claims_df.to_csv(path, index=False)
+        del claims_df
+        with prof.span("ingest", rows=n_claims):
+            claims_df = pd.read_csv(path, usecols=["date"] + cols, dtype=str)
+
+    codes = sorted(truth["icd9_codes"]) + sorted(truth["naive_icd10_codes"])
+    with redirect_stdout(io.StringIO()):
+        with prof.span("clean", rows=n_claims):
+            claims_df = clean_data(claims_df, cols)
+        with prof.span("flag", rows=n_claims):
+            flagged = flag_dataframe(claims_df, codes, cols, "flag_bench")
+        with prof.span("series", rows=n_claims):
+            ts = create_timeseries_function(
+                flagged, "date", "flag_bench", cap_year=None, workers=args.ts_workers
+            )
+        with prof.span("detect", rows=len(ts)):
+            BreakDetector().detect_breaks(
+                ts, date_col="date", value_col="flag_count364", plot_results=False
+            )
+
+
+def measure_scaling(n_claims: int, args) -> list[dict]:
+    """Median partitioned_daily_counts wall time per worker count (same flags, int32 days)."""
+    claims_df, truth = generate_claims(
+        n_claims=n_claims, n_diag_cols=args.diag_cols, vocab_size=args.vocab, seed=args.seed
+    )
+    cols = diag_colnames(args.diag_cols)
+    codes = sorted(truth["icd9_codes"]) + sorted(truth["naive_icd10_codes"])
+    flags = claim_flags(claims_df, codes, cols)
+    days = claims_df["date"].to_numpy().astype("datetime64[D]").astype(np.int32)
+    rows = []
+    for workers in args.scaling_workers:
+        wall = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            partitioned_daily_counts(days, flags, workers=workers)
+            wall.append(time.perf_counter() - t0)
+        rows.append({"n_claims": n_claims, "workers": workers, "wall_s_median": float(np.median(wall))})
+    base = rows[0]["wall_s_median"]
+    for row in rows:
+        row["speedup"] = base / row["wall_s_median"] if row["wall_s_median"] > 0 else None
+        print(
+            f"{n_claims:>12,} daily counts, {row['workers']:>2} workers "
+            f"{row['wall_s_median']:9.4f}s  x{row['speedup']:.2f}"
+        )
+    return rows
+
+
+def run_benchmarks(args) -> dict:
+    results = []
+    for n_claims in args.sizes:
+        runs = {stage: [] for stage in STAGES}
+        for _ in range(args.repeat):
+            prof = Profiler(enabled=True, track_memory=args.memory)
+            run_once(n_claims, args, prof)
+            for rec in prof.records():
+                if rec["stage"] in runs:
+                    runs[rec["stage"]].append(rec)
+        for stage in STAGES:
+            recs = runs[stage]
+            wall = [r["wall_s"] for r in recs]
+            peak = [r["peak_mem_mb"] for r in recs if r["peak_mem_mb"] is not None]
+            row = {
+                "n_claims": n_claims,
+                "stage": stage,
+                "wall_s_median": float(np.median(wall)),
+                "wall_s_min": float(np.min(wall)),
+                "cpu_s_median": float(np.median([r["cpu_s"] for r in recs])),
+                "rows": recs[0]["rows"],
+                "peak_mem_mb": max(peak) if peak else None,
+            }
+            row["rows_per_s"] = (
+                row["rows"] / row["wall_s_median"] if row["wall_s_median"] > 0 else None
+            )
+            results.append(row)
+            print(
+                f"{n_claims:>12,} {stage:<9} {row['wall_s_median']:9.4f}s "
+                f"(min {row['wall_s_min']:.4f}s)"
+            )
+    return {
+        "commit": git_commit(),
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+        },
+        "params": {k: v for k, v in vars(args).items() if k not in ("compare", "out")},
+        "results": results,
+        "ts_scaling": (
+            measure_scaling(max(args.sizes), args) if args.scaling_workers else None
+        ),
+    }
+
+
+def compare(current: dict, baseline_path: str) -> None:
+    """Print median wall-time ratios (current / baseline) per size and stage."""
+    with open(baseline_path) as fh:
+        baseline = json.load(fh)
+    base = {(r["n_claims"], r["stage"]): r for r in baseline["results"]}
+    print(f"\n📊 {current['commit']} vs {baseline['commit']} (ratio < 1 is faster)")
+    for r in current["results"]:
+        b = base.get((r["n_claims"], r["stage"]))
+        if b is None or not b["wall_s_median"]:
+            continue
+        ratio = r["wall_s_median"] / b["wall_s_median"]
+        print(f"{r['n_claims']:>12,} {r['stage']:<9} x{ratio:6.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--diag-cols", type=int, default=11)
+    parser.add_argument("--vocab", type=int, default=2000)
+    parser.add_argument("--start", default="2014-01-01")
+    parser.add_argument("--end", default="2020-12-31")
+    parser.add_argument("--artifact-share", type=float, default=0.3)
+    parser.add_argument("--ts-workers", type=int, default=1, help="create_timeseries_function workers")
+    parser.add_argument("--scaling-workers", type=int, nargs="*", default=[],
+                        help="time partitioned_daily_counts for these worker counts")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--memory", action="store_true", help="track peak memory (slower)")
+    parser.add_argument("--out", default=os.path.join(HERE, "results"))
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args)
+    os.makedirs(args.out, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    out_path = os.path.join(args.out, f"pipeline_{stamp}_{report['commit']}.json")
+    with open(out_path, "w") as fh:
+        json.dump(report, fh, indent=2)
+    print(f"\nSaved {out_path}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
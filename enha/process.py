@@ -16,11 +16,14 @@ warnings.filterwarnings("ignore")  # quiet noisy warnings
 # ----- Repo root & cwd -----
 HERE = os.path.dirname(os.path.abspath(__file__))     # …/enha
 REPO_ROOT = os.path.abspath(os.path.join(HERE, "..")) # …/enha-mapping
-if REPO_ROOT not in sys.path:
-    sys.path.insert(0, REPO_ROOT)
+MAPPING_DIR = os.path.join(REPO_ROOT, "mapping")      # …/enha-mapping/mapping
+for p in (MAPPING_DIR, REPO_ROOT):
+    if p not in sys.path:
+        sys.path.insert(0, p)
 os.chdir(REPO_ROOT)
 
 from main import run_pipeline  # returns the single BEST result (dict) per your code
+from utils.profiler import profiler  # ENHA_PROFILE=1 -> stage timings in payload
 
 # ---------- helpers ----------
 def df_to_table(df: pd.DataFrame, limit: int = 200):
@@ -99,8 +102,9 @@ def main():
 
     try:
         # Keep stdout clean; pipeline prints -> stderr
+        profiler.start_run()
         with redirect_stdout(sys.stderr):
-            best_result = run_pipeline(prompt)  # <-- returns the BEST single result
+            best_result = run_pipeline(prompt)  # <-- returns the BEST single result (prints the timing report)
 
         if not best_result:
             json_out({"ok": False, "error": "No result produced"})
@@ -126,6 +130,7 @@ def main():
             "rolling_col": to_primitive(y),
             "break_analysis": to_primitive((best_result or {}).get("break_analysis")),
             "plot_png": plot_png,
+            "timings": profiler.records() if profiler.enabled else None,
         }
 
         json_out({"ok": True, "data": payload})
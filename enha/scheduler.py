@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Per-node scheduler for pipeline runs (python3 enha/scheduler.py).
+
+/api/process forwards prompts here when ENHA_SCHEDULER_URL is set, instead of
+spawning a Python process per request:
+  - at most ENHA_MAX_CONCURRENT runs (default 2) execute at once, each one a
+    process.py subprocess, so memory is returned after every run;
+  - excess work waits in per-user queues served round-robin, so one user's
+    burst cannot starve the others;
+  - an identical prompt already queued or running is attached to that
+    computation instead of starting a new one;
+  - past ENHA_MAX_QUEUE_PER_USER queued runs for a user (429) or ENHA_MAX_QUEUED
+    in total (503), or after ENHA_QUEUE_TIMEOUT seconds in the queue, requests
+    are rejected with an error and a Retry-After estimate.
+
+Endpoints: POST /process {"prompt", "user"} -> process.py's JSON; GET /status.
+"""
+import json, os, subprocess, sys, threading, time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))     # …/enha
+REPO_ROOT = os.path.abspath(os.path.join(HERE, "..")) # …/enha-mapping
+PROCESS_PY = os.path.join(HERE, "process.py")
+RUN_TIMEOUT = 120  # seconds, same as the route's execFile timeout
+
+
+class SchedulerBusy(Exception):
+    """Request rejected to protect the node; status is the HTTP code to return."""
+
+    def __init__(self, message: str, status: int = 503, retry_after: int = 5):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def prompt_key(prompt: str) -> str:
+    """Prompts that differ only in case/whitespace share one computation."""
+    return " ".join(prompt.lower().split())
+
+
+def run_process_py(prompt: str) -> dict:
+    """One pipeline run in its own process (same contract as the route's execFile)."""
+    try:
+        proc = subprocess.run(
+            [sys.executable, PROCESS_PY, prompt],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            timeout=RUN_TIMEOUT,
+        )
+    except subprocess.TimeoutExpired:
+        return {"ok": False, "error": f"Pipeline timed out after {RUN_TIMEOUT}s."}
+    try:
+        return json.loads(proc.stdout)
+    except json.JSONDecodeError:
+        return {"ok": False, "error": proc.stderr[-2000:] or "Python execution failed"}
+
+
+class _Job:
+    def __init__(self, key: str, user: str, prompt: str):
+        self.key = key
+        self.user = user
+        self.prompt = prompt
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class PipelineScheduler:
+    """Bounded worker pool with per-user round-robin queues and in-flight dedup."""
+
+    def __init__(
+        self,
+        run_job=run_process_py,
+        max_concurrent: int = 2,
+        max_queue_per_user: int = 3,
+        max_queued: int = 16,
+        queue_timeout: float = 90.0,
+    ):
+        self.run_job = run_job
+        self.max_concurrent = max_concurrent
+        self.max_queue_per_user = max_queue_per_user
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._queues = OrderedDict()  # user -> deque of jobs, in round-robin order
+        self._inflight = {}           # prompt key -> queued or running job
+        self._queued = 0
+        self._running = 0
+        self._avg_run = 30.0          # seconds, for Retry-After estimates
+        self.counts = {"submitted": 0, "deduped": 0, "shed": 0, "completed": 0, "failed": 0}
+        for i in range(max_concurrent):
+            threading.Thread(target=self._worker, name=f"pipeline-{i}", daemon=True).start()
+
+    def submit(self, prompt: str, user: str = "anonymous") -> Future:
+        """Queue a run (or join an identical one in flight); raises SchedulerBusy when full."""
+        key = prompt_key(prompt)
+        with self._cond:
+            self.counts["submitted"] += 1
+            job = self._inflight.get(key)
+            if job is not None:
+                self.counts["deduped"] += 1
+                return job.future
+            user_queue = self._queues.get(user, ())
+            if len(user_queue) >= self.max_queue_per_user:
+                self.counts["shed"] += 1
+                raise SchedulerBusy(
+                    f"You already have {len(user_queue)} requests waiting; try again when one finishes.",
+                    status=429,
+                    retry_after=self._retry_after(len(user_queue)),
+                )
+            if self._queued >= self.max_queued:
+                self.counts["shed"] += 1
+                raise SchedulerBusy(
+                    "The server is at capacity; please retry shortly.",
+                    retry_after=self._retry_after(self._queued),
+                )
+            job = _Job(key, user, prompt)
+            self._queues.setdefault(user, deque()).append(job)
+            self._inflight[key] = job
+            self._queued += 1
+            self._cond.notify()
+        return job.future
+
+    def _retry_after(self, ahead: int) -> int:
+        return max(1, int(self._avg_run * (ahead + 1) / self.max_concurrent))
+
+    def _next_job(self) -> _Job:
+        """Front job of the next user in round-robin order (caller holds the lock)."""
+        user, user_queue = next(iter(self._queues.items()))
+        job = user_queue.popleft()
+        del self._queues[user]
+        if user_queue:
+            self._queues[user] = user_queue  # back of the line
+        self._queued -= 1
+        return job
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._queued:
+                    self._cond.wait()
+                job = self._next_job()
+                waited = time.monotonic() - job.enqueued_at
+                if waited > self.queue_timeout:
+                    del self._inflight[job.key]
+                    self.counts["shed"] += 1
+                    job.future.set_exception(
+                        SchedulerBusy(f"Request waited {waited:.0f}s in the queue; please retry.")
+                    )
+                    continue
+                self._running += 1
+            job.future.set_running_or_notify_cancel()
+            t0 = time.monotonic()
+            try:
+                result = self.run_job(job.prompt)
+            except Exception as e:
+                outcome, error = "failed", e
+            else:
+                outcome, error = "completed", None
+            with self._cond:
+                self._running -= 1
+                self._avg_run = 0.8 * self._avg_run + 0.2 * (time.monotonic() - t0)
+                del self._inflight[job.key]
+                self.counts[outcome] += 1
+            if error is None:
+                job.future.set_result(result)
+            else:
+                job.future.set_exception(error)
+
+    def status(self) -> dict:
+        with self._cond:
+            return {
+                "running": self._running,
+                "queued": self._queued,
+                "queued_by_user": {u: len(q) for u, q in self._queues.items()},
+                "max_concurrent": self.max_concurrent,
+                "avg_run_seconds": round(self._avg_run, 1),
+                **self.counts,
+            }
+
+
+# ---------- HTTP ----------
+def make_handler(scheduler: PipelineScheduler):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, payload: dict, retry_after: int = None):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if retry_after is not None:
+                self.send_header("Retry-After", str(retry_after))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/status":
+                self._send(200, {"ok": True, "data": scheduler.status()})
+            else:
+                self._send(404, {"ok": False, "error": "Not found"})
+
+        def do_POST(self):
+            if self.path != "/process":
+                self._send(404, {"ok": False, "error": "Not found"})
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                prompt, user = body.get("prompt"), str(body.get("user") or "anonymous")
+            except (ValueError, AttributeError):
+                prompt = None
+            if not isinstance(prompt, str) or not prompt.strip():
+                self._send(400, {"ok": False, "error": "Invalid prompt"})
+                return
+            try:
+                future = scheduler.submit(prompt, user)
+                result = future.result(timeout=scheduler.queue_timeout + RUN_TIMEOUT)
+            except SchedulerBusy as e:
+                self._send(e.status, {"ok": False, "error": str(e)}, retry_after=e.retry_after)
+            except Exception as e:
+                self._send(500, {"ok": False, "error": str(e) or type(e).__name__})
+            else:
+                self._send(200, result)
+
+        def log_message(self, fmt, *args):
+            sys.stderr.write(f"[scheduler] {fmt % args}\n")
+
+    return Handler
+
+
+def main():
+    scheduler = PipelineScheduler(
+        max_concurrent=int(os.environ.get("ENHA_MAX_CONCURRENT", 2)),
+        max_queue_per_user=int(os.environ.get("ENHA_MAX_QUEUE_PER_USER", 3)),
+        max_queued=int(os.environ.get("ENHA_MAX_QUEUED", 16)),
+        queue_timeout=float(os.environ.get("ENHA_QUEUE_TIMEOUT", 90)),
+    )
+    port = int(os.environ.get("ENHA_SCHEDULER_PORT", 8765))
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(scheduler))
+    print(f"Pipeline scheduler on http://127.0.0.1:{port} "
+          f"({scheduler.max_concurrent} concurrent runs)", file=sys.stderr)
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
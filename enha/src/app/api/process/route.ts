@@ -7,12 +7,35 @@ import path from "node:path";
 export const runtime = "nodejs";
 const execFileP = promisify(execFile);
 
+// When set (e.g. http://127.0.0.1:8765), runs go through enha/scheduler.py, which
+// caps concurrent pipelines, queues per user and dedups identical prompts.
+const SCHEDULER_URL = process.env.ENHA_SCHEDULER_URL;
+
+async function viaScheduler(req: NextRequest, prompt: string) {
+  const user =
+    req.headers.get("x-user-id") ||
+    req.headers.get("x-forwarded-for")?.split(",")[0].trim() ||
+    "anonymous";
+  const res = await fetch(`${SCHEDULER_URL}/process`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ prompt, user }),
+  });
+  const headers: Record<string, string> = {};
+  const retryAfter = res.headers.get("retry-after");
+  if (retryAfter) headers["Retry-After"] = retryAfter;
+  return NextResponse.json(await res.json(), { status: res.status, headers });
+}
+
 export async function POST(req: NextRequest) {
   try {
     const { prompt } = await req.json();
     if (typeof prompt !== "string" || !prompt.trim()) {
       return NextResponse.json({ ok: false, error: "Invalid prompt" }, { status: 400 });
     }
+    if (SCHEDULER_URL) {
+      return await viaScheduler(req, prompt);
+    }
 
     const scriptPath = path.join(process.cwd(), "process.py");      // enha/process.py
     const repoRoot   = path.resolve(process.cwd(), "..");            // enha-mapping/
@@ -25,6 +25,18 @@ export type BestResult = {
   rolling_col?: string;
   break_analysis?: any; // summarized object from process.py
   plot_png?: string | null; // base64 (no prefix)
+  timings?: StageTiming[] | null; // profiler records (ENHA_PROFILE=1)
+};
+
+export type StageTiming = {
+  run_id?: string | null;
+  iteration?: number | null;
+  stage: string;
+  wall_s: number;
+  cpu_s: number;
+  rows?: number | null;
+  peak_mem_mb?: number | null;
+  ok?: boolean;
 };
 
 export default function ResultsView({ data }: { data: BestResult }) {
@@ -1,78 +1,22 @@
 # python main.py
 
-import pandas as pd
 import matplotlib.pyplot as plt
-import numpy as np
 
 # Import functions from our phases
 from interpreter.concept_nlp import get_concept
 from icd_generator.icd_naive_generator import generate_relevant_codes
 from mapping_refinement.hypothesis_generator import generate_hypotheses
 from time_series_evaluator.create_time_series import (
-    create_timeseries_function,
-    flag_dataframe,
-    clean_data,
+    compact_claims,
+    flagged_daily_counts,
     get_input,
+    timeseries_from_daily_counts,
 )
-from time_series_evaluator.smoothness_evaluator import calculate_smoothness_score
+from time_series_evaluator.itsa_evaluator import itsa_score
+from hypothesis_refinement.refinement_loop import select_best
 from ts_results.plot_timeseries import plot_ts
-
-
-def create_mock_data():
-    """Creates a mock dataset with multiple diagnosis columns."""
-    N_CLAIMS = 25000
-    START_DATE = "2014-01-01"
-    END_DATE = "2020-12-31"
-    TRANSITION_DATE = "2015-10-01"
-
-    pre_transition_codes = {"425.4": 0.4, "440.9": 0.4, "A01": 0.2}
-    post_transition_codes = {"I42.9": 0.45, "I70.9": 0.35, "B02": 0.2}
-
-    dates = pd.to_datetime(pd.date_range(start=START_DATE, end=END_DATE, freq="D"))
-    transition_date_dt = pd.to_datetime(TRANSITION_DATE)
-
-    pre_dates = dates[dates < transition_date_dt]
-    post_dates = dates[dates >= transition_date_dt]
-
-    n_pre = int(N_CLAIMS * (len(pre_dates) / len(dates)))
-    n_post = N_CLAIMS - n_pre
-
-    pre_claims_dates = np.random.choice(pre_dates, size=n_pre, replace=True)
-    pre_claims_codes = np.random.choice(
-        list(pre_transition_codes.keys()),
-        size=n_pre,
-        replace=True,
-        p=list(pre_transition_codes.values()),
-    )
-    post_claims_dates = np.random.choice(post_dates, size=n_post, replace=True)
-    post_claims_codes = np.random.choice(
-        list(post_transition_codes.keys()),
-        size=n_post,
-        replace=True,
-        p=list(post_transition_codes.values()),
-    )
-
-    # Create a single column first
-    single_diag_df = pd.DataFrame(
-        {
-            "date": np.concatenate([pre_claims_dates, post_claims_dates]),
-            "diag_1": np.concatenate([pre_claims_codes, post_claims_codes]),
-        }
-    )
-
-    # Distribute into three diagnosis columns, adding some NaNs
-    claims_df = single_diag_df.copy()
-    claims_df["diag_2"] = claims_df["diag_1"].where(
-        np.random.rand(len(claims_df)) < 0.3, np.nan
-    )
-    claims_df["diag_3"] = claims_df["diag_1"].where(
-        np.random.rand(len(claims_df)) < 0.1, np.nan
-    )
-    claims_df["diag_1"] = claims_df["diag_1"].where(
-        np.random.rand(len(claims_df)) < 0.8, np.nan
-    )
-
-    return claims_df.sample(frac=1).reset_index(drop=True)
+from utils.profiler import profiler
+from utils.synthetic_claims import REALISTIC_FILL_RATES, generate_claims
 
 
 def run_pipeline():
@@ -88,8 +32,15 @@ def run_pipeline():
 
     # --- Load and Prepare Data ---
     print("Loading and preparing mock claims data...")
-    claims_df = create_mock_data()
-    claims_df = clean_data(claims_df, config["target_colnames"])
+    mock_claims, _ = generate_claims(
+        n_claims=25_000,
+        n_diag_cols=len(config["target_colnames"]),
+        fill_rates=REALISTIC_FILL_RATES,
+        seasonal_amplitude=0.1,
+    )
+    claims_df = compact_claims(
+        mock_claims, config["date_colname"], config["target_colnames"]
+    )
     print(f"Loaded {len(claims_df)} mock claims.")
 
     # --- Phase 1: Interpret Concept ---
@@ -112,47 +63,53 @@ def run_pipeline():
     # --- Phase 4: Evaluate Hypotheses ---
     print("\n--- Phase 4: Evaluating Hypotheses ---")
     results = []
-    for h in hypotheses:
+    for i, h in enumerate(hypotheses):
+        profiler.set_iteration(i)
         print(f"Testing hypothesis: '{h['name']}'...")
 
         # Corrected Logic: Flag, then create time series, then score
         target_flag_col = f"flag_{h['name'].replace(' ', '_')}"
         all_codes = list(h["icd9_codes"]) + list(h["icd10_codes"])
 
-    flagged_df = flag_dataframe(
-        claims_df.copy(), all_codes, config["target_colnames"], target_flag_col
-    )
-
-    ts = create_timeseries_function(
-        flagged_df,
-        config["date_colname"],
-        target_flag_col,
-        cap_year=config["cap_year"],
-    )
-
-    # Find the rolling sum column name
-    rolling_col_name = [
-        col
-        for col in ts.columns
-        if col.startswith(f"{target_flag_col.split('_')[0]}_count")
-    ][0]
-
-    score = calculate_smoothness_score(ts, config["date_colname"], rolling_col_name)
-
-    results.append(
-        {
-            "hypothesis": h,
-            "score": score,
-            "timeseries": ts,
-            "rolling_col": rolling_col_name,
-        }
-    )
-    print(f"  Smoothness Score (1.0 - p_value): {score:.4f}")
+        # daily counts straight from the compact claims (no per-hypothesis copy)
+        start_date, flag_daily, all_daily = flagged_daily_counts(
+            claims_df, all_codes, config["target_colnames"], config["date_colname"]
+        )
+
+        ts = timeseries_from_daily_counts(
+            flag_daily,
+            all_daily,
+            start_date,
+            config["date_colname"],
+            target_flag_col,
+            cap_year=config["cap_year"],
+        )
+
+        # Find the rolling sum column name
+        rolling_col_name = [
+            col
+            for col in ts.columns
+            if col.startswith(f"{target_flag_col.split('_')[0]}_count")
+        ][0]
+
+        score = itsa_score(ts, config["date_colname"], rolling_col_name)
+
+        results.append(
+            {
+                "hypothesis": h,
+                "score": score,
+                "timeseries": ts,
+                "rolling_col": rolling_col_name,
+            }
+        )
+        print(f"  Smoothness Score (1.0 - p_value): {score:.4f}")
+
+    profiler.set_iteration(None)
 
     # --- Phase 5: Select and Output Best Result ---
     print("\n--- Phase 5: Selecting Best Result ---")
-    # A lower score is better (p-value closer to 1.0)
-    best_result = min(results, key=lambda x: x["score"])
+    # No artificial break first, then the lower score (p-value closer to 1.0)
+    best_result = select_best(results)
     best_hypothesis = best_result["hypothesis"]
     print(
         f"\nBest hypothesis found: '{best_hypothesis['name']}' with a final score of {best_result['score']:.4f}"
@@ -172,6 +129,8 @@ def run_pipeline():
         ts_to_plot, date_col=config["date_colname"], target_rolling_col=rolling_col_name
     )
 
+    profiler.print_report()
+
 
 if __name__ == "__main__":
     run_pipeline()
@@ -0,0 +1,190 @@
+"""
+Vectorized segmented least squares for many series on one shared date axis.
+
+All series share x (epoch days, see utils.epoch_days), so every per-segment OLS fit reduces to
+centered sums over that segment for the whole (n_series, n_days) matrix at once:
+    slope = Σ (x - x̄)(y - ȳ) / Σ (x - x̄)²,  intercept = ȳ - slope · x̄
+    SSR   = Σ (y - ȳ)² - slope² · Σ (x - x̄)²
+which is what BreakDetector._fit_segment computes with sklearn, one series at a time.
+
+With seasonal regressors (Fourier terms) the fits use one QR factorization of the
+shared design matrix for all series instead (segmented_chow_seasonal).
+"""
+
+import numpy as np
+from scipy.stats import f
+
+from utils.epoch_days import epoch_day, to_epoch_days
+
+ICD_CUT_DATES = ("2015-10-01", "2016-10-01")
+SEASONAL_PERIODS = {"weekly": 7.0, "annual": 365.25}
+
+
+def day_axis(dates) -> np.ndarray:
+    """Regression x: epoch days (dates or epoch-day ints in) as float64."""
+    return to_epoch_days(dates).astype(np.float64)
+
+
+def cut_indices(dates, cut_dates=ICD_CUT_DATES) -> list[int]:
+    """Interior insertion indices of cut_dates on a sorted axis of dates or epoch days."""
+    days = to_epoch_days(dates)
+    idx = []
+    for cut in cut_dates:
+        cut = epoch_day(cut)
+        if len(days) and days[0] <= cut <= days[-1]:
+            i = int(np.searchsorted(days, cut))
+            if 0 < i < len(days):
+                idx.append(i)
+    return sorted(set(idx))
+
+
+def fit_lines(x: np.ndarray, Y: np.ndarray, start: int, end: int) -> dict:
+    """OLS line per row of Y over columns [start, end). Returns arrays of shape (n_series,)."""
+    xs = x[start:end]
+    Ys = Y[:, start:end]
+    x_mean = xs.mean()
+    xc = xs - x_mean
+    sxx = float(xc @ xc)
+    y_mean = Ys.mean(axis=1)
+    Yc = Ys - y_mean[:, None]
+    slope = (Yc @ xc) / sxx if sxx > 0 else np.zeros(len(Y))
+    syy = np.einsum("ij,ij->i", Yc, Yc)
+    ssr = np.maximum(syy - slope**2 * sxx, 0.0)
+    return {
+        "start_idx": start,
+        "end_idx": end,
+        "slope": slope,
+        "intercept": y_mean - slope * x_mean,
+        "ssr": ssr,
+        "syy": syy,
+        "mean": y_mean,
+        "length": end - start,
+    }
+
+
+def chow_f(ssr_restricted, ssr_unrestricted, n: int, k: int, s: int):
+    """Generalized Chow F and p for s segments (arrays in, arrays out; NaN when undefined)."""
+    if s <= 1 or n <= s * k:
+        nan = np.full(np.shape(ssr_restricted), np.nan)
+        return nan, nan
+    return f_test(ssr_restricted, ssr_unrestricted, (s - 1) * k, n - s * k)
+
+
+def f_test(ssr_restricted, ssr_unrestricted, num_df: int, den_df: int):
+    """Nested-model F test on SSRs (arrays in, arrays out)."""
+    ssr_r = np.asarray(ssr_restricted, dtype=float)
+    ssr_u = np.asarray(ssr_unrestricted, dtype=float)
+    if num_df <= 0 or den_df <= 0:
+        nan = np.full(ssr_r.shape, np.nan)
+        return nan, nan
+    with np.errstate(divide="ignore", invalid="ignore"):
+        F = ((ssr_r - ssr_u) / num_df) / (ssr_u / den_df)
+    F = np.where(ssr_u <= 0, np.inf, F)
+    p = np.where(np.isinf(F), 0.0, f.sf(F, num_df, den_df))
+    return F, p
+
+
+def segmented_chow(dates, Y: np.ndarray, breaks: list[int], k: int = 2) -> dict:
+    """
+    Global line vs one line per segment for every row of Y.
+    breaks: interior cut indices on the date axis (e.g. cut_indices(dates)).
+    Returns per-series arrays: global fit, segment fits, SSRs and Chow F/p.
+    """
+    x = day_axis(dates)
+    Y = np.atleast_2d(np.asarray(Y, dtype=float))
+    n = Y.shape[1]
+    global_fit = fit_lines(x, Y, 0, n)
+
+    bounds = [0] + sorted(breaks) + [n]
+    segments = [
+        fit_lines(x, Y, a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b - a >= 2
+    ]
+    segments_ssr = (
+        np.sum([seg["ssr"] for seg in segments], axis=0) if segments else np.zeros(len(Y))
+    )
+    F, p = chow_f(global_fit["ssr"], segments_ssr, n=n, k=k, s=max(1, len(segments)))
+    return {
+        "x": x,
+        "global_fit": global_fit,
+        "segments": segments,
+        "global_ssr": global_fit["ssr"],
+        "segments_ssr": segments_ssr,
+        "global_chow_F": F,
+        "global_chow_p": p,
+    }
+
+
+# ---------- Seasonal regressors ----------
+
+
+def fourier_terms(dates, period: float, order: int) -> np.ndarray:
+    """sin/cos pairs of the first `order` harmonics of `period` days, shape (n, 2 * order)."""
+    t = day_axis(dates)
+    cols = []
+    for k in range(1, order + 1):
+        angle = 2 * np.pi * k * t / period
+        cols += [np.sin(angle), np.cos(angle)]
+    return np.column_stack(cols) if cols else np.zeros((len(t), 0))
+
+
+def seasonal_terms(dates, seasonality, order: int = 2) -> np.ndarray:
+    """Fourier regressors for seasonality in (None, "weekly", "annual", "both")."""
+    if not seasonality:
+        return np.zeros((len(dates), 0))
+    names = ["weekly", "annual"] if seasonality == "both" else [seasonality]
+    unknown = [s for s in names if s not in SEASONAL_PERIODS]
+    if unknown:
+        raise ValueError(f"Unknown seasonality {unknown}; use weekly, annual or both.")
+    # weekly harmonics above 3 alias onto lower ones on daily data
+    return np.column_stack(
+        [
+            fourier_terms(dates, SEASONAL_PERIODS[s], min(order, 3) if s == "weekly" else order)
+            for s in names
+        ]
+    )
+
+
+def shared_design_ls(X: np.ndarray, Y: np.ndarray):
+    """Least squares of every row of Y on the same design X. Returns (beta, ssr)."""
+    Q, R = np.linalg.qr(X)
+    QtY = Y @ Q
+    beta = np.linalg.solve(R, QtY.T).T
+    ssr = np.einsum("ij,ij->i", Y, Y) - np.einsum("ij,ij->i", QtY, QtY)
+    return beta, np.maximum(ssr, 0.0)
+
+
+def segmented_chow_seasonal(dates, Y: np.ndarray, breaks: list[int], S: np.ndarray) -> dict:
+    """
+    Chow test of level/trend changes at `breaks` controlling for seasonal terms S.
+
+    Restricted:   y = a + b·x + S·g
+    Unrestricted: y = a_j + b_j·x (per segment j) + S·g   (g shared across segments)
+    F has 2(s-1) numerator and n - 2s - m denominator degrees of freedom.
+    """
+    Y = np.atleast_2d(np.asarray(Y, dtype=float))
+    n = Y.shape[1]
+    x = day_axis(dates)
+    xc = x - x.mean() if n else x
+    m = S.shape[1]
+
+    bounds = [0] + sorted(breaks) + [n]
+    seg_cols = []
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        if b - a < 2:
+            continue
+        d = np.zeros(n)
+        d[a:b] = 1.0
+        seg_cols += [d, d * xc]
+    s = len(seg_cols) // 2
+
+    _, ssr_r = shared_design_ls(np.column_stack([np.ones(n), xc, S]), Y)
+    beta_u, ssr_u = shared_design_ls(np.column_stack(seg_cols + [S]), Y)
+    F, p = f_test(ssr_r, ssr_u, 2 * (s - 1), n - 2 * s - m)
+    return {
+        "global_ssr": ssr_r,
+        "segments_ssr": ssr_u,
+        "global_chow_F": F,
+        "global_chow_p": p,
+        "segment_slopes": [beta_u[:, 2 * j + 1] for j in range(s)],
+        "seasonal_coef": beta_u[:, 2 * s :],
+    }
@@ -6,6 +6,31 @@ from sklearn.metrics import r2_score
 import matplotlib.pyplot as plt
 from scipy.stats import f  # for Chow tests
 
+from utils.epoch_days import (
+    DAYS_PER_YEAR,
+    day_timestamp,
+    epoch_day,
+    epoch_day_axis,
+    from_epoch_days,
+    to_epoch_days,
+)
+from utils.profiler import profiler
+from break_detection.batch_kernel import (
+    ICD_CUT_DATES,
+    chow_f,
+    cut_indices,
+    fit_lines,
+    seasonal_terms,
+    segmented_chow,
+    segmented_chow_seasonal,
+)
+from break_detection.count_models import (
+    coefficient_table,
+    fit_count_model,
+    segmented_count_design,
+    wald_test,
+)
+
 
 class BreakDetector:
     """Detect structural breaks in time series for hypothesis evaluation.
@@ -17,6 +42,29 @@ class BreakDetector:
     Focusing:
       - If focus_start is None, use the dataset's earliest date.
       - If focus_end is None, use the dataset's latest date.
+
+    Windows:
+      - With a multi-window frame (create_timeseries_function(windows=[...])), set
+        window=28/91/182/364 to pick the matching {flag}_count{window} column when
+        value_col is not given. None keeps the first "rolling"/"count" column.
+
+    Modeling:
+      - use_rate=True models flag / all_claims (e.g. flag_count364 / all_count364)
+        so volume changes in the claims feed do not look like mapping breaks.
+      - seasonality="weekly" | "annual" | "both" adds Fourier terms (fourier_order
+        harmonics) shared across segments; the Chow tests then measure level/trend
+        changes net of seasonality. Segment fits in the results stay plain lines.
+
+    Dates:
+      - Everything runs on the int32 epoch-day axis (utils.epoch_days): the frame's
+        epoch_day column when present, else the date column converted once.
+        Timestamps appear only in reported fields (segment/break dates) and plots.
+
+    Daily counts:
+      - count_model="poisson" | "quasipoisson" | "negbin" enables detect_breaks_daily,
+        a segmented log-linear model on un-rolled daily counts with a level and a
+        slope change at each ICD cut date (see break_detection/count_models.py).
+        use_rate / seasonality apply there as an all-claims offset / Fourier terms.
     """
 
     def __init__(
@@ -26,14 +74,40 @@ class BreakDetector:
         focus_end=None,
         force_icd_segments=True,
         max_breaks=2,
+        window=None,
+        use_rate=False,
+        seasonality=None,
+        fourier_order=2,
+        count_model=None,
     ):
         self.icd_transition = pd.Timestamp(icd_transition_date)
         self.focus_start = None if focus_start is None else pd.Timestamp(focus_start)
         self.focus_end = None if focus_end is None else pd.Timestamp(focus_end)
         self.force_icd_segments = force_icd_segments
         self.max_breaks = max_breaks
+        self.window = None if window is None else int(window)
+        self.use_rate = bool(use_rate)
+        self.seasonality = seasonality
+        self.fourier_order = int(fourier_order)
+        self.count_model = count_model
         self.last_fig = None
 
+    def config(self):
+        """Settings that change detection results (used in evaluation cache keys)."""
+        return {
+            "class": type(self).__name__,
+            "icd_transition": str(self.icd_transition.date()),
+            "focus_start": None if self.focus_start is None else str(self.focus_start.date()),
+            "focus_end": None if self.focus_end is None else str(self.focus_end.date()),
+            "force_icd_segments": bool(self.force_icd_segments),
+            "max_breaks": int(self.max_breaks),
+            "window": self.window,
+            "use_rate": self.use_rate,
+            "seasonality": self.seasonality,
+            "fourier_order": self.fourier_order,
+            "count_model": self.count_model,
+        }
+
     def detect_breaks(
         self,
         time_series_data,
@@ -43,10 +117,38 @@ class BreakDetector:
         plot_results=True,
     ):
         """Main entry: detect breaks (or force ICD segments) within the focus window."""
-        # Prepare data
-        ts_data = time_series_data.copy()
-        ts_data[date_col] = pd.to_datetime(ts_data[date_col])
-        ts_data = ts_data.sort_values(date_col).reset_index(drop=True)
+        with profiler.span("detect_breaks", rows=len(time_series_data)):
+            return self._detect_breaks(
+                time_series_data, date_col, value_col, hypothesis_name, plot_results
+            )
+
+    def _detect_breaks(
+        self,
+        time_series_data,
+        date_col,
+        value_col,
+        hypothesis_name,
+        plot_results,
+    ):
+        # Prepare data: one int32 epoch-day axis, sorted
+        days = epoch_day_axis(time_series_data, date_col)
+        ts_data = time_series_data
+        if len(days) and not (np.diff(days) >= 0).all():
+            order = np.argsort(days, kind="stable")
+            ts_data, days = ts_data.iloc[order], days[order]
+        ts_data = ts_data.reset_index(drop=True)
+
+        # Window selection on multi-window frames
+        if value_col is None and self.window is not None:
+            suffix = f"_count{self.window}"
+            windowed = [
+                col
+                for col in ts_data.columns
+                if col.endswith(suffix) and not col.startswith("all_")
+            ]
+            if not windowed:
+                raise ValueError(f"No column ending in '{suffix}' for window={self.window}.")
+            value_col = windowed[0]
 
         # Auto-detect value column if not provided
         if value_col is None:
@@ -63,6 +165,9 @@ class BreakDetector:
                     raise ValueError("No numeric column found to use as value_col.")
                 value_col = numeric_cols[0]
 
+        if self.use_rate:
+            ts_data, value_col = self._with_rate_column(ts_data, value_col)
+
         if len(ts_data) == 0:
             print("⚠️  No data available.")
             return {
@@ -83,15 +188,13 @@ class BreakDetector:
             }
 
         # Resolve focus window to dataset edges when None
-        data_min, data_max = ts_data[date_col].min(), ts_data[date_col].max()
-        effective_start = data_min if self.focus_start is None else self.focus_start
-        effective_end = data_max if self.focus_end is None else self.focus_end
+        start_day = int(days[0]) if self.focus_start is None else epoch_day(self.focus_start)
+        end_day = int(days[-1]) if self.focus_end is None else epoch_day(self.focus_end)
+        effective_start, effective_end = day_timestamp(start_day), day_timestamp(end_day)
 
         # Filter to focus range
-        mask = (ts_data[date_col] >= effective_start) & (
-            ts_data[date_col] <= effective_end
-        )
-        focused_data = ts_data[mask].copy()
+        mask = (days >= start_day) & (days <= end_day)
+        focused_data = ts_data[mask]
 
         if len(focused_data) == 0:
             print("⚠️  No data in focus range.")
@@ -112,92 +215,91 @@ class BreakDetector:
                 "local_chow": [],
             }
 
-        dates = focused_data[date_col].reset_index(drop=True)
-        values = focused_data[value_col].reset_index(drop=True)
+        days = days[mask]
+        values = focused_data[value_col].to_numpy(dtype=float)
 
         print(
             f"🔍 Analyzing {len(focused_data)} points in focus: {effective_start.date()} → {effective_end.date()}"
         )
 
-        # --- Global (single-line) regression across the focused window ---
-        global_fit = self._fit_global(dates, values)
-        # Predicted values for global line (used for SSR / plotting)
-        date_numeric_all = np.array([d.toordinal() for d in dates]).reshape(-1, 1)
-        global_pred = global_fit["model"].predict(date_numeric_all)
-        global_ssr = self._ssr(values, global_pred)
-
-        # Decide segmentation mode
-        if self.force_icd_segments:
-            # Preserve the ICD "middle section" cuts if they fall within the focus window
-            forced_cut_dates = [pd.Timestamp("2015-10-01"), pd.Timestamp("2016-10-01")]
-            forced_cut_indices = []
-            for cut_date in forced_cut_dates:
-                if dates.min() <= cut_date <= dates.max():
-                    idx = int(dates.searchsorted(cut_date))
-                    # searchsorted returns insertion index; keep only interior cuts
-                    if 0 < idx < len(dates):
-                        forced_cut_indices.append(idx)
-            break_indices = sorted(set(forced_cut_indices))
-        else:
-            # Automatic detection path
-            break_indices = self._find_break_points(values)
-            if len(break_indices) > self.max_breaks:
-                print(
-                    f"⚠️  Limiting from {len(break_indices)} detected breaks to {self.max_breaks} most significant."
-                )
-                break_indices = self._prioritize_breaks(break_indices, dates)
-            # ensure valid interior indices
-            break_indices = [int(i) for i in break_indices if 0 < i < len(values)]
-
-        # Build segments from indices
-        segments = []
-        all_indices = [0] + break_indices + [len(values)]
-        for i in range(len(all_indices) - 1):
-            start_idx = all_indices[i]
-            end_idx = all_indices[i + 1]
-            if end_idx - start_idx >= 2:  # Need at least 2 points to fit
-                seg_stats = self._fit_segment(dates, values, start_idx, end_idx)
-                if seg_stats:
-                    segments.append(seg_stats)
-
-        # SSR for piecewise segments (sum of each segment's residuals)
-        segments_ssr = 0.0
-        for seg in segments:
-            seg_mask = (dates >= seg["start_date"]) & (dates <= seg["end_date"])
-            seg_dates = dates[seg_mask]
-            seg_values = values[seg_mask]
-            if len(seg_dates) == 0:
-                continue
-            seg_num = np.array([d.toordinal() for d in seg_dates]).reshape(-1, 1)
-            seg_pred = seg["model"].predict(seg_num)
-            segments_ssr += self._ssr(seg_values, seg_pred)
+        with profiler.span("fit", rows=len(values)):
+            # --- Global (single-line) regression across the focused window ---
+            x = days.astype(float).reshape(-1, 1)
+            global_fit = self._fit_global(days, values)
+            # Predicted values for global line (used for SSR / plotting)
+            global_pred = global_fit["model"].predict(x)
+            global_ssr = self._ssr(values, global_pred)
+
+            # Decide segmentation mode
+            if self.force_icd_segments:
+                # Preserve the ICD "middle section" cuts if they fall within the focus window
+                # (interior insertion indices only)
+                break_indices = cut_indices(days, ICD_CUT_DATES)
+            else:
+                # Automatic detection path
+                break_indices = self._find_break_points(values)
+                if len(break_indices) > self.max_breaks:
+                    print(
+                        f"⚠️  Limiting from {len(break_indices)} detected breaks to {self.max_breaks} most significant."
+                    )
+                    break_indices = self._prioritize_breaks(break_indices, days)
+                # ensure valid interior indices
+                break_indices = [int(i) for i in break_indices if 0 < i < len(values)]
+
+            # Build segments from indices
+            segments = []
+            all_indices = [0] + break_indices + [len(values)]
+            for i in range(len(all_indices) - 1):
+                start_idx = all_indices[i]
+                end_idx = all_indices[i + 1]
+                if end_idx - start_idx >= 2:  # Need at least 2 points to fit
+                    seg_stats = self._fit_segment(days, values, start_idx, end_idx)
+                    if seg_stats:
+                        segments.append(seg_stats)
+
+            # SSR for piecewise segments (sum of each segment's residuals)
+            segments_ssr = 0.0
+            for seg in segments:
+                a, b = seg["start_idx"], seg["end_idx"]
+                seg_pred = seg["model"].predict(x[a:b])
+                segments_ssr += self._ssr(values[a:b], seg_pred)
 
         # Score and package results
-        break_dates = [dates.iloc[i] for i in break_indices if 0 <= i < len(dates)]
-        break_score = self._calculate_break_score(segments, dates)
+        break_dates = [day_timestamp(days[i]) for i in break_indices if 0 <= i < len(days)]
+        break_score = self._calculate_break_score(segments, days)
 
         # --- Chow tests ---
-        # (A) Global multi-break Chow: one line vs s segment-specific lines
-        n = len(values)
-        k = 2  # intercept + slope for simple linear regression
-        s = max(1, len(segments))  # number of segments (>=1)
-        global_F, global_p = self._chow_test_multi(
-            n=n, k=k, s=s, ssr_restricted=global_ssr, ssr_unrestricted=segments_ssr
-        )
+        with profiler.span("chow", rows=len(values)):
+            # (A) Global multi-break Chow: one line vs s segment-specific lines
+            n = len(values)
+            k = 2  # intercept + slope for simple linear regression
+            s = max(1, len(segments))  # number of segments (>=1)
+            global_F, global_p = self._chow_test_multi(
+                n=n, k=k, s=s, ssr_restricted=global_ssr, ssr_unrestricted=segments_ssr
+            )
 
-        # (B) Local per-break Chow: for each break, fit two lines around that cut
-        local_chow = []
-        for b_idx in break_indices:
-            F_loc, p_loc = self._local_chow_for_break(dates, values, b_idx, k=2)
-            if F_loc is not None:
-                local_chow.append(
-                    {
-                        "break_index": int(b_idx),
-                        "break_date": dates.iloc[b_idx],
-                        "F": F_loc,
-                        "p": p_loc,
-                    }
+            # (B) Local per-break Chow: for each break, fit two lines around that cut
+            local_chow = []
+            for b_idx in break_indices:
+                F_loc, p_loc = self._local_chow_for_break(days, values, b_idx, k=2)
+                if F_loc is not None:
+                    local_chow.append(
+                        {
+                            "break_index": int(b_idx),
+                            "break_date": day_timestamp(days[b_idx]),
+                            "F": F_loc,
+                            "p": p_loc,
+                        }
+                    )
+
+        if self.seasonality and n > 0:
+            with profiler.span("seasonal_chow", rows=n):
+                global_F, global_p, local_chow = self._seasonal_chow(
+                    days, values[None, :], break_indices
                 )
+            global_F, global_p = _scalar(global_F), _scalar(global_p)
+            for lc in local_chow:
+                lc["F"], lc["p"] = _scalar(lc["F"]), _scalar(lc["p"])
 
         results = {
             "break_points": break_indices,
@@ -216,27 +318,330 @@ class BreakDetector:
             "global_chow_F": global_F,
             "global_chow_p": global_p,
             "local_chow": local_chow,
+            "seasonality": self.seasonality,
         }
 
         # Output and plot (unchanged) — BUT now we capture & remember the Figure
         if plot_results:
-            fig = self._plot_results(
-                dates,
-                values,
-                results,
-                hypothesis_name,
-                value_col,
-                effective_start,
-                effective_end,
-            )
+            with profiler.span("plot", rows=len(values)):
+                fig = self._plot_results(
+                    days,
+                    values,
+                    results,
+                    hypothesis_name,
+                    value_col,
+                    effective_start,
+                    effective_end,
+                )
             self.last_fig = fig
         else:
             self.last_fig = None
 
         return results
 
+    def detect_breaks_batch(self, dates, values, value_names=None, denominators=None):
+        """
+        Forced-ICD-segment analysis for many series sharing one date axis.
+
+        dates:  1-D date axis (n_days,); values: (n_series, n_days) matrix.
+        Returns the detect_breaks fields with per-series numpy arrays in place of
+        scalars (segment slopes/R²/means, SSRs, global and local Chow F/p), all
+        computed with broadcast operations; no sklearn models or plotting.
+        Use batch_series(result, i) to pull out one series.
+        denominators: all-claims counts (same shape, or one row broadcast to all
+        series); required with use_rate=True.
+        """
+        if not self.force_icd_segments:
+            raise ValueError("Batch detection needs force_icd_segments=True.")
+        days = to_epoch_days(dates)
+        if days.ndim != 1:
+            raise ValueError(f"dates must be 1-D, got shape {days.shape}.")
+        Y = np.atleast_2d(np.asarray(values, dtype=float))
+        if Y.ndim != 2 or Y.shape[1] != len(days):
+            raise ValueError(f"values has shape {Y.shape}; expected (n_series, {len(days)}).")
+        if self.use_rate:
+            if denominators is None:
+                raise ValueError("use_rate=True needs denominators (all-claims counts).")
+            D = np.atleast_2d(np.asarray(denominators, dtype=float))
+            if D.ndim != 2 or D.shape[1] != len(days) or D.shape[0] not in (1, Y.shape[0]):
+                raise ValueError(
+                    f"denominators has shape {D.shape}; expected {Y.shape} or (1, {len(days)})."
+                )
+            with np.errstate(divide="ignore", invalid="ignore"):
+                Y = np.nan_to_num(Y / D)
+        if len(days) and not (np.diff(days) >= 0).all():
+            order = np.argsort(days, kind="stable")
+            days, Y = days[order], Y[:, order]
+
+        start = epoch_day(days.min() if self.focus_start is None else self.focus_start)
+        end = epoch_day(days.max() if self.focus_end is None else self.focus_end)
+        keep = (days >= start) & (days <= end)
+        days, Y = days[keep], Y[:, keep]
+        n_series, n = Y.shape
+
+        with profiler.span("detect_breaks_batch", rows=Y.size):
+            break_indices = cut_indices(days, ICD_CUT_DATES)
+            stats = segmented_chow(days, Y, break_indices)
+            x = stats["x"]
+
+            # Local Chow: one cut at a time, two lines vs the global line
+            k = 2
+            local_chow = []
+            for b_idx in break_indices:
+                if not (0 < b_idx < n - 1) or b_idx < k + 1 or n - b_idx < k + 1:
+                    continue
+                left = fit_lines(x, Y, 0, b_idx)
+                right = fit_lines(x, Y, b_idx, n)
+                F_loc, p_loc = chow_f(
+                    stats["global_ssr"], left["ssr"] + right["ssr"], n=n, k=k, s=2
+                )
+                local_chow.append(
+                    {
+                        "break_index": int(b_idx),
+                        "break_date": day_timestamp(days[b_idx]),
+                        "F": F_loc,
+                        "p": p_loc,
+                    }
+                )
+
+            global_F, global_p = stats["global_chow_F"], stats["global_chow_p"]
+            if self.seasonality and n > 0:
+                global_F, global_p, local_chow = self._seasonal_chow(
+                    days, Y, break_indices
+                )
+
+        def describe(fit):
+            length = fit["length"]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                r2 = np.where(
+                    fit["syy"] > 0, 1.0 - fit["ssr"] / fit["syy"], (fit["ssr"] == 0) * 1.0
+                )
+            return {
+                "start_date": day_timestamp(days[fit["start_idx"]]),
+                "end_date": day_timestamp(days[fit["end_idx"] - 1]),
+                "start_day": int(days[fit["start_idx"]]),
+                "end_day": int(days[fit["end_idx"] - 1]),
+                "slope": fit["slope"] * DAYS_PER_YEAR,
+                "intercept": fit["intercept"],
+                "r_squared": r2,
+                "length": length,
+                "mean_value": fit["mean"],
+                "std_value": np.sqrt(fit["syy"] / length),
+                "ssr": fit["ssr"],
+                "start_idx": int(fit["start_idx"]),
+                "end_idx": int(fit["end_idx"]),
+            }
+
+        segments = [describe(seg) for seg in stats["segments"]]
+        if len(segments) > 1:
+            weighted = sum(seg["std_value"] ** 2 * seg["length"] for seg in segments)
+            total = sum(seg["length"] for seg in segments)
+            break_score = (weighted / total) / (x.var() + 1e-10)
+        else:
+            break_score = np.zeros(n_series)
+        break_dates = [day_timestamp(days[i]) for i in break_indices]
+
+        return {
+            "value_names": list(value_names) if value_names is not None else None,
+            "dates": from_epoch_days(days),
+            "days": days,
+            "break_points": break_indices,
+            "break_dates": break_dates,
+            "segments": segments,
+            "total_breaks": len(break_indices),
+            "break_score": break_score,
+            "icd_transition_alignment": self._check_icd_transition_alignment(break_dates),
+            "focus_range": (
+                f"{day_timestamp(start).date()} to {day_timestamp(end).date()}" if n else "n/a"
+            ),
+            "global_fit": describe(stats["global_fit"]) if n else None,
+            "global_ssr": stats["global_ssr"],
+            "segments_ssr": stats["segments_ssr"],
+            "global_chow_F": global_F,
+            "global_chow_p": global_p,
+            "local_chow": local_chow,
+            "seasonality": self.seasonality,
+        }
+
+    def detect_breaks_strata(self, stratified):
+        """
+        detect_breaks_batch over every stratum of create_stratified_timeseries
+        (use_rate=True divides each stratum by its own all-claims counts).
+        Returns the strata frame with one row of statistics per stratum.
+        """
+        batch = self.detect_breaks_batch(
+            stratified["days"], stratified["flag"], denominators=stratified["all"]
+        )
+        segs = batch["segments"]
+        table = stratified["strata"].copy()
+        table["global_chow_F"] = batch["global_chow_F"]
+        table["global_chow_p"] = batch["global_chow_p"]
+        table["global_slope"] = (
+            batch["global_fit"]["slope"] if batch["global_fit"] else np.nan
+        )
+        table["global_ssr"] = batch["global_ssr"]
+        table["segments_ssr"] = batch["segments_ssr"]
+        for lc in batch["local_chow"]:
+            table[f"local_chow_F_{lc['break_date'].date()}"] = lc["F"]
+        if len(segs) >= 2:
+            pre, post = segs[0]["mean_value"], segs[-1]["mean_value"]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                table["level_change"] = (post - pre) / np.abs(pre)
+        print(
+            f"🔍 Chow tests for {len(table)} strata over {len(batch['dates'])} days "
+            f"({len(segs)} segments)."
+        )
+        return table
+
+    def detect_breaks_daily(
+        self,
+        daily_data,
+        date_col="date",
+        value_col=None,
+        exposure_col=None,
+        hypothesis_name="",
+    ):
+        """
+        Segmented count model on daily flagged counts (no rolling window).
+
+        daily_data: one row per day, e.g. from daily_counts_frame. value_col defaults
+        to the first "*_daily" column other than all_daily; exposure_col (all-claims
+        counts, default "all_daily") is used as a log offset when use_rate=True.
+        Returns per-cut level changes (rate ratio - 1) and slope changes (log scale
+        per year) with Wald tests, plus a joint test of all change terms.
+        """
+        family = self.count_model or "quasipoisson"
+        with profiler.span("detect_breaks_daily", rows=len(daily_data), family=family):
+            days = epoch_day_axis(daily_data, date_col)
+            order = np.argsort(days, kind="stable")
+            data, days = daily_data.iloc[order], days[order]
+            if value_col is None:
+                daily_cols = [
+                    c for c in data.columns if c.endswith("_daily") and c != "all_daily"
+                ]
+                if not daily_cols:
+                    raise ValueError("No '*_daily' column found to use as value_col.")
+                value_col = daily_cols[0]
+            if not len(days):
+                print(f"⚠️ Not enough daily data around the ICD cuts for '{hypothesis_name}'.")
+                return {"family": family, "cuts": [], "break_p": None, "level_change": None}
+            start = int(days[0]) if self.focus_start is None else epoch_day(self.focus_start)
+            end = int(days[-1]) if self.focus_end is None else epoch_day(self.focus_end)
+            keep = (days >= start) & (days <= end)
+            data, days = data[keep], days[keep]
+            y = data[value_col].to_numpy(dtype=float)
+
+            offset = None
+            if self.use_rate:
+                exposure_col = exposure_col or "all_daily"
+                exposure = data[exposure_col].to_numpy(dtype=float)
+                keep = exposure > 0
+                days, y, exposure = days[keep], y[keep], exposure[keep]
+                offset = np.log(exposure)
+
+            cuts = [
+                epoch_day(c)
+                for c in ICD_CUT_DATES
+                if len(days) and days[0] < epoch_day(c) <= days[-1]
+            ]
+            if len(days) < 30 or not cuts or y.sum() == 0:
+                print(f"⚠️ Not enough daily data around the ICD cuts for '{hypothesis_name}'.")
+                return {"family": family, "cuts": [], "break_p": None, "level_change": None}
+
+            t = (days - days[0]) / DAYS_PER_YEAR
+            cuts_t = [(c - days[0]) / DAYS_PER_YEAR for c in cuts]
+            S = seasonal_terms(days, self.seasonality, self.fourier_order)
+            X, names = segmented_count_design(t, cuts_t, S)
+            with profiler.span("count_model.fit", rows=len(y)):
+                fit = fit_count_model(X, y, family=family, offset=offset)
+
+            cut_stats = []
+            for j, cut in enumerate(cuts):
+                level, slope = 2 + 2 * j, 3 + 2 * j
+                stat, p = wald_test(fit, [level, slope], family)
+                se_level = float(np.sqrt(fit["cov"][level, level]))
+                b = float(fit["beta"][level])
+                cut_stats.append(
+                    {
+                        "cut_date": day_timestamp(cut),
+                        "level_change": float(np.expm1(b)),
+                        "level_change_ci": (
+                            float(np.expm1(b - 1.96 * se_level)),
+                            float(np.expm1(b + 1.96 * se_level)),
+                        ),
+                        "slope_change": float(fit["beta"][slope]),
+                        "stat": stat,
+                        "p": p,
+                    }
+                )
+            change_idx = list(range(2, 2 + 2 * len(cuts)))
+            break_stat, break_p = wald_test(fit, change_idx, family)
+
+        results = {
+            "family": family,
+            "value_col": value_col,
+            "use_rate": self.use_rate,
+            "seasonality": self.seasonality,
+            "focus_range": f"{day_timestamp(days[0]).date()} to {day_timestamp(days[-1]).date()}",
+            "n_days": len(y),
+            "cuts": cut_stats,
+            # net level shift across all cuts: product of the per-cut rate ratios
+            "level_change": float(np.expm1(fit["beta"][2 : 2 + 2 * len(cuts) : 2].sum())),
+            "slope_change": float(fit["beta"][3 : 3 + 2 * len(cuts) : 2].sum()),
+            "break_stat": break_stat,
+            "break_p": break_p,
+            "dispersion": fit["pearson_dispersion"],
+            "nb_alpha": fit["alpha"],
+            "deviance": fit["deviance"],
+            "iterations": fit["iterations"],
+            "coefficients": coefficient_table(fit, names),
+        }
+        test = "F" if family == "quasipoisson" else "χ²"
+        print(
+            f"🔍 {family} model on {len(y)} days for '{hypothesis_name}': "
+            f"{test}={break_stat:.1f} (p={break_p:.3g}), net level change "
+            f"{results['level_change']:+.1%}, dispersion {fit['pearson_dispersion']:.2f}"
+        )
+        return results
+
     # ---------- Helpers ----------
 
+    def _with_rate_column(self, ts_data, value_col):
+        """Return (ts_data, rate column) for value_col divided by its all-claims column."""
+        if "_rate" in value_col:
+            return ts_data, value_col
+        prefix, sep, window = value_col.rpartition("_count")
+        denom = f"all_count{window}"
+        if not sep or denom not in ts_data.columns:
+            raise ValueError(
+                f"use_rate=True needs an all-claims column for '{value_col}' (expected '{denom}')."
+            )
+        rate_col = f"{prefix}_rate{window}"
+        ts_data = ts_data.copy()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ts_data[rate_col] = (ts_data[value_col] / ts_data[denom]).fillna(0.0)
+        return ts_data, rate_col
+
+    def _seasonal_chow(self, days, Y, break_indices):
+        """Global and per-break Chow F/p with Fourier seasonal terms (arrays per series)."""
+        S = seasonal_terms(days, self.seasonality, self.fourier_order)
+        stats = segmented_chow_seasonal(days, Y, break_indices, S)
+        local_chow = []
+        n = Y.shape[1]
+        for b_idx in break_indices:
+            if not (0 < b_idx < n - 1) or b_idx < 3 or n - b_idx < 3:
+                continue
+            loc = segmented_chow_seasonal(days, Y, [b_idx], S)
+            local_chow.append(
+                {
+                    "break_index": int(b_idx),
+                    "break_date": day_timestamp(days[b_idx]),
+                    "F": loc["global_chow_F"],
+                    "p": loc["global_chow_p"],
+                }
+            )
+        return stats["global_chow_F"], stats["global_chow_p"], local_chow
+
     def _find_break_points(self, values):
         """Conservative change detection using large relative jumps."""
         if len(values) <= 4:
@@ -245,50 +650,48 @@ class BreakDetector:
         threshold = np.mean(changes) + 3 * np.std(changes)
         return [i + 1 for i, change in enumerate(changes) if change > threshold]
 
-    def _prioritize_breaks(self, break_indices, dates):
+    def _prioritize_breaks(self, break_indices, days):
         """Keep the most relevant breaks (closest to ICD transition and spaced apart)."""
         if not break_indices:
             return []
-        break_dates = []
-        for i in break_indices:
-            if 0 <= i < len(dates):
-                break_dates.append(dates.iloc[i])
-            else:
-                break_dates.append(None)
-        distances = [
-            abs((d - self.icd_transition).days) if d is not None else np.inf
-            for d in break_dates
-        ]
+        idx = np.asarray(break_indices)
+        inside = (idx >= 0) & (idx < len(days))
+        transition = epoch_day(self.icd_transition)
+        distances = np.where(
+            inside, np.abs(days[np.clip(idx, 0, len(days) - 1)].astype(np.int64) - transition), np.inf
+        )
         closest_idx = int(np.argmin(distances))
         prioritized = [break_indices[closest_idx]]
         for i, b_idx in enumerate(break_indices):
             if i == closest_idx:
                 continue
-            if 0 <= b_idx < len(dates):
-                days_diff = abs((dates.iloc[b_idx] - dates.iloc[prioritized[0]]).days)
+            if 0 <= b_idx < len(days):
+                days_diff = abs(int(days[b_idx]) - int(days[prioritized[0]]))
                 if days_diff > 90:
                     prioritized.append(b_idx)
                     break
         return prioritized[: self.max_breaks]
 
-    def _fit_segment(self, dates, values, start_idx, end_idx):
-        """Fit linear regression to [start_idx, end_idx) using date ordinals -> slope per year."""
-        segment_dates = dates.iloc[start_idx:end_idx]
-        segment_values = values.iloc[start_idx:end_idx]
+    def _fit_segment(self, days, values, start_idx, end_idx):
+        """Fit linear regression to [start_idx, end_idx) on epoch days -> slope per year."""
+        segment_days = days[start_idx:end_idx]
+        segment_values = values[start_idx:end_idx]
         if len(segment_values) < 2:
             return None
-        date_numeric = np.array([d.toordinal() for d in segment_dates]).reshape(-1, 1)
+        x = segment_days.astype(float).reshape(-1, 1)
         model = LinearRegression()
-        model.fit(date_numeric, segment_values)
-        predictions = model.predict(date_numeric)
-        slope_per_year = float(model.coef_[0]) * 365.25
+        model.fit(x, segment_values)
+        predictions = model.predict(x)
+        slope_per_year = float(model.coef_[0]) * DAYS_PER_YEAR
         r2 = float(r2_score(segment_values, predictions))
         return {
-            "start_date": segment_dates.iloc[0],
-            "end_date": segment_dates.iloc[-1],
+            "start_date": day_timestamp(segment_days[0]),
+            "end_date": day_timestamp(segment_days[-1]),
+            "start_day": int(segment_days[0]),
+            "end_day": int(segment_days[-1]),
             "slope": slope_per_year,
             "r_squared": r2,
-            "length": len(segment_dates),
+            "length": len(segment_days),
             "mean_value": float(segment_values.mean()),
             "std_value": float(segment_values.std(ddof=0)),
             "model": model,
@@ -296,15 +699,15 @@ class BreakDetector:
             "end_idx": int(end_idx),
         }
 
-    def _fit_global(self, dates, values):
+    def _fit_global(self, days, values):
         """Fit a single OLS line across the entire focused window."""
-        return self._fit_segment(dates, values, 0, len(values))
+        return self._fit_segment(days, values, 0, len(values))
 
     def _ssr(self, y_true, y_hat):
         err = np.asarray(y_true) - np.asarray(y_hat)
         return float(np.sum(err**2))
 
-    def _calculate_break_score(self, segments, all_dates):
+    def _calculate_break_score(self, segments, days):
         """Quality metric: weighted variance of segments normalized by overall date variance."""
         if len(segments) <= 1:
             return 0.0
@@ -316,7 +719,7 @@ class BreakDetector:
             total_length += seg["length"]
         if total_length == 0:
             return float("inf")
-        overall_variance = np.array([d.toordinal() for d in all_dates]).var()
+        overall_variance = days.astype(float).var()
         return float((total_variance / total_length) / (overall_variance + 1e-10))
 
     def _check_icd_transition_alignment(self, break_dates):
@@ -348,7 +751,7 @@ class BreakDetector:
         p_val = 1 - f.cdf(F_stat, dfn=num_df, dfd=den_df)
         return F_stat, p_val
 
-    def _local_chow_for_break(self, dates, values, break_idx, k=2):
+    def _local_chow_for_break(self, days, values, break_idx, k=2):
         """
         Classic Chow at a single break index (two-segment comparison).
         Returns (F, p). If not enough points on either side, returns (None, None).
@@ -363,8 +766,8 @@ class BreakDetector:
             return None, None
 
         # Build X, y
-        X = np.array([d.toordinal() for d in dates]).reshape(-1, 1)
-        y = values.values
+        X = days.astype(float).reshape(-1, 1)
+        y = np.asarray(values, dtype=float)
 
         # Split
         X1, y1 = X[:break_idx], y[:break_idx]
@@ -466,7 +869,7 @@ class BreakDetector:
 
     def _plot_results(
         self,
-        dates,
+        days,
         values,
         results,
         hypothesis_name,
@@ -475,13 +878,14 @@ class BreakDetector:
         effective_end,
     ):
         """Plot data and segment regressions for the focus window; return Figure for logging."""
+        dates = from_epoch_days(days)  # datetimes for the axis only
+        x = days.astype(float).reshape(-1, 1)
         fig, ax = plt.subplots(figsize=(12, 6))  # CHANGED: capture fig/ax
         ax.plot(dates, values, "o-", label=value_col, alpha=0.6, markersize=4)
 
         # Global line across the entire focus window
         if "global_fit" in results and results["global_fit"] is not None:
-            date_numeric_all = np.array([d.toordinal() for d in dates]).reshape(-1, 1)
-            global_pred = results["global_fit"]["model"].predict(date_numeric_all)
+            global_pred = results["global_fit"]["model"].predict(x)
             ax.plot(
                 dates,
                 global_pred,
@@ -492,13 +896,12 @@ class BreakDetector:
 
         colors = ["red", "green", "purple", "orange", "brown"]
         for i, seg in enumerate(results["segments"]):
-            seg_mask = (dates >= seg["start_date"]) & (dates <= seg["end_date"])
-            seg_dates = dates[seg_mask]
-            seg_values = values[seg_mask]
+            a, b = seg["start_idx"], seg["end_idx"]
+            seg_dates = dates[a:b]
+            seg_values = values[a:b]
             if len(seg_dates) == 0:
                 continue
-            date_numeric = np.array([d.toordinal() for d in seg_dates]).reshape(-1, 1)
-            predicted = seg["model"].predict(date_numeric)
+            predicted = seg["model"].predict(x[a:b])
             ax.plot(
                 seg_dates,
                 predicted,
@@ -561,5 +964,31 @@ class BreakDetector:
         plt.savefig(f"figures/{plotname}.png")
 
 
+
+def _scalar(v):
+    """First element of a one-series kernel result as a Python float."""
+    return float(np.asarray(v).ravel()[0])
+
+
+def batch_series(batch: dict, i: int) -> dict:
+    """Series i of BreakDetector.detect_breaks_batch as plain scalars."""
+
+    def pick(v):
+        return v[i] if isinstance(v, np.ndarray) and v.ndim == 1 else v
+
+    out = {
+        k: pick(v)
+        for k, v in batch.items()
+        if k not in ("segments", "global_fit", "local_chow", "dates", "days", "value_names")
+    }
+    out["value_column"] = batch["value_names"][i] if batch["value_names"] else i
+    out["segments"] = [{k: pick(v) for k, v in seg.items()} for seg in batch["segments"]]
+    out["global_fit"] = (
+        {k: pick(v) for k, v in batch["global_fit"].items()} if batch["global_fit"] else None
+    )
+    out["local_chow"] = [{k: pick(v) for k, v in lc.items()} for lc in batch["local_chow"]]
+    return out
+
+
 # Global instance: defaults to forcing ICD-based segments; no explicit focus -> full dataset
 break_detector = BreakDetector(force_icd_segments=True)
@@ -0,0 +1,119 @@
+"""
+Segmented count regression on DAILY claims (no rolling window).
+
+log E[y_t] = offset_t + a + b·t + Σ_c (d_c·1[t >= c] + e_c·(t - c)_+) + seasonal terms
+
+- d_c is the level change (rate ratio exp(d_c)) and e_c the slope change at cut c.
+- family: "poisson", "quasipoisson" (Pearson dispersion scales the covariance) or
+  "negbin" (NB2, dispersion alpha by method of moments, re-fitted twice).
+- offset: log of all-claims counts to model the flagged proportion.
+- Fitting is plain IRLS in NumPy: a handful of (n x p) passes, a few ms per series.
+"""
+
+import numpy as np
+from scipy.stats import chi2, f as f_dist, norm
+
+FAMILIES = ("poisson", "quasipoisson", "negbin")
+
+
+def segmented_count_design(t_years: np.ndarray, cuts_years: list[float], seasonal=None):
+    """Design matrix and column names: intercept, trend, step/ramp per cut, seasonal terms."""
+    cols, names = [np.ones_like(t_years), t_years], ["intercept", "trend"]
+    for j, c in enumerate(cuts_years):
+        cols += [(t_years >= c).astype(float), np.clip(t_years - c, 0.0, None)]
+        names += [f"level_change_{j}", f"slope_change_{j}"]
+    if seasonal is not None and seasonal.shape[1]:
+        cols += list(seasonal.T)
+        names += [f"seasonal_{k}" for k in range(seasonal.shape[1])]
+    return np.column_stack(cols), names
+
+
+def irls(X, y, offset=None, alpha=0.0, max_iter=50, tol=1e-8, beta0=None):
+    """
+    Log-link IRLS for Poisson (alpha=0) or NB2 with fixed alpha.
+    Returns (beta, mu, XtWX, iterations).
+    """
+    offset = np.zeros(len(y)) if offset is None else offset
+    if beta0 is None:
+        eta = np.log(y + 0.5)
+    else:
+        eta = offset + X @ beta0
+    beta = beta0
+    for it in range(1, max_iter + 1):
+        mu = np.exp(eta)
+        w = mu / (1.0 + alpha * mu)
+        z = eta - offset + (y - mu) / mu
+        Xw = X * w[:, None]
+        XtWX = X.T @ Xw
+        beta_new = np.linalg.solve(XtWX, Xw.T @ z)
+        eta = offset + X @ beta_new
+        if beta is not None and np.max(np.abs(beta_new - beta)) < tol * (1 + np.max(np.abs(beta))):
+            beta = beta_new
+            break
+        beta = beta_new
+    mu = np.exp(eta)
+    w = mu / (1.0 + alpha * mu)
+    return beta, mu, X.T @ (X * w[:, None]), it
+
+
+def fit_count_model(X, y, family="quasipoisson", offset=None):
+    """Fit one series. Returns dict with beta, cov, dispersion, alpha, deviance, df_resid."""
+    if family not in FAMILIES:
+        raise ValueError(f"family must be one of {FAMILIES}")
+    y = np.asarray(y, dtype=float)
+    n, p = X.shape
+    beta, mu, XtWX, iters = irls(X, y, offset)
+    alpha = 0.0
+    if family == "negbin":
+        for _ in range(2):
+            alpha = max(0.0, float(np.sum(((y - mu) ** 2 - mu) / mu**2) / (n - p)))
+            beta, mu, XtWX, more = irls(X, y, offset, alpha=alpha, beta0=beta)
+            iters += more
+    cov = np.linalg.inv(XtWX)
+    pearson = float(np.sum((y - mu) ** 2 / (mu * (1 + alpha * mu))) / (n - p))
+    dispersion = pearson if family == "quasipoisson" else 1.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ylog = np.where(y > 0, y * np.log(y / mu), 0.0)
+        if alpha > 0:
+            # NB2 unit deviance; tends to the Poisson one as alpha -> 0
+            dev_terms = ylog - (y + 1 / alpha) * np.log1p(alpha * y) + (y + 1 / alpha) * np.log1p(alpha * mu)
+        else:
+            dev_terms = ylog - (y - mu)
+    return {
+        "beta": beta,
+        "cov": cov * dispersion,
+        "mu": mu,
+        "dispersion": dispersion,
+        "pearson_dispersion": pearson,
+        "alpha": alpha,
+        "deviance": float(2 * np.sum(dev_terms)),
+        "df_resid": n - p,
+        "iterations": iters,
+    }
+
+
+def wald_test(fit, idx, family):
+    """Joint Wald test that beta[idx] == 0. F test for quasi-Poisson, chi-square otherwise."""
+    b = fit["beta"][idx]
+    V = fit["cov"][np.ix_(idx, idx)]
+    stat = float(b @ np.linalg.solve(V, b))
+    q = len(idx)
+    if family == "quasipoisson":
+        F = stat / q
+        return F, float(f_dist.sf(F, q, fit["df_resid"]))
+    return stat, float(chi2.sf(stat, q))
+
+
+def coefficient_table(fit, names):
+    se = np.sqrt(np.diag(fit["cov"]))
+    z = fit["beta"] / se
+    return [
+        {
+            "term": name,
+            "estimate": float(b),
+            "se": float(s),
+            "z": float(zz),
+            "p": float(2 * norm.sf(abs(zz))),
+        }
+        for name, b, s, zz in zip(names, fit["beta"], se, z)
+    ]
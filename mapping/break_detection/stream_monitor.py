@@ -0,0 +1,241 @@
+"""
+Streaming break monitoring for accepted mappings.
+
+Each accepted mapping keeps constant-size state, updated once per day:
+  - running regression sums (n, Σx, Σy, Σxx, Σxy, Σyy) of a linear trend, so the
+    OLS line over all history so far is a 2x2 closed-form solve;
+  - the recursive residual of each new point against the line fitted on all
+    earlier points (Brown-Durbin-Evans), standardized by the residual scale
+    frozen at the end of the calibration period;
+  - a two-sided Page CUSUM on those residuals, which raises an alert when a new
+    level or trend shift accumulates past `threshold`;
+  - the rolling-window sums (a ring buffer plus running totals), as in
+    create_timeseries_function.
+
+Points are blocks of `aggregate_days` days (7 by default removes weekday effects).
+Claims for a day must arrive together, in date order.
+
+Usage:
+    monitor = StreamMonitor(config["target_colnames"])
+    monitor.add_mapping("cardiomyopathy", codes, history=daily_counts_frame(...))
+    alerts = monitor.ingest_claims(new_claims_df)
+"""
+
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from utils.epoch_days import from_epoch_days, to_epoch_days
+from utils.profiler import profiler
+from time_series_evaluator.create_time_series import claim_flags
+
+
+class MappingMonitor:
+    """O(1)-per-day monitor for one mapping (see module docstring)."""
+
+    def __init__(
+        self,
+        name: str,
+        codes,
+        calibration_days: int = 364,
+        aggregate_days: int = 7,
+        window_size: int = 364,
+        use_rate: bool = False,
+        drift: float = 0.5,
+        threshold: float = 5.0,
+    ):
+        self.name = name
+        self.codes = set(codes)
+        self.calibration_points = max(3, calibration_days // aggregate_days)
+        self.aggregate_days = int(aggregate_days)
+        self.use_rate = bool(use_rate)
+        self.drift = float(drift)
+        self.threshold = float(threshold)
+
+        self.origin = None
+        self.last_date = None
+        self.sums = np.zeros(6)  # n, Σx, Σy, Σxx, Σxy, Σyy
+        self.sigma = None
+        self.cusum_pos = self.cusum_neg = 0.0
+        self.block = [0, 0.0, 0.0]  # days, flagged, all claims in the open block
+        self.ring = deque(maxlen=window_size)
+        self.rolling_flag = self.rolling_all = 0.0
+        self.alerts = []
+
+    # ---------- Regression state ----------
+
+    def _line(self):
+        """(intercept, slope, (X'X)^-1) of the OLS line over the points so far."""
+        n, sx, sy, sxx, sxy, _ = self.sums
+        det = n * sxx - sx * sx
+        if n < 2 or det <= 0:
+            return None
+        slope = (n * sxy - sx * sy) / det
+        intercept = (sy - slope * sx) / n
+        inv = np.array([[sxx, -sx], [-sx, n]]) / det
+        return intercept, slope, inv
+
+    def _ssr(self, line):
+        intercept, slope, _ = line
+        n, sx, sy, sxx, sxy, syy = self.sums
+        return max(syy - intercept * sy - slope * sxy, 0.0)
+
+    def _add_point(self, date, y):
+        """Recursive residual + CUSUM for one aggregated point, then absorb it."""
+        x = (date - self.origin).days / 365.25
+        alert = None
+        line = self._line()
+        if line is not None and self.sums[0] >= 3:
+            intercept, slope, inv = line
+            xv = np.array([1.0, x])
+            scale = np.sqrt(1.0 + xv @ inv @ xv)
+            recursive_residual = (y - intercept - slope * x) / scale
+            if self.sigma is None and self.sums[0] >= self.calibration_points:
+                self.sigma = np.sqrt(self._ssr(line) / (self.sums[0] - 2)) or 1.0
+                print(f"📏 Monitor '{self.name}' calibrated on {int(self.sums[0])} points.")
+            if self.sigma is not None:
+                z = recursive_residual / self.sigma
+                self.cusum_pos = max(0.0, self.cusum_pos + z - self.drift)
+                self.cusum_neg = max(0.0, self.cusum_neg - z - self.drift)
+                if max(self.cusum_pos, self.cusum_neg) > self.threshold:
+                    alert = {
+                        "mapping": self.name,
+                        "date": date,
+                        "direction": "up" if self.cusum_pos > self.cusum_neg else "down",
+                        "cusum": float(max(self.cusum_pos, self.cusum_neg)),
+                        "threshold": self.threshold,
+                        "expected": float(intercept + slope * x),
+                        "observed": y,
+                    }
+                    self.alerts.append(alert)
+                    self.cusum_pos = self.cusum_neg = 0.0
+                    print(
+                        f"🚨 Break alert for '{self.name}' on {date.date()}: level went "
+                        f"{alert['direction']} (observed {y:.4g}, expected {alert['expected']:.4g})."
+                    )
+        self.sums += np.array([1.0, x, y, x * x, x * y, y * y])
+        return alert
+
+    # ---------- Daily updates ----------
+
+    def update(self, date, flagged: float, all_claims: float):
+        """Ingest one day's counts (dates strictly increasing). Returns an alert or None."""
+        date = pd.Timestamp(date)
+        if self.last_date is not None and date <= self.last_date:
+            raise ValueError(
+                f"Monitor '{self.name}' already has {self.last_date.date()}; got {date.date()}."
+            )
+        if self.origin is None:
+            self.origin = date
+        alert = None
+        # days without claims count as zeros
+        gap = 0 if self.last_date is None else (date - self.last_date).days - 1
+        for offset in range(gap, -1, -1):
+            day = date - pd.Timedelta(days=offset)
+            f, a = (flagged, all_claims) if offset == 0 else (0.0, 0.0)
+            alert = self._update_day(day, f, a) or alert
+        self.last_date = date
+        return alert
+
+    def _update_day(self, date, flagged, all_claims):
+        if len(self.ring) == self.ring.maxlen:
+            old_f, old_a = self.ring[0]
+            self.rolling_flag -= old_f
+            self.rolling_all -= old_a
+        self.ring.append((flagged, all_claims))
+        self.rolling_flag += flagged
+        self.rolling_all += all_claims
+
+        self.block[0] += 1
+        self.block[1] += flagged
+        self.block[2] += all_claims
+        if self.block[0] < self.aggregate_days:
+            return None
+        _, f, a = self.block
+        self.block = [0, 0.0, 0.0]
+        if self.use_rate:
+            if a == 0:
+                return None
+            return self._add_point(date, f / a)
+        return self._add_point(date, f)
+
+    def warm_start(self, daily: pd.DataFrame, date_col: str = "date"):
+        """Replay history (daily_counts_frame layout: {flag}_daily, all_daily)."""
+        flag_col = next(c for c in daily.columns if c.endswith("_daily") and c != "all_daily")
+        for date, f, a in zip(daily[date_col], daily[flag_col], daily["all_daily"]):
+            self.update(date, f, a)
+        return self
+
+    def rebaseline(self):
+        """Forget the fitted line and recalibrate from the next day (after a reviewed change)."""
+        self.origin = None
+        self.sums = np.zeros(6)
+        self.sigma = None
+        self.cusum_pos = self.cusum_neg = 0.0
+        self.block = [0, 0.0, 0.0]
+
+    def state(self) -> dict:
+        line = self._line()
+        return {
+            "mapping": self.name,
+            "last_date": self.last_date,
+            "points": int(self.sums[0]),
+            "calibrated": self.sigma is not None,
+            "slope_per_year": None if line is None else float(line[1]),
+            "cusum_pos": float(self.cusum_pos),
+            "cusum_neg": float(self.cusum_neg),
+            "rolling_flag": self.rolling_flag,
+            "rolling_all": self.rolling_all,
+            "alerts": len(self.alerts),
+        }
+
+
+class StreamMonitor:
+    """Monitors for several accepted mappings over one claims feed."""
+
+    def __init__(self, target_colnames: list[str], date_col: str = "date", **monitor_kwargs):
+        self.target_colnames = list(target_colnames)
+        self.date_col = date_col
+        self.monitor_kwargs = monitor_kwargs
+        self.monitors = {}
+
+    def add_mapping(self, name: str, codes, history: pd.DataFrame = None, **kwargs):
+        """Register a mapping; history (daily_counts_frame) calibrates it right away."""
+        monitor = MappingMonitor(name, codes, **{**self.monitor_kwargs, **kwargs})
+        if history is not None:
+            monitor.warm_start(history, self.date_col)
+        self.monitors[name] = monitor
+        return monitor
+
+    def ingest_claims(self, claims_df: pd.DataFrame) -> list[dict]:
+        """Flag new claims for every mapping and feed each day to its monitor.
+        claims_df: raw claims or a compact_claims frame (int32 epoch days, categorical codes)."""
+        with profiler.span("stream_monitor.ingest", rows=len(claims_df)):
+            day_values, day_idx = np.unique(
+                to_epoch_days(claims_df[self.date_col]), return_inverse=True
+            )
+            dates = from_epoch_days(day_values)
+            all_daily = np.bincount(day_idx, minlength=len(dates))
+            cols = [c for c in self.target_colnames if c in claims_df.columns]
+            alerts = []
+            for monitor in self.monitors.values():
+                flags = claim_flags(claims_df, monitor.codes, cols)
+                flag_daily = np.bincount(day_idx[flags], minlength=len(dates))
+                for date, f, a in zip(dates, flag_daily, all_daily):
+                    alert = monitor.update(date, float(f), float(a))
+                    if alert:
+                        alerts.append(alert)
+        return alerts
+
+    def ingest_day(self, date, counts: dict, all_claims: float) -> list[dict]:
+        """Feed pre-aggregated counts {mapping name: flagged} for one day."""
+        alerts = []
+        for name, flagged in counts.items():
+            alert = self.monitors[name].update(date, flagged, all_claims)
+            if alert:
+                alerts.append(alert)
+        return alerts
+
+    def status(self) -> pd.DataFrame:
+        return pd.DataFrame([m.state() for m in self.monitors.values()])
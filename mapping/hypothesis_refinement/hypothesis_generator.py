@@ -1,5 +1,7 @@
 import typing
+from .icd_index import get_icd_index
 from .icd_parsing_script import icd_map, parse_codes
+from interpreter.prompt_builder import refinement_prompt
 from interpreter.prompt_handler import get_concept
 
 Hypothesis = typing.TypedDict(
@@ -7,15 +9,55 @@ Hypothesis = typing.TypedDict(
 )
 
 
+def candidate_prompt(user_input_desc: str) -> str:
+    """Ranked candidate codes from the local ICD index, as prompt text ("" if unavailable)."""
+    try:
+        candidates = get_icd_index().candidates(user_input_desc)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ ICD index unavailable ({e}); asking the LLM without candidates.")
+        return ""
+    if not candidates["icd9"] and not candidates["icd10"]:
+        return ""
+    return (
+        "Candidate codes from a local ICD description index, most relevant first. "
+        "Start from these and add other codes only when clearly needed:\n"
+        f"ICD9: {', '.join(candidates['icd9'])}\n"
+        f"ICD10: {', '.join(candidates['icd10'])}"
+    )
+
+
+def _concept_or_none(user_input_desc: str, supplementary_prompt: str, temperature):
+    """get_concept, or None (logged) when the LLM gave no usable codes."""
+    try:
+        return get_concept(user_input_desc, supplementary_prompt, temperature=temperature)
+    except ValueError as e:
+        print(f"⚠️ Skipping this proposal: {e}")
+        return None
+
+
 def generate_hypotheses(
     history: list[dict],
     prev_results: dict,
     user_input_desc="",
-) -> Hypothesis:
+    temperature=None,
+    emphasis="",
+    use_index=True,
+) -> typing.Optional[Hypothesis]:
+    """
+    temperature / emphasis let the speculative refinement loop ask for several
+    different proposals in parallel; the defaults reproduce the serial behaviour.
+    use_index: seed the first proposal with candidates from the local ICD index.
+    Returns None when get_concept still has no valid codes after its re-asks;
+    the refinement loops skip that proposal.
+    """
 
     # BASE CASE: NO CODES GENERATED YET -> GENERATE NAIVE CODES
     if history == []:
-        raw_codes = get_concept(user_input_desc)
+        seed = candidate_prompt(user_input_desc) if use_index else ""
+        supplementary_prompt = "\n".join(e for e in (emphasis, seed) if e)
+        raw_codes = _concept_or_none(user_input_desc, supplementary_prompt, temperature)
+        if raw_codes is None:
+            return None
         naive_icd9_codes = parse_codes(raw_codes["icd9"])
         naive_icd10_codes = parse_codes(raw_codes["icd10"])
         print(f"Extracted {len(naive_icd9_codes)} ICD-9: {naive_icd9_codes}")
@@ -29,22 +71,12 @@ def generate_hypotheses(
     # CASE 1: BAD CODE MAPPING -> GENERATE HYPOTHESIS
     elif prev_results["artificial_break"]:
 
-        truncated_history = []
-        for results in history:
-            truncated_results = {
-                "hypothesis": results["hypothesis"],
-                "artificial_slope": results["artificial_slope"],
-                "comment": results["comment"],
-            }
-            truncated_history.append(truncated_results)
-        supplementary_prompt = f"""
-        You have already generated some mappings for me, but the following mappings for "{user_input_desc}" do not work. 
-        Here are the code sets that I've tried already, so DO NOT generate a duplicate set of codes for me:
-        {truncated_history}
-        See the comment for each previously-generated set, and please generate a new set of comma-separated codes for me accordingly, as an expert with up-to-date web knowledge about ICD code usage.
-        """
+        # current mapping + diffs of earlier attempts, capped at a token budget
+        supplementary_prompt = refinement_prompt(user_input_desc, history, emphasis)
 
-        raw_codes = get_concept(user_input_desc, supplementary_prompt)
+        raw_codes = _concept_or_none(user_input_desc, supplementary_prompt, temperature)
+        if raw_codes is None:
+            return None
         new_icd9_codes = parse_codes(raw_codes["icd9"])
         new_icd10_codes = parse_codes(raw_codes["icd10"])
         print(f"Extracted {len(new_icd9_codes)} ICD-9: {new_icd9_codes}")
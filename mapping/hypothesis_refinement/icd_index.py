@@ -0,0 +1,277 @@
+"""
+Local retrieval index over ICD code descriptions.
+
+- Documents: icd9_diagnosis_codes.csv (desc + short_desc), plus an ICD-10-CM
+  description file (columns code, desc) when one is dropped into files/.
+  Without ICD-10 descriptions, ICD-10 candidates come from the GEM crosswalk of
+  the top ICD-9 hits.
+- Ranking: BM25 over prefix-stemmed tokens (first 8 characters, so
+  "atherosclerosis" / "atherosclerotic" / "atheroscl" meet), optionally blended
+  with compact LSA embeddings (TF-IDF + truncated SVD, float16).
+- Storage: one directory of .npy arrays (postings and the ICD-9 -> ICD-10 GEM
+  crosswalk in CSR form) plus a JSON header, built once and loaded memory-mapped
+  (ENHA_ICD_INDEX_DIR, default .cache/icd_index). Queries touch only the
+  postings of their own terms.
+
+Usage:
+    index = get_icd_index()
+    index.candidates("cardiomyopathy and atherosclerosis")
+    # {"icd9": ["4254", ...], "icd10": ["I428", ...]}
+"""
+
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from utils.profiler import profiler
+
+FILES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "files")
+ICD9_DESC_PATH = os.path.join(FILES_DIR, "icd9_diagnosis_codes.csv")
+ICD10_DESC_PATH = os.path.join(FILES_DIR, "icd10cm_codes.csv")  # optional
+GEM_PATH = os.path.join(FILES_DIR, "icd10cmtoicd9gem.csv")
+INDEX_VERSION = 2
+STEM_CHARS = 8
+STOPWORDS = {
+    "a", "all", "and", "any", "as", "at", "by", "claims", "code", "codes", "due",
+    "elsewhere", "for", "from", "i", "in", "is", "me", "not", "of", "on", "or",
+    "other", "related", "specified", "the", "to", "unspecified", "want", "with",
+    "without", "find", "nos", "nec", "oth", "unsp",
+}
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase alphanumeric words, stopwords dropped, stemmed to STEM_CHARS prefixes."""
+    return [
+        w[:STEM_CHARS]
+        for w in re.findall(r"[a-z0-9]+", str(text).lower())
+        if w not in STOPWORDS and len(w) > 1
+    ]
+
+
+def _load_documents() -> pd.DataFrame:
+    icd9 = pd.read_csv(ICD9_DESC_PATH, dtype=str, encoding="utf-8-sig", usecols=[0, 1, 2])
+    icd9.columns = ["code", "desc", "short_desc"]
+    docs = pd.DataFrame(
+        {
+            "code": icd9["code"].str.strip(),
+            "system": "icd9",
+            "desc": icd9["desc"].fillna(""),
+            "text": icd9["desc"].fillna("") + " " + icd9["short_desc"].fillna(""),
+        }
+    )
+    if os.path.exists(ICD10_DESC_PATH):
+        icd10 = pd.read_csv(ICD10_DESC_PATH, dtype=str, encoding="utf-8-sig", usecols=[0, 1])
+        icd10.columns = ["code", "desc"]
+        docs = pd.concat(
+            [
+                docs,
+                pd.DataFrame(
+                    {
+                        "code": icd10["code"].str.replace(".", "", regex=False).str.strip(),
+                        "system": "icd10",
+                        "desc": icd10["desc"].fillna(""),
+                        "text": icd10["desc"].fillna(""),
+                    }
+                ),
+            ],
+            ignore_index=True,
+        )
+    return docs.reset_index(drop=True)
+
+
+def build_icd_index(index_dir: str, embedding_dims: int = 64) -> str:
+    """Tokenize the description files and write the index arrays to index_dir."""
+    with profiler.span("icd_index.build"):
+        docs = _load_documents()
+        doc_tokens = [tokenize(t) for t in docs["text"]]
+        vocab = sorted({t for toks in doc_tokens for t in toks})
+        term_id = {t: i for i, t in enumerate(vocab)}
+
+        # (term, doc, tf) triples -> CSR postings sorted by term
+        rows, cols = [], []
+        for d, toks in enumerate(doc_tokens):
+            for t in toks:
+                rows.append(term_id[t])
+                cols.append(d)
+        pairs = np.unique(np.array([rows, cols], dtype=np.int64).T, axis=0, return_counts=True)
+        (terms, doc_ids), tf = pairs[0].T, pairs[1]
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.add.at(indptr, terms + 1, 1)
+        indptr = np.cumsum(indptr)
+        doc_len = np.array([len(t) for t in doc_tokens], dtype=np.float32)
+        df_counts = np.diff(indptr)
+        n_docs = len(docs)
+        idf = np.log(1 + (n_docs - df_counts + 0.5) / (df_counts + 0.5)).astype(np.float32)
+
+        # GEM crosswalk: ICD-10 codes per ICD-9 document, CSR over documents
+        gem = pd.read_csv(GEM_PATH, dtype=str, usecols=["icd10cm", "icd9cm"])
+        gem_map = gem.groupby("icd9cm")["icd10cm"].apply(list).to_dict()
+        icd10_vocab = sorted(gem["icd10cm"].unique())
+        icd10_id = {c: i for i, c in enumerate(icd10_vocab)}
+        per_doc = [
+            [icd10_id[c] for c in gem_map.get(code, [])] if system == "icd9" else []
+            for code, system in zip(docs["code"], docs["system"])
+        ]
+        gem_indptr = np.cumsum([0] + [len(x) for x in per_doc]).astype(np.int64)
+        gem_ids = np.array([i for x in per_doc for i in x], dtype=np.int32)
+
+        os.makedirs(index_dir, exist_ok=True)
+        arrays = {
+            "gem_indptr": gem_indptr,
+            "gem_ids": gem_ids,
+            "indptr": indptr,
+            "doc_ids": doc_ids.astype(np.int32),
+            "tf": tf.astype(np.float32),
+            "doc_len": doc_len,
+            "idf": idf,
+        }
+        if embedding_dims:
+            from scipy.sparse import csr_matrix
+            from scipy.sparse.linalg import svds
+
+            # TF-IDF (docs x terms), L2-normalized rows
+            w = (1 + np.log(tf)) * idf[terms]
+            X = csr_matrix((w, (doc_ids, terms)), shape=(n_docs, len(vocab)))
+            norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel()) + 1e-12
+            X = csr_matrix(X.multiply(1 / norms[:, None]))
+            k = min(embedding_dims, min(X.shape) - 1)
+            U, S, Vt = svds(X, k=k)
+            doc_vecs = U * S
+            doc_vecs /= np.linalg.norm(doc_vecs, axis=1, keepdims=True) + 1e-12
+            arrays["doc_vecs"] = doc_vecs.astype(np.float16)
+            arrays["term_vecs"] = Vt.T.astype(np.float16)
+        for name, arr in arrays.items():
+            np.save(os.path.join(index_dir, f"{name}.npy"), arr)
+
+        with open(os.path.join(index_dir, "index.json"), "w") as f:
+            json.dump(
+                {
+                    "version": INDEX_VERSION,
+                    "stem_chars": STEM_CHARS,
+                    "vocab": vocab,
+                    "codes": docs["code"].tolist(),
+                    "systems": docs["system"].tolist(),
+                    "descs": docs["desc"].tolist(),
+                    "gem_icd10": icd10_vocab,
+                    "avg_doc_len": float(doc_len.mean()),
+                    "embedding_dims": int(embedding_dims and arrays["doc_vecs"].shape[1]),
+                },
+                f,
+            )
+    print(f"📚 Built ICD index: {n_docs} descriptions, {len(vocab)} terms -> {index_dir}")
+    return index_dir
+
+
+class ICDIndex:
+    """Memory-mapped BM25 (+ optional LSA) index; see module docstring."""
+
+    def __init__(self, index_dir: str, k1: float = 1.2, b: float = 0.75):
+        with open(os.path.join(index_dir, "index.json")) as f:
+            meta = json.load(f)
+        self.vocab = {t: i for i, t in enumerate(meta["vocab"])}
+        self.codes = meta["codes"]
+        self.systems = np.array(meta["systems"])
+        self.descs = meta["descs"]
+        self.avg_doc_len = meta["avg_doc_len"]
+        self.gem_icd10 = meta["gem_icd10"]
+        self.k1, self.b = k1, b
+
+        def load(name):
+            path = os.path.join(index_dir, f"{name}.npy")
+            return np.load(path, mmap_mode="r") if os.path.exists(path) else None
+
+        self.indptr = load("indptr")
+        self.doc_ids = load("doc_ids")
+        self.tf = load("tf")
+        self.doc_len = load("doc_len")
+        self.idf = load("idf")
+        self.doc_vecs = load("doc_vecs")
+        self.term_vecs = load("term_vecs")
+        self.gem_indptr = load("gem_indptr")
+        self.gem_ids = load("gem_ids")
+
+    def bm25(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self.codes), dtype=np.float32)
+        for term in set(tokenize(query)):
+            t = self.vocab.get(term)
+            if t is None:
+                continue
+            a, b = self.indptr[t], self.indptr[t + 1]
+            docs = self.doc_ids[a:b]
+            tf = self.tf[a:b]
+            norm = self.k1 * (1 - self.b + self.b * self.doc_len[docs] / self.avg_doc_len)
+            scores[docs] += self.idf[t] * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def semantic(self, query: str) -> np.ndarray:
+        """Cosine between the query's LSA vector and every document (zeros if no embeddings)."""
+        if self.doc_vecs is None:
+            return np.zeros(len(self.codes), dtype=np.float32)
+        ids = [self.vocab[t] for t in tokenize(query) if t in self.vocab]
+        if not ids:
+            return np.zeros(len(self.codes), dtype=np.float32)
+        q = (np.asarray(self.idf[ids])[:, None] * np.asarray(self.term_vecs[ids], dtype=np.float32)).sum(0)
+        q /= np.linalg.norm(q) + 1e-12
+        return np.asarray(self.doc_vecs, dtype=np.float32) @ q
+
+    def search(self, query: str, k: int = 20, system: str = None, semantic_weight: float = 0.3):
+        """Top-k documents as [{doc, code, system, desc, score}], best first."""
+        with profiler.span("icd_index.search"):
+            scores = self.bm25(query)
+            if scores.max() > 0:
+                scores = scores / scores.max()
+            if semantic_weight:
+                scores = scores + semantic_weight * np.clip(self.semantic(query), 0, None)
+            if system is not None:
+                scores = np.where(self.systems == system, scores, 0.0)
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+        return [
+            {
+                "doc": int(i),
+                "code": self.codes[i],
+                "system": str(self.systems[i]),
+                "desc": self.descs[i],
+                "score": float(scores[i]),
+            }
+            for i in top
+            if scores[i] > 0
+        ]
+
+    def icd10_for(self, doc: int) -> list[str]:
+        """ICD-10 codes the GEM maps to an ICD-9 document."""
+        ids = self.gem_ids[self.gem_indptr[doc] : self.gem_indptr[doc + 1]]
+        return [self.gem_icd10[i] for i in ids]
+
+    def candidates(self, query: str, k9: int = 15, k10: int = 30) -> dict:
+        """Ranked ICD-9 and ICD-10 candidate codes for a concept."""
+        hits9 = self.search(query, k=k9, system="icd9")
+        if (self.systems == "icd10").any():
+            icd10 = [h["code"] for h in self.search(query, k=k10, system="icd10")]
+        else:
+            icd10 = list(dict.fromkeys(c for h in hits9 for c in self.icd10_for(h["doc"])))
+        return {"icd9": [h["code"] for h in hits9], "icd10": icd10[:k10]}
+
+
+_INDEX = {}
+
+
+def get_icd_index(index_dir: str = None) -> ICDIndex:
+    """Load (building on first use) the index under ENHA_ICD_INDEX_DIR."""
+    index_dir = index_dir or os.environ.get(
+        "ENHA_ICD_INDEX_DIR", os.path.join(".cache", "icd_index")
+    )
+    if index_dir not in _INDEX:
+        meta = os.path.join(index_dir, "index.json")
+        stale = not os.path.exists(meta)
+        if not stale:
+            with open(meta) as f:
+                stale = json.load(f).get("version") != INDEX_VERSION
+        if stale:
+            build_icd_index(index_dir)
+        _INDEX[index_dir] = ICDIndex(index_dir)
+    return _INDEX[index_dir]
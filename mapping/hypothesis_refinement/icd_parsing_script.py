@@ -1,16 +1,63 @@
+import functools
+import os
+
 import pandas as pd
 
+from utils.profiler import profiler
+
+FILES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "files")
+
 
 def icd_map(icd10_codes: list[str]):
     icd10_to_icd9_gem = pd.read_csv("hypothesis_refinement/files/icd10cmtoicd9gem.csv")
-    
+
     mapped_rows = icd10_to_icd9_gem[icd10_to_icd9_gem['icd10cm'].isin(icd10_codes)]
     # Get the unique corresponding ICD-9 codes
     icd9_codes = mapped_rows['icd9cm'].unique().tolist()
-    
+
     return icd9_codes
 
 
 def parse_codes(raw_codes: list[str]) -> list[str]:
-    clean_codes = [c.replace('.', '') for c in raw_codes]
-    return clean_codes
\ No newline at end of file
+    with profiler.span("parse_codes", rows=len(raw_codes)):
+        clean_codes = [c.replace('.', '') for c in raw_codes]
+    return clean_codes
+
+
+@functools.lru_cache(maxsize=1)
+def icd_vocabulary() -> dict:
+    """Known codes per system: ICD-9 from the description file, ICD-10-CM from the GEM."""
+    icd9 = pd.read_csv(
+        os.path.join(FILES_DIR, "icd9_diagnosis_codes.csv"),
+        dtype=str,
+        encoding="utf-8-sig",
+        usecols=[0],
+    ).iloc[:, 0]
+    gem = pd.read_csv(
+        os.path.join(FILES_DIR, "icd10cmtoicd9gem.csv"), dtype=str, usecols=["icd10cm", "icd9cm"]
+    )
+    return {
+        "icd9": frozenset(icd9.str.strip()) | frozenset(gem["icd9cm"]) - {"NoDx"},
+        "icd10": frozenset(gem["icd10cm"]),
+    }
+
+
+def normalize_code(code) -> str:
+    return str(code).strip().replace(".", "").upper()
+
+
+def validate_codes(codes: dict) -> tuple[dict, dict]:
+    """Split {"icd9": [...], "icd10": [...]} into (valid, invalid) against icd_vocabulary."""
+    vocab = icd_vocabulary()
+    valid, invalid = {}, {}
+    for system in ("icd9", "icd10"):
+        normalized = list(dict.fromkeys(normalize_code(c) for c in codes.get(system, []) if c))
+        valid[system] = [c for c in normalized if c in vocab[system]]
+        invalid[system] = [c for c in normalized if c not in vocab[system]]
+    return valid, invalid
+
+
+def code_suggestions(system: str, code: str, limit: int = 8) -> list[str]:
+    """Known codes that refine an invalid (e.g. non-billable category) code."""
+    code = normalize_code(code)
+    return sorted(c for c in icd_vocabulary()[system] if c.startswith(code))[:limit]
@@ -0,0 +1,614 @@
+"""
+Refinement loop around generate_hypotheses.
+
+Serial mode (run_refinement):
+    propose (LLM) -> evaluate (flag, series, Chow) -> judge -> repeat until no
+    artificial break or max_iterations.
+
+Both modes first look the concept up in the mapping registry: an accepted
+mapping for the same concept and dataset is returned without LLM calls, and
+accepted mappings of related concepts steer the first proposal. New accepted
+mappings are registered with their daily series.
+
+Speculative mode (run_speculative_refinement):
+    each round issues k differently-steered proposals at once (threads, the LLM
+    calls are I/O bound), evaluates them on a process pool attached zero-copy to
+    a SharedClaims store, and continues from the best one. All k attempts go into
+    the history so the next prompt knows what was already tried.
+
+Both modes checkpoint every proposal and evaluated result to utils.run_checkpoint
+(keyed by run_id); resume_refinement continues a run that died midway from its
+last completed iteration without repeating LLM calls or evaluations.
+
+A SearchBudget (budget=..., default config["budget"]) bounds wall time, LLM
+calls and evaluations and stops on stalled scores; the best-so-far result is
+returned with the budget summary under result["budget"].
+"""
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pandas as pd
+
+from utils.mapping_registry import mapping_registry
+from utils.run_checkpoint import new_run_id, run_checkpoint
+from utils.profiler import profiler
+from time_series_evaluator.evaluation_cache import (
+    canonical_codes,
+    dataset_fingerprint,
+    evaluation_cache,
+    source_fingerprint,
+)
+from time_series_evaluator.create_time_series import (
+    claim_flags,
+    partitioned_daily_counts,
+    timeseries_from_daily_counts,
+)
+from time_series_evaluator.hypothesis_evaluator import WINDOW_SIZE, evaluate_hypothesis
+from time_series_evaluator.incremental_series import IncrementalSeriesEvaluator
+from time_series_evaluator.shared_claims import SharedClaims
+from .hypothesis_generator import generate_hypotheses
+from .search_budget import SearchBudget
+
+# (temperature, emphasis) pairs used to diversify speculative proposals
+SPECULATIVE_VARIANTS = [
+    (0.2, ""),
+    (
+        0.7,
+        "Focus on codes that may be MISSING, especially ICD-10 codes that one ICD-9 code was split into.",
+    ),
+    (
+        0.7,
+        "Focus on codes that should be REMOVED because they are rarely used in real clinical coding.",
+    ),
+    (1.0, "Propose the mapping an experienced claims analyst would use in practice."),
+]
+
+
+# ---------- Judging ----------
+
+
+def judge_break(break_analysis: dict, alpha: float = 0.05, max_level_change: float = 0.1):
+    """
+    Decide whether the ICD transition introduced an artificial break.
+
+    On 364-day rolling sums the Chow p-value is ~0 for almost any series, so a
+    break only counts as artificial when it is significant AND the level after the
+    transition year differs from the level before it by more than max_level_change.
+    When break_analysis carries a model test (the daily count model of
+    BreakDetector(count_model=...) or the ITSA backend), its joint level/slope
+    test and level change decide instead.
+    Returns (artificial_break, artificial_slope, comment).
+    """
+    test = _model_test(break_analysis)
+    if test:
+        return _judge_model_test(test, alpha, max_level_change)
+
+    segments = break_analysis.get("segments") or []
+    F = break_analysis.get("global_chow_F")
+    p = break_analysis.get("global_chow_p")
+    if len(segments) < 2 or F is None:
+        return False, 0.0, "Not enough data around the ICD transition to test for a break."
+
+    pre, post = segments[0], segments[-1]
+    level_change = (post["mean_value"] - pre["mean_value"]) / (abs(pre["mean_value"]) + 1e-10)
+    transition_slope = float(segments[1]["slope"]) if len(segments) > 2 else float(post["slope"])
+    significant = p is not None and p < alpha
+    artificial = bool(significant and abs(level_change) > max_level_change)
+
+    direction = "drops" if level_change < 0 else "rises"
+    comment = (
+        f"Global Chow F={F:.1f} (p={p:.3g}). Level {direction} by {abs(level_change):.0%} "
+        f"from before the transition to after it; transition-year slope {transition_slope:+.1f}/yr. "
+    )
+    if artificial:
+        comment += (
+            "Likely an artificial break: codes are missing on one side of the mapping"
+            if level_change < 0
+            else "Likely an artificial break: the ICD-10 side includes codes that are too broad"
+        )
+    else:
+        comment += "No artificial break: the mapping looks continuous across the transition."
+    return artificial, transition_slope, comment
+
+
+def _model_test(break_analysis: dict) -> dict:
+    """Count-model or ITSA test results, if present and usable."""
+    for key in ("count_model", "itsa"):
+        test = break_analysis.get(key) or {}
+        if test.get("break_p") is not None:
+            return test
+    return {}
+
+
+def _judge_model_test(test: dict, alpha: float, max_level_change: float):
+    """judge_break on detect_breaks_daily / ITSADetector results."""
+    level_change = float(test["level_change"])
+    slope_change = float(test["slope_change"])
+    artificial = bool(test["break_p"] < alpha and abs(level_change) > max_level_change)
+    direction = "drops" if level_change < 0 else "rises"
+    comment = (
+        f"{test.get('family') or test.get('model')} model: level/slope change "
+        f"p={test['break_p']:.3g}. Level {direction} by {abs(level_change):.0%} "
+        f"across the ICD transition; slope change {slope_change:+.2f}/yr. "
+    )
+    if artificial:
+        comment += (
+            "Likely an artificial break: codes are missing on one side of the mapping"
+            if level_change < 0
+            else "Likely an artificial break: the ICD-10 side includes codes that are too broad"
+        )
+    else:
+        comment += "No artificial break: the mapping looks continuous across the transition."
+    return artificial, slope_change, comment
+
+
+def _score(break_analysis: dict) -> float:
+    """Break test statistic (lower is smoother): model test if present, else global Chow F."""
+    test = _model_test(break_analysis)
+    if test:
+        return float(test["break_stat"])
+    F = break_analysis.get("global_chow_F")
+    return float(F) if F is not None else 0.0
+
+
+def _package(evaluation: dict, iteration: int, alpha: float, max_level_change: float) -> dict:
+    artificial, slope, comment = judge_break(
+        evaluation["break_analysis"], alpha=alpha, max_level_change=max_level_change
+    )
+    return {
+        **evaluation,
+        "iteration": iteration,
+        "score": _score(evaluation["break_analysis"]),
+        "artificial_break": artificial,
+        "artificial_slope": slope,
+        "comment": comment,
+    }
+
+
+def _history_entry(result: dict) -> dict:
+    h = result["hypothesis"]
+    return {
+        "hypothesis": {
+            "icd9": sorted(h["icd9_codes"]),
+            "icd10": sorted(h["icd10_codes"]),
+        },
+        "artificial_slope": result["artificial_slope"],
+        "comment": result["comment"],
+    }
+
+
+# ---------- Registry ----------
+
+
+def _from_registry(entry: dict, registry, config: dict) -> dict:
+    """Result for an accepted mapping, time series rebuilt from its cached daily counts."""
+    ts, rolling_col = None, None
+    series = registry.series(entry["id"])
+    if series is not None:
+        start_date, flag_daily, all_daily = series
+        ts = timeseries_from_daily_counts(
+            flag_daily,
+            all_daily,
+            start_date,
+            config["date_colname"],
+            "flag_registered_mapping",
+            cap_year=config.get("cap_year"),
+        )
+        rolling_col = f"flag_count{WINDOW_SIZE}"
+    print(f"🗂️  Served '{entry['concept']}' from the mapping registry.")
+    return {
+        **entry,
+        "timeseries": ts,
+        "rolling_col": rolling_col,
+        "iteration": None,
+        "registry_hit": True,
+    }
+
+
+def _fingerprint(claims_df: pd.DataFrame, config: dict) -> str:
+    """dataset_fingerprint over the columns the evaluation reads (one pass)."""
+    with profiler.span("dataset_fingerprint", rows=len(claims_df)):
+        return dataset_fingerprint(
+            claims_df, [config["date_colname"]] + list(config["target_colnames"])
+        )
+
+
+def _dataset_keys(claims_df: pd.DataFrame, config: dict):
+    """
+    (registry key, dataset fingerprint or None). The registry key is the file
+    fingerprint load_claims recorded on claims_df when there is one, so a repeat
+    request is served without hashing the claims; callers then compute the full
+    fingerprint on a registry miss only.
+    """
+    key = source_fingerprint(claims_df)
+    if key:
+        return key, None
+    fingerprint = _fingerprint(claims_df, config)
+    return fingerprint, fingerprint
+
+
+def _registry_start(registry, user_input_desc: str, registry_key: str):
+    """(accepted entry or None, seed emphasis for the first proposal)."""
+    if registry is None:
+        return None, ""
+    entry = registry.lookup(user_input_desc, registry_key)
+    if entry and not entry["artificial_break"]:
+        return entry, ""
+    return None, registry.seed_emphasis(user_input_desc)
+
+
+def _register(registry, user_input_desc, best, history, claims_df, config, registry_key):
+    """Store an accepted best result with the daily counts its evaluation built."""
+    if registry is None or not best or best["artificial_break"]:
+        return
+    daily = best.get("daily_counts")
+    if daily is None:
+        # results checkpointed before evaluations carried their counts
+        h = best["hypothesis"]
+        codes = list(h["icd9_codes"]) + list(h["icd10_codes"])
+        cols = [c for c in config["target_colnames"] if c in claims_df.columns]
+        daily = partitioned_daily_counts(
+            claims_df[config["date_colname"]],
+            claim_flags(claims_df, codes, cols),
+            workers=1,
+            partitions=1,
+        )
+    registry.save(user_input_desc, best, history, registry_key, daily)
+
+
+# ---------- Checkpoints ----------
+
+
+def _open_run(checkpoint, run_id, user_input_desc, fingerprint, mode, params):
+    """(run_id, prompt state, completed results) of a new or resumed run."""
+    if checkpoint is None:
+        return None, {}, []
+    run_id = run_id or new_run_id()
+    run = checkpoint.open_run(run_id, user_input_desc, fingerprint, mode, params)
+    state = run["state"]
+    done_rounds = state.get("rounds_done", 0)
+    results = [
+        s["result"]
+        for s in checkpoint.steps(run_id)
+        if s["round"] < done_rounds and s["result"] is not None
+    ]
+    return run_id, state, results
+
+
+def _stored_steps(checkpoint, run_id, round_: int) -> dict:
+    """{slot: step} already checkpointed for a round (empty without a checkpoint)."""
+    if checkpoint is None:
+        return {}
+    return {s["slot"]: s for s in checkpoint.steps(run_id, round_)}
+
+
+def _save_round(checkpoint, run_id, history, seed, rounds_done, done):
+    if checkpoint is not None:
+        checkpoint.save_state(
+            run_id,
+            {"history": history, "seed": seed, "rounds_done": rounds_done, "done": done},
+        )
+
+
+def _save_timings(checkpoint, run_id, iteration, per_round=False):
+    """Stage timings of one iteration (or speculative round) to the run record
+    (when profiling)."""
+    if checkpoint is not None and profiler.enabled:
+        records = [r for r in profiler.records() if r["iteration"] == iteration]
+        save = checkpoint.save_round_timings if per_round else checkpoint.save_timings
+        save(run_id, iteration, records)
+
+
+def _finish_run(checkpoint, run_id, best, budget):
+    if best:
+        best["budget"] = budget.summary()
+    if checkpoint is not None:
+        checkpoint.finish(
+            run_id,
+            best.get("iteration") if best else None,
+            best=best,
+            timings=profiler.summary() if profiler.enabled else None,
+        )
+
+
+def resume_refinement(
+    run_id: str, claims_df: pd.DataFrame, config: dict, checkpoint=run_checkpoint, **kwargs
+) -> dict:
+    """Continue a checkpointed run with the settings it was started with (kwargs override)."""
+    run = checkpoint.run(run_id)
+    if run is None:
+        raise KeyError(f"No checkpointed refinement run '{run_id}'.")
+    loop = run_speculative_refinement if run["mode"] == "speculative" else run_refinement
+    return loop(
+        run["concept"],
+        claims_df,
+        config,
+        run_id=run_id,
+        checkpoint=checkpoint,
+        **{**run["params"], **kwargs},
+    )
+
+
+# ---------- Serial loop ----------
+
+
+def run_refinement(
+    user_input_desc: str,
+    claims_df: pd.DataFrame,
+    config: dict,
+    max_iterations: int = 5,
+    detector=None,
+    cache=evaluation_cache,
+    alpha: float = 0.05,
+    max_level_change: float = 0.1,
+    registry=mapping_registry,
+    run_id: str = None,
+    checkpoint=run_checkpoint,
+    budget: SearchBudget = None,
+) -> dict:
+    """One proposal per iteration. Returns the best result (see _package).
+    detector=None uses config["scoring_backend"] (see scoring_backend);
+    registry=None skips the mapping registry. run_id names the checkpointed run
+    (new id if None; an existing id resumes it); checkpoint=None disables checkpoints.
+    budget=None uses SearchBudget.from_config(config)."""
+    budget = (budget or SearchBudget.from_config(config)).start()
+    registry_key, fingerprint = _dataset_keys(claims_df, config)
+    entry, seed = _registry_start(registry, user_input_desc, registry_key)
+    if entry:
+        return _from_registry(entry, registry, config)
+    fingerprint = fingerprint or _fingerprint(claims_df, config)
+    run_id, state, results = _open_run(
+        checkpoint,
+        run_id,
+        user_input_desc,
+        fingerprint,
+        "serial",
+        {"max_iterations": max_iterations, "alpha": alpha, "max_level_change": max_level_change},
+    )
+    history = state.get("history", [])
+    seed = state.get("seed", seed)
+    prev_results = results[-1] if results else {}
+    # skipped iterations leave no result, so resume from the rounds counter
+    first_iteration = state.get("rounds_done", len(results))
+    # successive proposals differ by a few codes: update the series instead of rescanning
+    evaluator = IncrementalSeriesEvaluator(
+        claims_df,
+        config["target_colnames"],
+        config["date_colname"],
+        cap_year=config.get("cap_year"),
+    )
+    for i in range(first_iteration, 0 if state.get("done") else max_iterations):
+        step = _stored_steps(checkpoint, run_id, i).get(0)
+        if budget.stop_reason(llm_calls=0 if step else 1, evaluations=0 if step else 1):
+            break
+        profiler.set_iteration(i)
+        print(f"\n--- Refinement iteration {i} ---")
+        budget.begin_step()
+        if step and step["result"] is not None:
+            result = step["result"]
+        else:
+            if step:
+                hypothesis = step["hypothesis"]
+            else:
+                budget.charge_llm()
+                hypothesis = generate_hypotheses(
+                    history, prev_results, user_input_desc, emphasis=seed if i == 0 else ""
+                )
+                if hypothesis is None:
+                    budget.end_step()
+                    _save_round(checkpoint, run_id, history, seed, i + 1, False)
+                    continue
+                if checkpoint is not None:
+                    checkpoint.save_proposal(run_id, i, 0, hypothesis)
+            budget.charge_evaluation()
+            evaluation = evaluate_hypothesis(
+                claims_df,
+                hypothesis,
+                config,
+                detector,
+                cache,
+                fingerprint=fingerprint,
+                evaluator=evaluator,
+            )
+            result = _package(evaluation, i, alpha, max_level_change)
+            if checkpoint is not None:
+                checkpoint.save_result(run_id, i, 0, result)
+        budget.end_step()
+        budget.record(result["score"], result["artificial_break"])
+        print(f"  {result['comment']}")
+        results.append(result)
+        history.append(_history_entry(result))
+        prev_results = result
+        _save_round(checkpoint, run_id, history, seed, i + 1, not result["artificial_break"])
+        _save_timings(checkpoint, run_id, i)
+        if not result["artificial_break"]:
+            break
+    profiler.set_iteration(None)
+    best = select_best(results)
+    _register(registry, user_input_desc, best, history, claims_df, config, registry_key)
+    _finish_run(checkpoint, run_id, best, budget)
+    return best
+
+
+def select_best(results: list[dict]) -> dict:
+    """Prefer mappings without an artificial break, then the lowest score."""
+    if not results:
+        return {}
+    return min(results, key=lambda r: (bool(r.get("artificial_break")), r["score"]))
+
+
+# ---------- Speculative loop ----------
+
+# Per-worker state: the attached claims store plus evaluation settings.
+_WORKER_STATE = {}
+
+
+def _init_worker(state: dict):
+    _WORKER_STATE.update(state)
+    _WORKER_STATE["store"] = SharedClaims.attach(state["handle"])
+
+
+def _evaluate_in_worker(hypothesis: dict) -> dict:
+    s = _WORKER_STATE
+    return evaluate_hypothesis(
+        None,
+        hypothesis,
+        s["config"],
+        s["detector"],
+        s["cache"],
+        fingerprint=s["fingerprint"],
+        evaluator=s["store"],
+    )
+
+
+def _propose(history, prev_results, user_input_desc, variant, seed=""):
+    temperature, emphasis = variant
+    emphasis = "\n".join(e for e in (emphasis, seed) if e)
+    return generate_hypotheses(
+        history, prev_results, user_input_desc, temperature=temperature, emphasis=emphasis
+    )
+
+
+def run_speculative_refinement(
+    user_input_desc: str,
+    claims_df: pd.DataFrame,
+    config: dict,
+    k: int = 3,
+    max_rounds: int = 3,
+    workers: int = None,
+    detector=None,
+    cache=evaluation_cache,
+    alpha: float = 0.05,
+    max_level_change: float = 0.1,
+    registry=mapping_registry,
+    run_id: str = None,
+    checkpoint=run_checkpoint,
+    budget: SearchBudget = None,
+) -> dict:
+    """k concurrent proposals per round, evaluated in parallel; continue from the best.
+    run_id / checkpoint / budget as in run_refinement (one checkpoint step per proposal,
+    budget checked between rounds)."""
+    budget = (budget or SearchBudget.from_config(config)).start()
+    variants = [SPECULATIVE_VARIANTS[j % len(SPECULATIVE_VARIANTS)] for j in range(k)]
+    registry_key, fingerprint = _dataset_keys(claims_df, config)
+    entry, seed = _registry_start(registry, user_input_desc, registry_key)
+    if entry:
+        return _from_registry(entry, registry, config)
+    fingerprint = fingerprint or _fingerprint(claims_df, config)
+    run_id, state, results = _open_run(
+        checkpoint,
+        run_id,
+        user_input_desc,
+        fingerprint,
+        "speculative",
+        {"k": k, "max_rounds": max_rounds, "alpha": alpha, "max_level_change": max_level_change},
+    )
+    history = state.get("history", [])
+    seed = state.get("seed", seed)
+    first_round = state.get("rounds_done", 0)
+    # best of the last round that produced results (rounds with no usable proposal have none)
+    last_round = max((r.get("round", -1) for r in results), default=-1)
+    prev_results = select_best([r for r in results if r.get("round") == last_round])
+    iteration = len(results)
+    store = SharedClaims.create(
+        claims_df,
+        config["target_colnames"],
+        date_col=config["date_colname"],
+        cap_year=config.get("cap_year"),
+    )
+    worker_state = {
+        "handle": store.handle(),
+        "config": config,
+        "detector": detector,
+        "cache": cache,
+        "fingerprint": fingerprint,
+    }
+
+    with store, ThreadPoolExecutor(max_workers=k) as llm_pool, ProcessPoolExecutor(
+        max_workers=workers or k, initializer=_init_worker, initargs=(worker_state,)
+    ) as eval_pool:
+        for r in range(first_round, 0 if state.get("done") else max_rounds):
+            steps = _stored_steps(checkpoint, run_id, r)
+            missing = [j for j in range(k) if j not in steps]
+            if budget.stop_reason(llm_calls=len(missing), evaluations=1):
+                break
+            profiler.set_iteration(r)
+            print(f"\n--- Speculative round {r}: {k} proposals ---")
+            budget.begin_step()
+            budget.charge_llm(len(missing))
+            with profiler.span("speculative.propose", rows=len(missing)):
+                proposals = list(
+                    llm_pool.map(
+                        lambda j: _propose(
+                            history,
+                            prev_results,
+                            user_input_desc,
+                            variants[j],
+                            seed if r == 0 else "",
+                        ),
+                        missing,
+                    )
+                )
+            for j, h in zip(missing, proposals):
+                if h is None:
+                    continue
+                steps[j] = {"hypothesis": h, "result": None}
+                if checkpoint is not None:
+                    checkpoint.save_proposal(run_id, r, j, h)
+            if not steps:
+                print("  No usable proposal this round.")
+                budget.end_step()
+                _save_round(checkpoint, run_id, history, seed, r + 1, False)
+                continue
+
+            # identical code sets are evaluated once
+            unique = {}
+            for j in sorted(steps):
+                h = steps[j]["hypothesis"]
+                key = (
+                    tuple(canonical_codes(h["icd9_codes"])),
+                    tuple(canonical_codes(h["icd10_codes"])),
+                )
+                unique.setdefault(key, j)
+            pending = [j for j in unique.values() if steps[j]["result"] is None]
+            budget.charge_evaluation(len(pending))
+            with profiler.span("speculative.evaluate", rows=len(pending)):
+                evaluations = list(
+                    eval_pool.map(_evaluate_in_worker, [steps[j]["hypothesis"] for j in pending])
+                )
+            for j, evaluation in zip(pending, evaluations):
+                result = _package(evaluation, iteration, alpha, max_level_change)
+                result["round"] = r
+                iteration += 1
+                steps[j]["result"] = result
+                if checkpoint is not None:
+                    checkpoint.save_result(run_id, r, j, result)
+
+            round_results = []
+            for j in unique.values():
+                result = steps[j]["result"]
+                print(
+                    f"  [{result['iteration']}] score={result['score']:.1f} "
+                    f"artificial={result['artificial_break']}"
+                )
+                round_results.append(result)
+            results.extend(round_results)
+            budget.end_step()
+
+            best = select_best(round_results)
+            # best goes last: generate_hypotheses reads history[-1] as the current mapping
+            for result in round_results:
+                if result is not best:
+                    history.append(_history_entry(result))
+            history.append(_history_entry(best))
+            prev_results = best
+            budget.record(best["score"], best["artificial_break"])
+            _save_round(checkpoint, run_id, history, seed, r + 1, not best["artificial_break"])
+            _save_timings(checkpoint, run_id, r, per_round=True)
+            if not best["artificial_break"]:
+                break
+    profiler.set_iteration(None)
+    best = select_best(results)
+    _register(registry, user_input_desc, best, history, claims_df, config, registry_key)
+    _finish_run(checkpoint, run_id, best, budget)
+    return best
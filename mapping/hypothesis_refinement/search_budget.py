@@ -0,0 +1,117 @@
+"""
+Budget and early termination for the refinement loops.
+
+A SearchBudget bounds one run by
+  - wall time (max_seconds): a new iteration / round only starts when the
+    slowest one so far still fits in the time left, so latency stays under
+    max_seconds plus the LLM timeout;
+  - LLM calls (max_llm_calls): proposals requested from generate_hypotheses;
+  - compute (max_evaluations): hypothesis evaluations (claims scans);
+  - stalls (patience): stop after `patience` consecutive iterations whose score
+    (global Chow F for the default backend, see refinement_loop._score) is not
+    at least min_improvement (relative) below the best score so far.
+
+The loops stop at the first exhausted limit and return the best-so-far result
+with summary() under result["budget"]. Limits left as None are not enforced.
+"""
+
+import time
+
+
+class SearchBudget:
+    """Wall-time, LLM-call, evaluation and stall limits for one refinement run."""
+
+    def __init__(
+        self,
+        max_seconds: float = None,
+        max_llm_calls: int = None,
+        max_evaluations: int = None,
+        patience: int = None,
+        min_improvement: float = 0.05,
+    ):
+        self.max_seconds = max_seconds
+        self.max_llm_calls = max_llm_calls
+        self.max_evaluations = max_evaluations
+        self.patience = patience
+        self.min_improvement = float(min_improvement)
+        self.start()
+
+    @classmethod
+    def from_config(cls, config: dict) -> "SearchBudget":
+        """Budget from config["budget"] (see get_input); unlimited if absent."""
+        return cls(**(config.get("budget") or {}))
+
+    def start(self) -> "SearchBudget":
+        self.started = time.perf_counter()
+        self.llm_calls = 0
+        self.evaluations = 0
+        self.best_score = None
+        self.stalled = 0
+        self.slowest_step = 0.0
+        self._step_started = self.started
+        self.reason = None
+        return self
+
+    # ---------- Accounting ----------
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def charge_llm(self, n: int = 1) -> None:
+        self.llm_calls += n
+
+    def charge_evaluation(self, n: int = 1) -> None:
+        self.evaluations += n
+
+    def begin_step(self) -> None:
+        self._step_started = time.perf_counter()
+
+    def end_step(self) -> None:
+        """Close the iteration / round timer; the slowest one predicts the next."""
+        self.slowest_step = max(self.slowest_step, time.perf_counter() - self._step_started)
+
+    def record(self, score: float, artificial_break: bool = True) -> None:
+        """Track the best score; a result without an artificial break resets the stall count."""
+        score = float(score)
+        if self.best_score is None or not artificial_break:
+            improved = True
+        else:
+            improved = score < self.best_score * (1 - self.min_improvement)
+        self.stalled = 0 if improved else self.stalled + 1
+        if self.best_score is None or score < self.best_score:
+            self.best_score = score
+
+    # ---------- Decisions ----------
+
+    def stop_reason(self, llm_calls: int = 1, evaluations: int = 1):
+        """Why the next step (needing llm_calls / evaluations) must not start, else None."""
+        reason = None
+        if self.max_seconds is not None and self.elapsed() + self.slowest_step > self.max_seconds:
+            reason = f"wall time ({self.elapsed():.1f}s of {self.max_seconds:g}s used)"
+        elif self.max_llm_calls is not None and self.llm_calls + llm_calls > self.max_llm_calls:
+            reason = f"LLM calls ({self.llm_calls} of {self.max_llm_calls} used)"
+        elif self.max_evaluations is not None and self.evaluations + evaluations > self.max_evaluations:
+            reason = f"evaluations ({self.evaluations} of {self.max_evaluations} used)"
+        elif self.patience is not None and self.stalled >= self.patience:
+            reason = f"no score improvement in {self.stalled} iterations"
+        if reason:
+            self.reason = reason
+            print(f"⏱️  Stopping refinement early: {reason}.")
+        return reason
+
+    def summary(self) -> dict:
+        return {
+            "elapsed_seconds": self.elapsed(),
+            "llm_calls": self.llm_calls,
+            "evaluations": self.evaluations,
+            "best_score": self.best_score,
+            "stalled_iterations": self.stalled,
+            "stop_reason": self.reason,
+            "limits": {
+                "max_seconds": self.max_seconds,
+                "max_llm_calls": self.max_llm_calls,
+                "max_evaluations": self.max_evaluations,
+                "patience": self.patience,
+                "min_improvement": self.min_improvement,
+            },
+        }
@@ -3,16 +3,22 @@ import os
 from dotenv import load_dotenv
 from google.genai import types
 import time
+from typing import Optional
 import google.api_core.exceptions
 
 # Load environment variables from .env file at the project root
 load_dotenv()
 
 
-def prompt_llm(prompt: str):
+def prompt_llm(
+    prompt: str, temperature: Optional[float] = None, response_schema: Optional[dict] = None
+):
     """
     Prompts the Gemini model, with Google Search enabled for grounding.
     Includes exponential backoff to handle API rate limits.
+    temperature: sampling temperature; None keeps the model default.
+    response_schema: JSON schema for a constrained JSON response. The model does
+    not combine it with tools, so schema calls run without Google Search.
     """
     api_key = os.environ.get("GEMINI_API_KEY")
     if not api_key:
@@ -24,8 +30,17 @@ def prompt_llm(prompt: str):
         print(f"PROMPT: {prompt}")  # Print a snippet of the prompt
 
     client = genai.Client(api_key=api_key)
-    grounding_tool = types.Tool(google_search=types.GoogleSearch())
-    config = types.GenerateContentConfig(tools=[grounding_tool])
+    if response_schema is not None:
+        config = types.GenerateContentConfig(
+            temperature=temperature,
+            response_mime_type="application/json",
+            response_schema=response_schema,
+        )
+    else:
+        grounding_tool = types.Tool(google_search=types.GoogleSearch())
+        config = types.GenerateContentConfig(
+            tools=[grounding_tool], temperature=temperature
+        )
 
     # catch too many retries so it doesn't crash
     retries = 3
@@ -0,0 +1,168 @@
+"""
+Compact prompt construction for get_concept / refinement rounds.
+
+- The fixed task instructions are one byte-identical prefix (static_prefix), so
+  every call shares it and the provider's prefix cache can reuse it; only the
+  concept and the round-specific block follow it.
+- Refinement history is sent as the current mapping in full plus, for each
+  earlier attempt, only its diff against the attempt after it and a one-line
+  break summary, newest first.
+- estimate_tokens caps that block at a token budget: older attempts are dropped
+  first, so late rounds cost about the same as early ones.
+- reask_prompt is the short follow-up for codes that failed validation: only
+  the invalid codes (with known refinements) are sent back, not the task.
+- retry_prompt re-sends the whole task with the reason the previous reply was
+  rejected (unparseable, or no valid code at all).
+"""
+
+import functools
+import math
+import re
+
+DEFAULT_HISTORY_BUDGET = 400  # tokens
+
+
+@functools.lru_cache(maxsize=2)
+def static_prefix(search: bool = True) -> str:
+    """Instructions shared by every mapping prompt (kept identical across calls).
+    search=False drops the web search instruction for calls without grounding."""
+    return """ACADEMIC RESEARCH TASK - ICD Code Mapping Exercise
+This is for research purposes only - NOT medical advice or diagnosis.
+Task: Map the given medical terms to their corresponding ICD-9 and ICD-10 codes for data analysis purposes.
+Please provide a comprehensive mapping including all relevant conditions, subtypes, complications, and related medical terminology found in standard ICD coding manuals.
+We expect there to be generally more identified ICD10 codes than ICD9 since there's usually a many-to-one relationship from ICD10 to ICD9.
+If there is a problematic mapping, don't change it entirely. Iteratively refine the mapping.
+It's entirely plausible that the culprit is 1 or 2 individual codes that aren't used in the real clinical context.
+""" + ("Search the web to supplement your responses.\n" if search else "") + """
+Respond with ONLY this JSON object:
+{"icd9": ["code1", "code2", ...], "icd10": ["code1", "code2", ...]}
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count without a tokenizer: ~4 characters or ~0.75 words per token."""
+    if not text:
+        return 0
+    words = len(re.findall(r"\w+|[^\w\s]", text))
+    return max(math.ceil(len(text) / 4), math.ceil(words * 0.75))
+
+
+def summarize_break(entry: dict) -> str:
+    """One-line summary of a history entry's judge_break comment."""
+    comment = entry.get("comment") or ""
+    level = re.search(r"Level (drops|rises) by (\d+%)", comment)
+    parts = [f"level {level.group(1)} {level.group(2)}"] if level else []
+    slope = entry.get("artificial_slope")
+    if slope is not None:
+        parts.append(f"slope {float(slope):+.1f}/yr")
+    if "codes are missing" in comment:
+        parts.append("break: codes missing")
+    elif "too broad" in comment:
+        parts.append("break: ICD-10 side too broad")
+    elif "No artificial break" in comment:
+        parts.append("no break")
+    return ", ".join(parts) if parts else comment[:100]
+
+
+def _codes(entry: dict, system: str) -> set:
+    return set(entry["hypothesis"].get(system, []))
+
+
+def _diff(older: dict, newer: dict) -> str:
+    """Changes that turn `newer` back into `older`, per coding system."""
+    parts = []
+    for system, label in (("icd9", "ICD9"), ("icd10", "ICD10")):
+        old, new = _codes(older, system), _codes(newer, system)
+        changes = [f"+{c}" for c in sorted(old - new)] + [f"-{c}" for c in sorted(new - old)]
+        if changes:
+            parts.append(f"{label} {' '.join(changes)}")
+    return "; ".join(parts) or "same codes"
+
+
+def history_block(history: list[dict], budget_tokens: int = DEFAULT_HISTORY_BUDGET) -> str:
+    """
+    Current mapping in full, then earlier attempts as diffs (newest first) within
+    budget_tokens. history entries: {"hypothesis": {"icd9", "icd10"}, "artificial_slope",
+    "comment"} as built by the refinement loop, oldest first.
+    """
+    if not history:
+        return ""
+    current = history[-1]
+    lines = [
+        f"Current mapping (attempt {len(history)}):",
+        f"ICD9: {', '.join(sorted(_codes(current, 'icd9')))}",
+        f"ICD10: {', '.join(sorted(_codes(current, 'icd10')))}",
+        f"Result: {summarize_break(current)}",
+    ]
+    if len(history) > 1:
+        lines.append(
+            "Earlier attempts, each written as the change from the attempt after it "
+            "(apply them in order from the current mapping to recover the code set):"
+        )
+    used = estimate_tokens("\n".join(lines))
+    omitted = 0
+    for j in range(len(history) - 2, -1, -1):
+        line = f"#{j + 1}: {_diff(history[j], history[j + 1])} | {summarize_break(history[j])}"
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget_tokens:
+            omitted = j + 1
+            break
+        lines.append(line)
+        used += cost
+    if omitted:
+        lines.append(f"({omitted} older attempts omitted; none of them worked either.)")
+    return "\n".join(lines)
+
+
+def refinement_prompt(
+    user_input_desc: str,
+    history: list[dict],
+    emphasis: str = "",
+    budget_tokens: int = DEFAULT_HISTORY_BUDGET,
+) -> str:
+    """Supplementary prompt for an artificial-break round (replaces the raw history dump)."""
+    return "\n".join(
+        part
+        for part in (
+            f'Previous mappings for "{user_input_desc}" show an artificial break at the ICD transition. '
+            "DO NOT repeat any code set below.",
+            history_block(history, budget_tokens),
+            "Propose a new mapping by adding or removing the few codes the results point to.",
+            emphasis,
+        )
+        if part
+    )
+
+
+def concept_prompt(user_input_desc: str, supplementary_prompt: str = "", search: bool = True) -> str:
+    """Full get_concept prompt: static prefix, then the concept and round-specific text."""
+    tail = f'Medical terminology: "{user_input_desc}"\n'
+    if supplementary_prompt:
+        tail += supplementary_prompt.strip() + "\n"
+    return static_prefix(search) + "\n" + tail + "Begin mapping analysis:"
+
+
+def retry_prompt(prompt: str, error: str) -> str:
+    """The original prompt again, with why its previous reply was rejected."""
+    return (
+        f"{prompt}\n\nYour previous reply was rejected: {error}\n"
+        'Reply with ONLY the JSON object {"icd9": [...], "icd10": [...]} of valid billable codes.'
+    )
+
+
+def reask_prompt(user_input_desc: str, invalid: dict, suggestions: dict) -> str:
+    """Targeted follow-up asking to replace only the codes that are not in the vocabulary."""
+    lines = [
+        f'For the ICD mapping of "{user_input_desc}", these codes are not valid billable codes:'
+    ]
+    for system, label in (("icd9", "ICD-9"), ("icd10", "ICD-10")):
+        for code in invalid.get(system, []):
+            hint = suggestions.get(system, {}).get(code)
+            lines.append(
+                f"- {label} {code}" + (f" (valid codes under it: {', '.join(hint)})" if hint else "")
+            )
+    lines.append(
+        "Reply with ONLY a JSON object {\"icd9\": [...], \"icd10\": [...]} holding valid billable "
+        "replacement codes for these entries (empty lists where nothing applies)."
+    )
+    return "\n".join(lines)
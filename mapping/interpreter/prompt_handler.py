@@ -1,79 +1,136 @@
+import json
 import sys
 import os
+from typing import Optional
 
 from .llm_client2 import prompt_llm
+from .prompt_builder import concept_prompt, estimate_tokens, reask_prompt, retry_prompt
 
 # Add parent directory to path to import llm_client
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.profiler import profiler
+from hypothesis_refinement.icd_parsing_script import code_suggestions, validate_codes
 
+# Constrained response shape for get_concept and its re-asks
+CODES_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "icd9": {"type": "array", "items": {"type": "string"}},
+        "icd10": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["icd9", "icd10"],
+}
+MAX_REASKS = 2  # targeted follow-ups for invalid codes
+MAX_RETRIES = 1  # full re-asks after an unparseable reply or one with no valid code
+
+
+def structured_output_enabled() -> bool:
+    # ENHA_LLM_STRUCTURED=0 goes back to free text with search grounding
+    return os.environ.get("ENHA_LLM_STRUCTURED", "1") != "0"
 
-def get_concept(user_input_desc: str, supplementary_prompt: str = "") -> dict:
-    # Directly converts user input to relevant ICD codes using LLM.
-    # Returns both medical concepts and ICD codes in one step.
 
-    # Combined prompt that extracts concepts AND suggests ICD codes
-    combined_prompt = f"""ACADEMIC RESEARCH TASK - ICD Code Mapping Exercise
-
-    Medical terminology: "{user_input_desc}"
-    This is for research purposes only - NOT medical advice or diagnosis.
-    Task: Map the given medical terms to their corresponding ICD-9 and ICD-10 codes for data analysis purposes.
-    Please provide a comprehensive mapping including all relevant conditions, subtypes, complications, and related medical terminology found in standard ICD coding manuals.
-    We expect there to be generally more identified ICD10 codes than ICD9 since there's usually a many-to-one relationship from ICD10 to ICD9. 
-    {supplementary_prompt}
-    If there is a problematic mapping, don't change it entirely. Iteratively refine the mapping.
-    It's entirely plausible that the culprit is 1 or 2 individual codes that aren't used in the real clinical context.
-    Search the web to supplement your responses.
-    
-    Respond with ONLY this exact format:
-    ICD9: code1, code2, code3, ...
-    ICD10: code1, code2, code3, ...
-
-    Begin mapping analysis:"""
-
-    response = prompt_llm(combined_prompt)  # New Gemini API
-
-    # Parse the structured response
-    icd9_codes = []
-    icd10_codes = []
-
-    # THIS IS TEMPORARILY COMMENTED OUT TO GO INTO FALLBACK BELOW
-    lines = response.split("\n")
-    for line in lines:
+def _parse_response(response) -> Optional[dict]:
+    """{"icd9": [...], "icd10": [...]} from a JSON or "ICD9: a, b" style response; None if neither."""
+    text = (response or "").strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+    try:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            return {
+                "icd9": [str(c) for c in data.get("icd9") or []],
+                "icd10": [str(c) for c in data.get("icd10") or []],
+            }
+    except json.JSONDecodeError:
+        pass
+
+    codes = {}
+    for line in text.split("\n"):
         line = line.strip()
-        if line.startswith("ICD9:"):
-            icd9_str = line.replace("ICD9:", "").strip()
-            icd9_codes = [c.strip() for c in icd9_str.split(",") if c.strip()]
-        elif line.startswith("ICD10:"):
-            icd10_str = line.replace("ICD10:", "").strip()
-            icd10_codes = [c.strip() for c in icd10_str.split(",") if c.strip()]
-
-    # Fallback if parsing fails
-    if not icd9_codes and not icd10_codes:
-        print("Parsing failed, using fallback...")
-        return {
-            "icd9": [
-                "4250",
-                "42511",
-                "42518",
-                "4252",
-                "4253",
-                "4254",
-                "4255",
-                "4257",
-                "4258",
-                "4259",
-            ],  # Fallback ICD-9
-            "icd10": [
-                "I420",
-                "I421",
-                "I422",
-                "I423",
-                "I424",
-                "I425",
-                "I426",
-                "I427",
-                "I428",
-            ],  # Fallback ICD-10
+        for system, label in (("icd9", "ICD9:"), ("icd10", "ICD10:")):
+            if line.startswith(label):
+                codes[system] = [c.strip() for c in line[len(label):].split(",") if c.strip()]
+    if not codes:
+        return None
+    return {"icd9": codes.get("icd9", []), "icd10": codes.get("icd10", [])}
+
+
+def _ask(prompt: str, temperature: Optional[float]) -> Optional[dict]:
+    schema = CODES_SCHEMA if structured_output_enabled() else None
+    return _parse_response(prompt_llm(prompt, temperature=temperature, response_schema=schema))
+
+
+def _reask_invalid(user_input_desc: str, parsed: dict, temperature: Optional[float]):
+    """(valid codes, codes dropped): parsed validated, invalid codes re-asked up to MAX_REASKS times."""
+    valid, invalid = validate_codes(parsed)
+    for _ in range(MAX_REASKS):
+        if not invalid["icd9"] and not invalid["icd10"]:
+            break
+        print(
+            f"🔁 Re-asking for {len(invalid['icd9']) + len(invalid['icd10'])} invalid codes: "
+            f"{invalid['icd9'] + invalid['icd10']}"
+        )
+        suggestions = {
+            system: {c: code_suggestions(system, c) for c in invalid[system]}
+            for system in ("icd9", "icd10")
         }
+        followup = reask_prompt(user_input_desc, invalid, suggestions)
+        with profiler.span(
+            "get_concept.reask",
+            prompt_chars=len(followup),
+            prompt_tokens=estimate_tokens(followup),
+        ):
+            replacement = _ask(followup, temperature)
+        if replacement is None:
+            break
+        new_valid, invalid = validate_codes(replacement)
+        for system in ("icd9", "icd10"):
+            valid[system] += [c for c in new_valid[system] if c not in valid[system]]
+    return valid, invalid["icd9"] + invalid["icd10"]
+
+
+def get_concept(
+    user_input_desc: str,
+    supplementary_prompt: str = "",
+    temperature: Optional[float] = None,
+) -> dict:
+    # Directly converts user input to relevant ICD codes using LLM.
+    # Returns both medical concepts and ICD codes in one step.
+    # Every returned code is in the local ICD vocabulary; codes that are not get
+    # a short targeted re-ask instead of reaching the claims scan. A reply that
+    # cannot be parsed or has no valid code is re-asked in full with the reason,
+    # MAX_RETRIES times, before raising ValueError.
+
+    # Static instructions first (shared, cacheable prefix), then the concept.
+    # Schema calls run without search grounding, so they skip the search instruction.
+    combined_prompt = concept_prompt(
+        user_input_desc, supplementary_prompt, search=not structured_output_enabled()
+    )
+
+    error = None
+    for attempt in range(MAX_RETRIES + 1):
+        prompt = combined_prompt if error is None else retry_prompt(combined_prompt, error)
+        with profiler.span(
+            "get_concept" if attempt == 0 else "get_concept.retry",
+            prompt_chars=len(prompt),
+            prompt_tokens=estimate_tokens(prompt),
+        ):
+            parsed = _ask(prompt, temperature)
+        if parsed is None:
+            error = "it was not the requested JSON object."
+        else:
+            valid, dropped = _reask_invalid(user_input_desc, parsed, temperature)
+            if dropped:
+                print(f"⚠️ Dropping codes not in the ICD vocabulary: {dropped}")
+            if valid["icd9"] or valid["icd10"]:
+                return valid
+            error = (
+                "none of its codes are valid billable ICD-9-CM / ICD-10-CM codes "
+                f"({', '.join(dropped)})."
+                if dropped
+                else "it listed no codes."
+            )
+        if attempt < MAX_RETRIES:
+            print(f"🔁 Re-asking for '{user_input_desc}': the reply was rejected, {error}")
 
-    return {"icd9": icd9_codes, "icd10": icd10_codes}
+    raise ValueError(f"LLM returned no valid ICD codes for '{user_input_desc}': {error}")
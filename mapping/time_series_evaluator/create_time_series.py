@@ -1,6 +1,13 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
 import numpy as np
 
+from utils.epoch_days import EPOCH_DAY_COL, day_timestamp, epoch_day, from_epoch_days, to_epoch_days
+from utils.profiler import profiler
+from time_series_evaluator.evaluation_cache import file_fingerprint
+
 
 def get_input(user_input: str) -> dict:
     """
@@ -15,6 +22,14 @@ def get_input(user_input: str) -> dict:
         + [f"odiag{n}" for n in range(1, 11)],  # columns from synthetic dataset
         "cap_year": None,
         "data_filepath": "synthetic_claims.csv",
+        "scoring_backend": "chow",  # or "itsa"
+        # refinement limits (see SearchBudget); the UI route times out at 120s
+        "budget": {
+            "max_seconds": 100.0,
+            "max_llm_calls": 10,
+            "max_evaluations": 10,
+            "patience": 2,
+        },
     }
     return result_dict
 
@@ -33,6 +48,120 @@ def clean_data(df: pd.DataFrame, target_colnames: list[str]) -> pd.DataFrame:
     return df
 
 
+def clean_code_values(values) -> pd.Index:
+    """
+    Distinct code values as clean_data strings (stripped of whitespace and edge
+    periods). Numeric cells, e.g. ICD-9 codes parsed as numbers from CSV/Parquet,
+    lose a trailing ".0" so 4254.0 matches "4254". Missing values become "nan".
+    """
+    return pd.Index(
+        [
+            str(int(v)) if isinstance(v, (float, np.floating)) and np.isfinite(v) and float(v).is_integer()
+            else str(v)
+            for v in values
+        ],
+        dtype=object,
+    ).str.strip().str.strip(".")
+
+
+def compact_claims(
+    df: pd.DataFrame, date_col: str, target_colnames: list[str]
+) -> pd.DataFrame:
+    """
+    Memory-lean claims frame with only date_col and the target code columns.
+    - codes: one categorical dtype shared by every code column, cleaned like
+      clean_data but on the distinct values only (int8/16/32 codes per cell);
+    - dates: int32 epoch days (utils.epoch_days), read by every series builder.
+    Returns a new frame; df is not modified.
+    """
+    cols = [c for c in target_colnames if c in df.columns]
+    with profiler.span("compact_claims", rows=len(df)):
+        factorized = {c: pd.factorize(df[c], use_na_sentinel=True) for c in cols}
+        cleaned = {c: clean_code_values(uniques) for c, (_, uniques) in factorized.items()}
+        vocab = sorted(set().union(*cleaned.values()) - {"nan", ""}) if cols else []
+        dtype = pd.CategoricalDtype(vocab)
+
+        dates = df[date_col]
+        if isinstance(dates.dtype, pd.CategoricalDtype):
+            days = to_epoch_days(dates.cat.categories)[dates.cat.codes.to_numpy()]
+        else:
+            days = to_epoch_days(dates)
+        out = {date_col: days}
+        for c in cols:
+            ids, _ = factorized[c]
+            lookup = np.append(dtype.categories.get_indexer(cleaned[c]), -1)
+            out[c] = pd.Categorical.from_codes(lookup[ids], dtype=dtype)
+        compact = pd.DataFrame(out)
+    print(
+        f"Compacted {len(compact)} claims x {len(cols)} code columns "
+        f"({len(vocab)} distinct codes, {compact.memory_usage(deep=True).sum() / 1e6:.1f} MB)."
+    )
+    return compact
+
+
+def load_claims(filepath: str, date_col: str, target_colnames: list[str]) -> pd.DataFrame:
+    """
+    compact_claims straight from a CSV or Parquet file, reading only date_col and
+    the target columns (parsed as categoricals, so no per-cell string objects).
+    """
+    wanted = {date_col, *target_colnames}
+    with profiler.span("load_claims"):
+        if filepath.endswith(".parquet"):
+            import pyarrow.parquet as pq
+
+            columns = [c for c in pq.read_schema(filepath).names if c in wanted]
+            df = pd.read_parquet(filepath, columns=columns)
+        else:
+            df = pd.read_csv(filepath, usecols=lambda c: c in wanted, dtype="category")
+    compact = compact_claims(df, date_col, target_colnames)
+    # cheap dataset key for the mapping registry (see source_fingerprint)
+    compact.attrs["source"] = {
+        "fingerprint": file_fingerprint(filepath, [date_col, *target_colnames]),
+        "rows": len(compact),
+    }
+    return compact
+
+
+def claim_flags(df: pd.DataFrame, codes: list[str], target_colnames: list[str]) -> np.ndarray:
+    """
+    Boolean array: claim has any of codes in target_colnames. Categorical columns
+    are matched on their categories and indexed by code, without string compares.
+    """
+    codes = list(codes)
+    flags = np.zeros(len(df), dtype=bool)
+    hits = {}
+    for col in target_colnames:
+        s = df[col]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            if s.dtype not in hits:
+                hits[s.dtype] = np.append(s.cat.categories.isin(codes), False)
+            flags |= hits[s.dtype][s.cat.codes.to_numpy()]
+        else:
+            flags |= s.isin(codes).to_numpy(dtype=bool)
+    return flags
+
+
+def flagged_daily_counts(
+    df: pd.DataFrame,
+    codes: list[str],
+    target_colnames: list[str],
+    date_col: str,
+    workers: int = None,
+):
+    """
+    partitioned_daily_counts for one code set without copying df or adding a
+    flag column. Returns (start_date, flag_daily, all_daily).
+    """
+    if workers is None:
+        workers = int(os.environ.get("ENHA_TS_WORKERS", "1"))
+    with profiler.span("flag_dataframe", rows=len(df)):
+        flags = claim_flags(df, codes, target_colnames)
+    print(f"    Flagged {int(flags.sum())} claims out of {len(flags)}.")
+    return partitioned_daily_counts(
+        df[date_col], flags, workers=max(1, workers), partitions=None if workers > 1 else 1
+    )
+
+
 def flag_dataframe(
     df: pd.DataFrame,
     codes: list[str],
@@ -44,9 +173,8 @@ def flag_dataframe(
     for the user's target 'category'
     """
     # Flag the category columns
-    df[target_category_colname] = (
-        (df[target_colnames].isin(codes)).any(axis=1).fillna(False)
-    )
+    with profiler.span("flag_dataframe", rows=len(df)):
+        df[target_category_colname] = claim_flags(df, codes, target_colnames)
     flagged_count = df[target_category_colname].sum()
     print(
         f"    Flagged {flagged_count} claims out of {len(df[target_category_colname])}."
@@ -59,6 +187,41 @@ def create_timeseries_function(
     date_col: str,
     target_col: str,
     cap_year: int = 2020,
+    workers: int = None,
+    windows: list[int] = None,
+):
+    """
+    workers: > 1 aggregates daily counts over row partitions on a thread pool
+             (defaults to ENHA_TS_WORKERS, else 1 = original groupby path;
+             int epoch-day dates from compact_claims always use the counts path).
+    windows: e.g. [28, 91, 182, 364] returns every window's rolling counts and
+             rates in one wide frame (see multi_window_timeseries).
+    """
+    if workers is None:
+        workers = int(os.environ.get("ENHA_TS_WORKERS", "1"))
+    with profiler.span("create_timeseries_function", rows=len(df_original)):
+        if windows:
+            start_date, flag_daily, all_daily = partitioned_daily_counts(
+                df_original[date_col], df_original[target_col], workers=max(1, workers)
+            )
+            return multi_window_timeseries(
+                flag_daily, all_daily, start_date, date_col, target_col, windows, cap_year
+            )
+        if workers > 1 or df_original[date_col].dtype.kind in "iu":
+            start_date, flag_daily, all_daily = partitioned_daily_counts(
+                df_original[date_col], df_original[target_col], workers=workers
+            )
+            return timeseries_from_daily_counts(
+                flag_daily, all_daily, start_date, date_col, target_col, cap_year=cap_year
+            )
+        return _create_timeseries(df_original, date_col, target_col, cap_year)
+
+
+def _create_timeseries(
+    df_original: pd.DataFrame,
+    date_col: str,
+    target_col: str,
+    cap_year: int = 2020,
 ):
     # THIS CODE WORKS ALREADY --- DON'T CHANGE
     df_original[date_col] = pd.to_datetime(df_original[date_col])
@@ -108,3 +271,219 @@ def create_timeseries_function(
     # print(f"final cols: {df_return.columns.tolist()}")
 
     return df_return
+
+
+def partitioned_daily_counts(dates, flags, workers: int = 4, partitions: int = None):
+    """
+    Daily flag / all-claims counts, computed per row partition and merged by vector
+    addition. Returns (start_date, flag_daily, all_daily).
+
+    Each partition is two np.bincount calls over int day offsets: all claims,
+    and the claims selected by the boolean flag mask. No per-claim copy is made
+    beyond the int32 day axis (none for int32 epoch-day input), so memory stays
+    at the compact claims size. benchmarks/bench_pipeline.py --scaling-workers
+    measures the speed-up per worker count.
+    """
+    day = to_epoch_days(dates)
+    flags = flags.to_numpy() if isinstance(flags, pd.Series) else np.asarray(flags)
+    if flags.dtype != bool:
+        # missing flags count as unflagged (NaN != 0 would select them)
+        flags = np.nan_to_num(pd.to_numeric(flags)) != 0
+    if len(day) == 0:
+        return None, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    lo = int(day.min())
+    n_days = int(day.max()) - lo + 1
+    partitions = partitions or workers * 4
+    bounds = np.linspace(0, len(day), partitions + 1, dtype=np.int64)
+
+    def count(a, b):
+        d = day[a:b] - np.int32(lo)
+        return (
+            np.bincount(d[flags[a:b]], minlength=n_days),
+            np.bincount(d, minlength=n_days),
+        )
+
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        parts = list(ex.map(count, bounds[:-1], bounds[1:]))
+    flag_daily = np.sum([p[0] for p in parts], axis=0).astype(np.int64)
+    all_daily = np.sum([p[1] for p in parts], axis=0).astype(np.int64)
+    return day_timestamp(lo), flag_daily, all_daily
+
+
+def timeseries_from_daily_counts(
+    flag_daily: np.ndarray,
+    all_daily: np.ndarray,
+    start_date,
+    date_col: str,
+    target_col: str,
+    window_size: int = 364,
+    cap_year: int = None,
+) -> pd.DataFrame:
+    """
+    Same output as create_timeseries_function, from dense daily count vectors
+    (index 0 = start_date, one entry per day) instead of a flagged claims frame.
+    The rolling sums come from one cumulative sum per vector.
+    """
+    return multi_window_timeseries(
+        flag_daily,
+        all_daily,
+        start_date,
+        date_col,
+        target_col,
+        [window_size],
+        cap_year,
+        rates=False,
+    )
+
+
+def daily_counts_frame(
+    flag_daily: np.ndarray,
+    all_daily: np.ndarray,
+    start_date,
+    date_col: str,
+    target_col: str,
+    cap_year: int = None,
+) -> pd.DataFrame:
+    """Un-rolled daily counts: {date_col}, epoch_day, {flag}_daily, all_daily (for count models)."""
+    days = np.arange(len(all_daily), dtype=np.int32) + np.int32(epoch_day(start_date))
+    df_return = pd.DataFrame(
+        {
+            date_col: from_epoch_days(days),
+            EPOCH_DAY_COL: days,
+            f"{target_col.split('_')[0]}_daily": np.asarray(flag_daily, dtype=float),
+            "all_daily": np.asarray(all_daily, dtype=float),
+        }
+    )
+    if cap_year:
+        df_return = df_return[df_return[date_col].dt.year < cap_year]
+    return df_return
+
+
+def create_daily_counts(
+    df_original: pd.DataFrame, date_col: str, target_col: str, cap_year: int = 2020
+) -> pd.DataFrame:
+    """daily_counts_frame straight from a flagged claims frame."""
+    start_date, flag_daily, all_daily = partitioned_daily_counts(
+        df_original[date_col], df_original[target_col], workers=1, partitions=1
+    )
+    return daily_counts_frame(flag_daily, all_daily, start_date, date_col, target_col, cap_year)
+
+
+def multi_window_timeseries(
+    flag_daily: np.ndarray,
+    all_daily: np.ndarray,
+    start_date,
+    date_col: str,
+    target_col: str,
+    windows: list[int] = (28, 91, 182, 364),
+    cap_year: int = None,
+    rates: bool = True,
+) -> pd.DataFrame:
+    """
+    Rolling sums for several windows from one cumulative sum per daily vector.
+
+    Columns per window w: {flag}_count{w}, all_count{w} and, with rates=True,
+    {flag}_rate{w} = {flag}_count{w} / all_count{w}. Rows start at the first date
+    where the LARGEST window is complete, so every column is a full-window sum.
+    The epoch_day column carries the int32 day axis the detectors use.
+    """
+    windows = sorted(set(int(w) for w in windows))
+    w_max = windows[-1]
+    days = np.arange(w_max - 1, len(all_daily), dtype=np.int32) + np.int32(epoch_day(start_date))
+    df_return = pd.DataFrame({date_col: from_epoch_days(days), EPOCH_DAY_COL: days})
+    flag_prefix = target_col.split("_")[0]
+    csums = {
+        flag_prefix: np.concatenate([[0], np.cumsum(flag_daily, dtype=np.int64)]),
+        "all": np.concatenate([[0], np.cumsum(all_daily, dtype=np.int64)]),
+    }
+    for w in windows:
+        for prefix, csum in csums.items():
+            # window ending on day i (0-based) is csum[i + 1] - csum[i + 1 - w]
+            rolled = csum[w_max:] - csum[w_max - w : len(csum) - w]
+            df_return[f"{prefix}_count{w}"] = rolled.astype(float)
+        if rates:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                df_return[f"{flag_prefix}_rate{w}"] = (
+                    df_return[f"{flag_prefix}_count{w}"] / df_return[f"all_count{w}"]
+                )
+    df_return["year"] = df_return[date_col].dt.year
+    if cap_year:
+        df_return = df_return[df_return["year"] < cap_year]
+    return df_return
+
+
+def create_stratified_timeseries(
+    df: pd.DataFrame,
+    date_col: str,
+    target_col: str,
+    strata_cols: list[str],
+    window_size: int = 364,
+    cap_year: int = None,
+) -> dict:
+    """
+    Rolling counts per stratum (e.g. facility, region, payer) in one grouped pass.
+
+    Every claim gets a stratum id (groupby.ngroup) and a day offset; one bincount
+    over stratum * n_days + day fills the (stratum x day) count matrices for the
+    flag and for all claims, and the rolling sums are a cumulative sum along days.
+
+    Returns {"strata": DataFrame of stratum keys with claim / flagged totals,
+             "dates": DatetimeIndex, "days": epoch days (int32),
+             "flag": (n_strata, n_dates) array,
+             "all": (n_strata, n_dates) array, "window_size": window_size}.
+    """
+    with profiler.span("create_stratified_timeseries", rows=len(df)):
+        grouped = df.groupby(strata_cols, sort=True, dropna=False, observed=True)
+        stratum = grouped.ngroup().to_numpy(dtype=np.int64)
+        n_strata = int(stratum.max()) + 1 if len(stratum) else 0
+
+        day = to_epoch_days(df[date_col]).astype(np.int64)
+        lo = int(day.min()) if len(day) else 0
+        n_days = int(day.max()) - lo + 1 if len(day) else 0
+        cell = stratum * n_days + (day - lo)
+        flags = pd.to_numeric(df[target_col]).to_numpy(dtype=np.float64)
+
+        size = n_strata * n_days
+        flag_daily = np.rint(np.bincount(cell, weights=flags, minlength=size)).astype(np.int64)
+        all_daily = np.bincount(cell, minlength=size)
+        flag_daily = flag_daily.reshape(n_strata, n_days)
+        all_daily = all_daily.reshape(n_strata, n_days)
+
+        w = window_size
+        rolled = {}
+        for name, daily in (("flag", flag_daily), ("all", all_daily)):
+            csum = np.zeros((n_strata, n_days + 1), dtype=np.int64)
+            np.cumsum(daily, axis=1, out=csum[:, 1:])
+            rolled[name] = (csum[:, w:] - csum[:, :-w]).astype(float)
+
+        days = np.arange(lo + w - 1, lo + n_days, dtype=np.int32)
+        if cap_year:
+            keep = days < epoch_day(f"{cap_year}-01-01")
+            days = days[keep]
+            rolled = {name: m[:, keep] for name, m in rolled.items()}
+        dates = from_epoch_days(days)
+
+        strata = grouped.size().reset_index(name="n_claims")
+        strata["n_flagged"] = flag_daily.sum(axis=1)
+
+    print(f"Built {n_strata} strata x {len(dates)} days of rolling counts.")
+    return {
+        "strata": strata,
+        "dates": dates,
+        "days": days,
+        "flag": rolled["flag"],
+        "all": rolled["all"],
+        "window_size": w,
+    }
+
+
+def stratum_timeseries(
+    stratified: dict, i: int, date_col: str = "date", target_col: str = "flag"
+) -> pd.DataFrame:
+    """One stratum of create_stratified_timeseries in the create_timeseries_function layout."""
+    w = stratified["window_size"]
+    df_return = pd.DataFrame({date_col: stratified["dates"], EPOCH_DAY_COL: stratified["days"]})
+    df_return[f"{target_col.split('_')[0]}_count{w}"] = stratified["flag"][i]
+    df_return[f"all_count{w}"] = stratified["all"][i]
+    df_return["year"] = df_return[date_col].dt.year
+    return df_return
@@ -0,0 +1,165 @@
+"""
+Content-addressed cache for hypothesis evaluations.
+- Key: sha256 over (dataset fingerprint, sorted ICD-9 set, sorted ICD-10 set,
+  window size, cap year, detector config).
+- Tier 1: in-memory LRU (per process).
+- Tier 2: pickle files under ENHA_CACHE_DIR (default .cache/evaluations), shared
+  by every process on the node, so repeated UI queries skip the claims scan.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import pandas as pd
+
+CACHE_VERSION = 3
+
+
+def canonical_codes(codes) -> list[str]:
+    """Sorted, de-duplicated codes exactly as flag_dataframe matches them (case-sensitive)."""
+    return sorted({str(c) for c in codes if c})
+
+
+def dataset_fingerprint(df: pd.DataFrame, columns: Optional[list[str]] = None) -> str:
+    """Hash of the claims content (one pass over the given columns)."""
+    cols = [c for c in (columns or list(df.columns)) if c in df.columns]
+    h = hashlib.sha256()
+    h.update(json.dumps([len(df), cols]).encode())
+    row_hashes = pd.util.hash_pandas_object(df[cols], index=False).to_numpy()
+    h.update(row_hashes.tobytes())
+    return h.hexdigest()
+
+
+def file_fingerprint(path: str, columns: Optional[list[str]] = None) -> str:
+    """Cheap fingerprint for a dataset file: path, size, mtime and the columns read (no scan)."""
+    st = os.stat(path)
+    key = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+    if columns:
+        key += f"|{json.dumps(list(columns))}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def source_fingerprint(df: pd.DataFrame) -> Optional[str]:
+    """file_fingerprint that load_claims recorded on df, or None.
+    Frames sliced from it inherit df.attrs, so the row count must still match."""
+    source = df.attrs.get("source")
+    if source and source.get("rows") == len(df):
+        return source["fingerprint"]
+    return None
+
+
+def evaluation_key(
+    fingerprint: str,
+    icd9_codes,
+    icd10_codes,
+    window_size: int,
+    detector_config: dict,
+    cap_year=None,
+) -> str:
+    payload = {
+        "version": CACHE_VERSION,
+        "dataset": fingerprint,
+        "icd9": canonical_codes(icd9_codes),
+        "icd10": canonical_codes(icd10_codes),
+        "window_size": int(window_size),
+        "cap_year": cap_year,
+        "detector": detector_config,
+    }
+    blob = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class EvaluationCache:
+    """Two-tier (memory LRU + disk) cache of {timeseries, rolling_col, break_analysis}."""
+
+    def __init__(self, max_entries: int = 128, cache_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        # process-pool workers get the disk tier and an empty memory tier
+        return {"max_entries": self.max_entries, "cache_dir": self.cache_dir}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pkl")
+
+    def get(self, key: str):
+        with self._lock:
+            if key in self._mem:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return self._mem[key]
+        if self.cache_dir:
+            path = self._path(key)
+            try:
+                with open(path, "rb") as fh:
+                    value = pickle.load(fh)
+            except FileNotFoundError:
+                pass
+            except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+                print(f"⚠️  Dropping unreadable cache entry {path}")
+                os.remove(path)
+            else:
+                self._remember(key, value)
+                with self._lock:
+                    self.disk_hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value) -> None:
+        self._remember(key, value)
+        if self.cache_dir:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # write-then-rename so concurrent readers never see a partial file
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as fh:
+                pickle.dump(value, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._mem[key] = value
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+
+    def clear(self, disk: bool = False) -> None:
+        with self._lock:
+            self._mem.clear()
+        if disk and self.cache_dir and os.path.isdir(self.cache_dir):
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if name.endswith(".pkl"):
+                        os.remove(os.path.join(root, name))
+
+    def stats(self) -> dict:
+        return {
+            "memory_hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "entries": len(self._mem),
+        }
+
+
+# Global instance: memory + disk tier (set ENHA_CACHE_DIR="" to keep it in memory only)
+evaluation_cache = EvaluationCache(
+    cache_dir=os.environ.get("ENHA_CACHE_DIR", os.path.join(".cache", "evaluations"))
+    or None
+)
@@ -0,0 +1,136 @@
+import pandas as pd
+
+from utils.profiler import profiler
+from break_detection.break_detector import break_detector
+from time_series_evaluator.create_time_series import (
+    daily_counts_frame,
+    flagged_daily_counts,
+    timeseries_from_daily_counts,
+)
+from time_series_evaluator.evaluation_cache import (
+    evaluation_cache,
+    evaluation_key,
+    dataset_fingerprint,
+)
+from time_series_evaluator.itsa_evaluator import itsa_detector
+
+WINDOW_SIZE = 364  # same yearly window as create_timeseries_function
+
+# config["scoring_backend"] -> detector used when evaluate_hypothesis gets none
+SCORING_BACKENDS = {"chow": break_detector, "itsa": itsa_detector}
+
+
+def scoring_backend(config: dict):
+    """Detector for config["scoring_backend"] ("chow" by default, or "itsa")."""
+    name = config.get("scoring_backend", "chow")
+    if name not in SCORING_BACKENDS:
+        raise ValueError(f"Unknown scoring backend '{name}'; use one of {list(SCORING_BACKENDS)}.")
+    return SCORING_BACKENDS[name]
+
+
+def evaluate_hypothesis(
+    claims_df: pd.DataFrame,
+    hypothesis: dict,
+    config: dict,
+    detector=None,
+    cache=evaluation_cache,
+    fingerprint: str = None,
+    evaluator=None,
+    plot_results: bool = False,
+) -> dict:
+    """
+    Flag -> time series -> break detection for one hypothesis, memoized.
+
+    detector:    BreakDetector / ITSADetector; None picks scoring_backend(config).
+    fingerprint: dataset fingerprint; computed from claims_df when None (one pass),
+                 so callers evaluating many hypotheses should compute it once.
+    evaluator:   optional series builder over the same claims with
+                 set_codes(codes) -> timeseries (IncrementalSeriesEvaluator or
+                 SharedClaims). claims_df may be None when evaluator and
+                 fingerprint are both given.
+    With detector.count_model set, break_analysis also carries "count_model":
+    detect_breaks_daily on the un-rolled daily counts.
+    Returns {"hypothesis", "timeseries", "rolling_col", "break_analysis",
+    "daily_counts", "cache_hit"}; daily_counts is (start_date, flag_daily, all_daily).
+    Cached timeseries/break_analysis objects are shared: treat them as read-only.
+    plot_results=True skips the cache lookup (the figure is a side effect of
+    detection) but still stores the result.
+    """
+    detector = detector or scoring_backend(config)
+    date_col = config["date_colname"]
+    target_colnames = config["target_colnames"]
+    cap_year = config.get("cap_year")
+    name = hypothesis.get("name", "")
+    # the series is rolled over the detector's window (BreakDetector(window=...))
+    window = getattr(detector, "window", None) or WINDOW_SIZE
+
+    key = None
+    if cache is not None:
+        if fingerprint is None:
+            with profiler.span("dataset_fingerprint", rows=len(claims_df)):
+                fingerprint = dataset_fingerprint(
+                    claims_df, [date_col] + list(target_colnames)
+                )
+        key = evaluation_key(
+            fingerprint,
+            hypothesis.get("icd9_codes", []),
+            hypothesis.get("icd10_codes", []),
+            window,
+            detector.config(),
+            cap_year=cap_year,
+        )
+        cached = None if plot_results else cache.get(key)
+        if cached is not None:
+            print(f"♻️  Cache hit for '{name}' ({key[:12]}), skipping claims scan.")
+            return {**cached, "hypothesis": hypothesis, "cache_hit": True}
+
+    target_flag_col = f"flag_{name.replace(' ', '_')}"
+    all_codes = list(hypothesis.get("icd9_codes", [])) + list(
+        hypothesis.get("icd10_codes", [])
+    )
+    if evaluator is not None:
+        ts = evaluator.set_codes(all_codes)
+        start_date, flag_daily, all_daily = evaluator.counts()
+        if getattr(evaluator, "window_size", WINDOW_SIZE) != window:
+            ts = timeseries_from_daily_counts(
+                flag_daily, all_daily, start_date, date_col, target_flag_col, window, cap_year
+            )
+    else:
+        # flags and daily counts only: claims_df is neither copied nor modified
+        start_date, flag_daily, all_daily = flagged_daily_counts(
+            claims_df, all_codes, target_colnames, date_col
+        )
+        with profiler.span("create_timeseries_function", rows=len(claims_df)):
+            ts = timeseries_from_daily_counts(
+                flag_daily, all_daily, start_date, date_col, target_flag_col, window, cap_year
+            )
+    rolling_col = f"{target_flag_col.split('_')[0]}_count{window}"
+
+    break_analysis = detector.detect_breaks(
+        ts,
+        date_col=date_col,
+        value_col=rolling_col,
+        hypothesis_name=name,
+        plot_results=plot_results,
+    )
+    if getattr(detector, "count_model", None):
+        daily = (
+            evaluator.daily()
+            if evaluator is not None
+            else daily_counts_frame(
+                flag_daily, all_daily, start_date, date_col, target_flag_col, cap_year=cap_year
+            )
+        )
+        break_analysis["count_model"] = detector.detect_breaks_daily(
+            daily, date_col=date_col, hypothesis_name=name
+        )
+
+    entry = {
+        "timeseries": ts,
+        "rolling_col": rolling_col,
+        "break_analysis": break_analysis,
+        "daily_counts": (start_date, flag_daily, all_daily),
+    }
+    if cache is not None:
+        cache.put(key, entry)
+    return {**entry, "hypothesis": hypothesis, "cache_hit": False}
@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+
+from utils.epoch_days import day_timestamp, to_epoch_days
+from utils.profiler import profiler
+from time_series_evaluator.create_time_series import (
+    daily_counts_frame,
+    timeseries_from_daily_counts,
+)
+
+
+class IncrementalSeriesEvaluator:
+    """Rolling time series for a hypothesis, updated by the codes that changed.
+
+    Successive hypotheses usually differ by one or two codes, so instead of
+    flag_dataframe + create_timeseries_function over every claim we keep:
+      - an inverted index code -> claim rows (the per-code postings),
+      - per claim, how many of the current hypothesis codes it matches,
+      - the current daily flagged counts.
+    Adding a code only touches that code's postings: claims going from 0 to 1
+    matches are added to their day. Removing a code subtracts the claims that
+    drop back to 0 matches. Claims matching several codes are counted once
+    (the match count is the correction for the overlap).
+
+    The output has the same columns as create_timeseries_function.
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        target_colnames: list[str],
+        date_col: str = "date",
+        target_col: str = "flag_hypothesis",
+        window_size: int = 364,
+        cap_year=None,
+    ):
+        self.date_col = date_col
+        self.target_col = target_col
+        self.window_size = window_size
+        self.cap_year = cap_year
+
+        with profiler.span("incremental.build_index", rows=len(df)):
+            epoch = to_epoch_days(df[date_col])
+            lo = int(epoch.min()) if len(epoch) else 0
+            self.min_date = day_timestamp(lo)
+            self.days = epoch - np.int32(lo)
+            self.n_days = int(self.days.max()) + 1 if len(self.days) else 0
+
+            cols = [c for c in target_colnames if c in df.columns]
+            n = len(df)
+            stacked = pd.concat([df[c] for c in cols], ignore_index=True)
+            code_ids, vocab = pd.factorize(stacked, use_na_sentinel=True)
+            rows = np.tile(np.arange(n, dtype=np.int64), len(cols))
+            keep = code_ids >= 0
+            # one posting per (code, claim) even if the code repeats across columns
+            keys = np.unique(code_ids[keep].astype(np.int64) * n + rows[keep])
+            self.postings = (keys % n).astype(np.int64)
+            posting_codes = keys // n
+            self.offsets = np.searchsorted(
+                posting_codes, np.arange(len(vocab) + 1), side="left"
+            )
+            self.code_index = {str(c): i for i, c in enumerate(vocab)}
+
+            self.all_daily = np.bincount(self.days, minlength=self.n_days).astype(np.int64)
+
+        self.match_count = np.zeros(len(df), dtype=np.uint8)
+        self.flag_daily = np.zeros(self.n_days, dtype=np.int64)
+        self.codes = set()
+
+    # ---------- Updates ----------
+
+    def _rows_for(self, code):
+        i = self.code_index.get(code)
+        if i is None:
+            return self.postings[:0]
+        return self.postings[self.offsets[i] : self.offsets[i + 1]]
+
+    def add_codes(self, codes):
+        """Add codes to the current hypothesis (codes already present are ignored)."""
+        for code in set(codes) - self.codes:
+            rows = self._rows_for(code)
+            newly = rows[self.match_count[rows] == 0]
+            self.flag_daily += np.bincount(self.days[newly], minlength=self.n_days)
+            self.match_count[rows] += 1
+            self.codes.add(code)
+
+    def remove_codes(self, codes):
+        """Remove codes from the current hypothesis (unknown codes are ignored)."""
+        for code in set(codes) & self.codes:
+            rows = self._rows_for(code)
+            self.match_count[rows] -= 1
+            gone = rows[self.match_count[rows] == 0]
+            self.flag_daily -= np.bincount(self.days[gone], minlength=self.n_days)
+            self.codes.discard(code)
+
+    def set_codes(self, codes) -> pd.DataFrame:
+        """Move to a new hypothesis by applying only the delta; return the time series."""
+        codes = set(codes)
+        added, removed = codes - self.codes, self.codes - codes
+        touched = sum(len(self._rows_for(c)) for c in added | removed)
+        with profiler.span("incremental.update", rows=touched):
+            self.remove_codes(removed)
+            self.add_codes(added)
+        print(
+            f"    Incremental update: +{len(added)} / -{len(removed)} codes, "
+            f"{touched} postings touched, {int(self.flag_daily.sum())} claims flagged."
+        )
+        return self.timeseries()
+
+    # ---------- Output ----------
+
+    def flags(self) -> np.ndarray:
+        """Boolean per-claim flag for the current codes (same as flag_dataframe)."""
+        return self.match_count > 0
+
+    def timeseries(self) -> pd.DataFrame:
+        """Rolling sums in the create_timeseries_function layout."""
+        return timeseries_from_daily_counts(
+            self.flag_daily,
+            self.all_daily,
+            self.min_date,
+            self.date_col,
+            self.target_col,
+            window_size=self.window_size,
+            cap_year=self.cap_year,
+        )
+
+    def counts(self):
+        """(start_date, flag_daily, all_daily) for the current codes (copies)."""
+        return self.min_date, self.flag_daily.copy(), self.all_daily.copy()
+
+    def daily(self) -> pd.DataFrame:
+        """Un-rolled daily counts for the current codes (daily_counts_frame layout)."""
+        return daily_counts_frame(
+            self.flag_daily,
+            self.all_daily,
+            self.min_date,
+            self.date_col,
+            self.target_col,
+            cap_year=self.cap_year,
+        )
@@ -0,0 +1,255 @@
+"""
+Shared-memory claims store for multi-process evaluation.
+- The target diagnosis columns are encoded once into a (n_claims, n_cols) matrix of
+  code ids (0 = missing) over one shared vocabulary, and dates into int32 day
+  offsets from the earliest claim date.
+- Both arrays live in multiprocessing.shared_memory blocks. Workers receive a small
+  picklable handle and attach zero-copy; nothing claims-sized is ever pickled.
+- Flagging and daily aggregation run on row slices, so work can be split across a pool.
+
+Usage:
+    with SharedClaims.create(claims_df, config["target_colnames"]) as store:
+        handle = store.handle()          # send this to workers
+        ...
+    # in a worker
+    store = SharedClaims.attach(handle)
+    flag_daily, all_daily = store.daily_counts(codes, start, stop)
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from utils.epoch_days import day_timestamp
+from utils.profiler import profiler
+from time_series_evaluator.create_time_series import (
+    compact_claims,
+    daily_counts_frame,
+    timeseries_from_daily_counts,
+)
+
+
+def _is_compact(df: pd.DataFrame, target_colnames: list[str], date_col: str) -> bool:
+    """True for compact_claims output: int32 epoch days, one categorical dtype for all codes."""
+    cols = [c for c in target_colnames if c in df.columns]
+    dtypes = {df[c].dtype for c in cols}
+    return (
+        df[date_col].dtype == np.int32
+        and len(dtypes) <= 1
+        and all(isinstance(d, pd.CategoricalDtype) for d in dtypes)
+    )
+
+
+def encode_claims(df: pd.DataFrame, target_colnames: list[str], date_col: str = "date"):
+    """
+    Encode claims as (vocab, diag, days, start_date).
+    vocab: list of codes; diag[i, j] is 1 + index into vocab (0 = missing).
+    days: int32 offset of each claim's date from start_date.
+    """
+    # same normalization as compact_claims; compact frames are used as they are
+    compact = df if _is_compact(df, target_colnames, date_col) else compact_claims(
+        df, date_col, target_colnames
+    )
+    cols = [c for c in target_colnames if c in compact.columns]
+    vocab = compact[cols[0]].cat.categories if cols else pd.Index([])
+    dtype = np.uint16 if len(vocab) < np.iinfo(np.uint16).max else np.uint32
+    diag = np.zeros((len(compact), len(cols)), dtype=dtype)
+    for j, col in enumerate(cols):
+        diag[:, j] = compact[col].cat.codes.to_numpy() + 1
+
+    epoch = compact[date_col].to_numpy()
+    lo = int(epoch.min()) if len(epoch) else 0
+    return list(vocab), diag, epoch - np.int32(lo), day_timestamp(lo)
+
+
+class SharedClaims:
+    """Encoded claims backed by shared memory (see module docstring)."""
+
+    def __init__(
+        self, blocks, arrays, vocab, start_date, n_days, colnames, series, owner
+    ):
+        self._blocks = blocks
+        self.diag = arrays["diag"]
+        self.days = arrays["days"]
+        self.vocab = vocab
+        self.code_index = {c: i + 1 for i, c in enumerate(vocab)}
+        self.start_date = pd.Timestamp(start_date)
+        self.n_days = n_days
+        self.colnames = colnames
+        self.date_col = series["date_col"]
+        self.cap_year = series["cap_year"]
+        self._owner = owner
+        self._last_daily = None
+
+    # ---------- Lifecycle ----------
+
+    @classmethod
+    def create(
+        cls,
+        df: pd.DataFrame,
+        target_colnames: list[str],
+        date_col: str = "date",
+        cap_year: int = None,
+    ):
+        """Encode df into new shared-memory blocks (the creator unlinks them on close).
+        date_col / cap_year only shape the time series returned by set_codes.
+        """
+        with profiler.span("shared_claims.create", rows=len(df)):
+            vocab, diag, days, start_date = encode_claims(df, target_colnames, date_col)
+            blocks, arrays = {}, {}
+            for name, src in (("diag", diag), ("days", days)):
+                shm = shared_memory.SharedMemory(create=True, size=max(1, src.nbytes))
+                dst = np.ndarray(src.shape, dtype=src.dtype, buffer=shm.buf)
+                dst[...] = src
+                blocks[name] = shm
+                arrays[name] = dst
+        n_days = int(days.max()) + 1 if len(days) else 0
+        cols = [c for c in target_colnames if c in df.columns]
+        print(
+            f"Shared claims: {len(df)} rows x {len(cols)} cols, {len(vocab)} codes, "
+            f"{(diag.nbytes + days.nbytes) / 1e6:.1f} MB in shared memory."
+        )
+        series = {"date_col": date_col, "cap_year": cap_year}
+        return cls(blocks, arrays, vocab, start_date, n_days, cols, series, owner=True)
+
+    def handle(self) -> dict:
+        """Small picklable description that lets another process attach."""
+        return {
+            "blocks": {
+                "diag": (self._blocks["diag"].name, self.diag.shape, self.diag.dtype.str),
+                "days": (self._blocks["days"].name, self.days.shape, self.days.dtype.str),
+            },
+            "vocab": self.vocab,
+            "start_date": str(self.start_date.date()),
+            "n_days": self.n_days,
+            "colnames": self.colnames,
+            "series": {"date_col": self.date_col, "cap_year": self.cap_year},
+        }
+
+    @classmethod
+    def attach(cls, handle: dict):
+        """Map the creator's blocks into this process without copying."""
+        blocks, arrays = {}, {}
+        for name, (shm_name, shape, dtype) in handle["blocks"].items():
+            shm = shared_memory.SharedMemory(name=shm_name)
+            blocks[name] = shm
+            arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        return cls(
+            blocks,
+            arrays,
+            handle["vocab"],
+            handle["start_date"],
+            handle["n_days"],
+            handle["colnames"],
+            handle["series"],
+            owner=False,
+        )
+
+    def close(self):
+        self.diag = self.days = None
+        for shm in self._blocks.values():
+            shm.close()
+            if self._owner:
+                shm.unlink()
+        self._blocks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def __len__(self):
+        return len(self.days)
+
+    # ---------- Flagging & aggregation ----------
+
+    def _lookup(self, codes) -> np.ndarray:
+        """Boolean table over code ids: True for ids in `codes` (index 0 = missing)."""
+        lut = np.zeros(len(self.vocab) + 1, dtype=bool)
+        ids = [self.code_index[c] for c in codes if c in self.code_index]
+        lut[ids] = True
+        return lut
+
+    def flag_rows(self, codes, start: int = 0, stop: int = None) -> np.ndarray:
+        """Per-claim flag for rows [start, stop): any target column holds one of `codes`."""
+        return self._lookup(codes)[self.diag[start:stop]].any(axis=1)
+
+    def daily_counts(self, codes, start: int = 0, stop: int = None):
+        """(flag_daily, all_daily) count vectors over the full day axis for a row slice."""
+        days = self.days[start:stop]
+        flags = self.flag_rows(codes, start, stop)
+        flag_daily = np.bincount(days[flags], minlength=self.n_days)
+        all_daily = np.bincount(days, minlength=self.n_days)
+        return flag_daily, all_daily
+
+    def set_codes(self, codes, target_col="flag_hypothesis"):
+        """Full-scan time series for `codes` (same interface as IncrementalSeriesEvaluator)."""
+        with profiler.span("shared_claims.scan", rows=len(self)):
+            flag_daily, all_daily = self.daily_counts(set(codes))
+        self._last_daily = (flag_daily, all_daily, target_col)
+        print(f"    Flagged {int(flag_daily.sum())} claims out of {len(self)}.")
+        return timeseries_from_daily_counts(
+            flag_daily,
+            all_daily,
+            self.start_date,
+            self.date_col,
+            target_col,
+            cap_year=self.cap_year,
+        )
+
+    def counts(self):
+        """(start_date, flag_daily, all_daily) from the last set_codes call."""
+        if self._last_daily is None:
+            raise ValueError("Call set_codes before counts().")
+        flag_daily, all_daily, _ = self._last_daily
+        return self.start_date, flag_daily, all_daily
+
+    def daily(self) -> pd.DataFrame:
+        """Un-rolled daily counts from the last set_codes call (daily_counts_frame layout)."""
+        if self._last_daily is None:
+            raise ValueError("Call set_codes before daily().")
+        flag_daily, all_daily, target_col = self._last_daily
+        return daily_counts_frame(
+            flag_daily, all_daily, self.start_date, self.date_col, target_col, self.cap_year
+        )
+
+
+# ---------- Pool helpers ----------
+
+_ATTACHED = {}
+
+
+def _attached(handle: dict) -> SharedClaims:
+    """Attach once per worker process and reuse."""
+    key = handle["blocks"]["diag"][0]
+    store = _ATTACHED.get(key)
+    if store is None:
+        store = _ATTACHED[key] = SharedClaims.attach(handle)
+    return store
+
+
+def _slice_counts(args):
+    handle, codes, start, stop = args
+    return _attached(handle).daily_counts(codes, start, stop)
+
+
+def parallel_daily_counts(store: SharedClaims, codes, workers: int = 4, pool=None):
+    """Split rows into `workers` slices, aggregate each in a pool worker, sum the vectors."""
+    codes = set(codes)
+    bounds = np.linspace(0, len(store), workers + 1, dtype=np.int64)
+    handle = store.handle()
+    tasks = [(handle, codes, int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+    own_pool = pool is None
+    pool = pool or ProcessPoolExecutor(max_workers=workers)
+    try:
+        parts = list(pool.map(_slice_counts, tasks))
+    finally:
+        if own_pool:
+            pool.shutdown()
+    flag_daily = np.sum([p[0] for p in parts], axis=0)
+    all_daily = np.sum([p[1] for p in parts], axis=0)
+    return flag_daily, all_daily
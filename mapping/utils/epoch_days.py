@@ -0,0 +1,48 @@
+"""
+Integer day axis for the pipeline: int32 days since 1970-01-01 ("epoch days").
+
+Dates are converted once, vectorized, where claims or series enter the pipeline
+(to_epoch_days). Time series frames carry the axis as the EPOCH_DAY_COL column
+next to the date column. Detectors regress on, slice and compare these integers,
+and Timestamps are produced only for reported fields and plots (from_epoch_days).
+"""
+
+import numpy as np
+import pandas as pd
+
+EPOCH_DAY_COL = "epoch_day"
+DAYS_PER_YEAR = 365.25
+
+
+def to_epoch_days(dates) -> np.ndarray:
+    """int32 epoch days for an array-like of dates (integer input is taken as epoch days)."""
+    arr = np.asarray(dates)
+    if arr.dtype.kind in "iu":
+        return arr.astype(np.int32, copy=False)
+    if arr.dtype.kind != "M":
+        arr = pd.to_datetime(pd.Index(np.ravel(arr))).to_numpy().reshape(arr.shape)
+    return arr.astype("datetime64[D]").astype(np.int32)
+
+
+def epoch_day(date) -> int:
+    """Epoch day of one date (str, Timestamp, datetime64 or int)."""
+    if isinstance(date, (int, np.integer)):
+        return int(date)
+    return int(np.datetime64(pd.Timestamp(date), "D").astype(np.int64))
+
+
+def from_epoch_days(days) -> pd.DatetimeIndex:
+    """DatetimeIndex for epoch days (display / serialization only)."""
+    return pd.DatetimeIndex(np.asarray(days, dtype=np.int64).astype("datetime64[D]"))
+
+
+def day_timestamp(day) -> pd.Timestamp:
+    """Timestamp of one epoch day."""
+    return pd.Timestamp(np.datetime64(int(day), "D"))
+
+
+def epoch_day_axis(ts: pd.DataFrame, date_col: str) -> np.ndarray:
+    """The frame's epoch-day column, or the date column converted once."""
+    if EPOCH_DAY_COL in ts.columns:
+        return ts[EPOCH_DAY_COL].to_numpy(dtype=np.int32)
+    return to_epoch_days(ts[date_col])
@@ -3,19 +3,24 @@
 Firestore-only logging (no Cloud Storage).
 - One doc per run in /runs/{runId}
 - Per-iteration docs in /runs/{runId}/iterations/{i}
+- Per-round docs in /runs/{runId}/rounds/{r} (speculative refinement timings)
 - Text logs as chunked docs under:
     /runs/{runId}/logs/{autoId}
     /runs/{runId}/iterations/{i}/logs/{autoId}
 - Optional code snippets under:
     /runs/{runId}/iterations/{i}/code/{filename}
+- Optional stage timings (see utils.profiler) on the run doc and per iteration.
 """
 
+import json
 import os
 from datetime import datetime
 from typing import Optional
 
 from google.cloud import firestore  # pip install google-cloud-firestore
 
+from utils.profiler import profiler
+
 _PROJECT = os.environ.get("GCP_PROJECT_ID")  # must be set by your .env
 
 # Create a single Firestore client for the process.
@@ -24,14 +29,15 @@ _fs = firestore.Client(project=_PROJECT)
 
 def create_run_doc(run_id: str, user_desc: str) -> None:
     """Create the run doc when a pipeline starts."""
-    _fs.collection("runs").document(run_id).set(
-        {
-            "userDesc": user_desc,
-            "status": "running",
-            "startedAt": datetime.utcnow(),
-        },
-        merge=True,
-    )
+    with profiler.span("firestore.create_run_doc"):
+        _fs.collection("runs").document(run_id).set(
+            {
+                "userDesc": user_desc,
+                "status": "running",
+                "startedAt": datetime.utcnow(),
+            },
+            merge=True,
+        )
 
 
 def finalize_run(
@@ -40,8 +46,11 @@ def finalize_run(
     *,
     status: str = "succeeded",
     best_iteration_index: Optional[int] = None,
+    timings: Optional[dict] = None,
 ) -> None:
-    """Mark the run complete and write small summary fields."""
+    """Mark the run complete and write small summary fields.
+    timings: optional profiler.summary() dict stored under "timings".
+    """
     best_iter = (
         int(best_iteration_index)
         if best_iteration_index is not None
@@ -61,7 +70,10 @@ def finalize_run(
             "globalChowP": br.get("global_chow_p"),
         },
     }
-    _fs.collection("runs").document(run_id).set(payload, merge=True)
+    if timings is not None:
+        payload["timings"] = timings
+    with profiler.span("firestore.finalize_run"):
+        _fs.collection("runs").document(run_id).set(payload, merge=True)
 
 
 def log_iteration_meta(
@@ -73,33 +85,56 @@ def log_iteration_meta(
     comment: str = "",
 ) -> None:
     """Write/merge the small iteration metadata (no blobs)."""
+    with profiler.span("firestore.log_iteration_meta"):
+        _fs.collection("runs").document(run_id).collection("iterations").document(
+            str(i)
+        ).set(
+            {
+                "score": float(score),
+                "hypothesisName": str(hypothesis_name),
+                "comment": str(comment or ""),
+                "createdAt": datetime.utcnow(),
+            },
+            merge=True,
+        )
+
+
+def log_iteration_timings(run_id: str, i: int, records: list[dict]) -> None:
+    """Store the profiler records of one iteration as a JSON-lines string."""
+    if not records:
+        return
+    jsonl = "".join(json.dumps(r, default=str) + "\n" for r in records)
     _fs.collection("runs").document(run_id).collection("iterations").document(
         str(i)
-    ).set(
-        {
-            "score": float(score),
-            "hypothesisName": str(hypothesis_name),
-            "comment": str(comment or ""),
-            "createdAt": datetime.utcnow(),
-        },
-        merge=True,
-    )
+    ).set({"timingsJsonl": jsonl}, merge=True)
+
+
+def log_round_timings(run_id: str, r: int, records: list[dict]) -> None:
+    """Store the profiler records of one speculative round (its proposals share them)."""
+    if not records:
+        return
+    jsonl = "".join(json.dumps(rec, default=str) + "\n" for rec in records)
+    _fs.collection("runs").document(run_id).collection("rounds").document(
+        str(r)
+    ).set({"timingsJsonl": jsonl}, merge=True)
 
 
 def append_run_log(run_id: str, text: str, *, seq: int) -> None:
     """Append a chunk of terminal text at the run level."""
-    _fs.collection("runs").document(run_id).collection("logs").add(
-        {"seq": int(seq), "text": text, "createdAt": datetime.utcnow()}
-    )
+    with profiler.span("firestore.append_run_log"):
+        _fs.collection("runs").document(run_id).collection("logs").add(
+            {"seq": int(seq), "text": text, "createdAt": datetime.utcnow()}
+        )
 
 
 def append_iter_log(run_id: str, i: int, text: str, *, seq: int) -> None:
     """Append a chunk of terminal text at the iteration level."""
-    _fs.collection("runs").document(run_id).collection("iterations").document(
-        str(i)
-    ).collection("logs").add(
-        {"seq": int(seq), "text": text, "createdAt": datetime.utcnow()}
-    )
+    with profiler.span("firestore.append_iter_log"):
+        _fs.collection("runs").document(run_id).collection("iterations").document(
+            str(i)
+        ).collection("logs").add(
+            {"seq": int(seq), "text": text, "createdAt": datetime.utcnow()}
+        )
 
 
 def save_code(
@@ -111,12 +146,33 @@ def save_code(
     language: str = "text",
 ) -> None:
     """Persist a small code file/snippet under an iteration."""
-    _fs.collection("runs").document(run_id).collection("iterations").document(
-        str(i)
-    ).collection("code").document(filename).set(
-        {
-            "language": language,
-            "content": content,
-            "createdAt": datetime.utcnow(),
-        }
-    )
+    with profiler.span("firestore.save_code"):
+        _fs.collection("runs").document(run_id).collection("iterations").document(
+            str(i)
+        ).collection("code").document(filename).set(
+            {
+                "language": language,
+                "content": content,
+                "createdAt": datetime.utcnow(),
+            }
+        )
+
+
+def log_checkpoint(run_id: str, result: dict) -> None:
+    """Mirror one checkpointed refinement step (codes + judgement, no time series)."""
+    h = result.get("hypothesis", {}) or {}
+    with profiler.span("firestore.log_checkpoint"):
+        _fs.collection("runs").document(run_id).collection("iterations").document(
+            str(result.get("iteration", 0))
+        ).set(
+            {
+                "hypothesisName": str(h.get("name", "")),
+                "icd9Codes": sorted(h.get("icd9_codes", [])),
+                "icd10Codes": sorted(h.get("icd10_codes", [])),
+                "score": float(result.get("score", 0.0)),
+                "artificialBreak": bool(result.get("artificial_break")),
+                "comment": str(result.get("comment") or ""),
+                "checkpointedAt": datetime.utcnow(),
+            },
+            merge=True,
+        )
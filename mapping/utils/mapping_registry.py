@@ -0,0 +1,275 @@
+"""
+Registry of accepted mappings (SQLite, one file).
+- mappings: one row per (normalized concept, dataset fingerprint) with the codes,
+  break statistics (JSON) and the prompt history that led to them.
+- concept_tokens: token -> mapping index, for related-concept lookup.
+- series: the accepted mapping's daily flagged / all-claims counts (int32 blobs),
+  so a repeat request rebuilds its time series without touching the claims.
+
+Exact repeats are one indexed SELECT; related concepts (token Jaccard) seed the
+first LLM proposal of a new refinement run.
+The path is ENHA_REGISTRY_PATH (default .cache/registry.sqlite).
+"""
+
+import datetime
+import json
+import os
+import re
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+from time_series_evaluator.evaluation_cache import canonical_codes
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS mappings (
+    id INTEGER PRIMARY KEY,
+    concept TEXT NOT NULL,
+    concept_raw TEXT,
+    fingerprint TEXT NOT NULL DEFAULT '',
+    icd9 TEXT NOT NULL,
+    icd10 TEXT NOT NULL,
+    artificial_break INTEGER,
+    score REAL,
+    artificial_slope REAL,
+    comment TEXT,
+    break_stats TEXT,
+    history TEXT,
+    created_at TEXT,
+    UNIQUE (concept, fingerprint)
+);
+CREATE INDEX IF NOT EXISTS idx_mappings_concept ON mappings (concept);
+CREATE TABLE IF NOT EXISTS concept_tokens (
+    token TEXT NOT NULL,
+    mapping_id INTEGER NOT NULL REFERENCES mappings (id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_concept_tokens ON concept_tokens (token);
+CREATE TABLE IF NOT EXISTS series (
+    mapping_id INTEGER PRIMARY KEY REFERENCES mappings (id) ON DELETE CASCADE,
+    start_date TEXT NOT NULL,
+    flag_daily BLOB NOT NULL,
+    all_daily BLOB NOT NULL
+);
+"""
+
+# request filler that says nothing about the concept
+STOPWORDS = {
+    "a", "about", "all", "an", "and", "any", "claims", "code", "codes", "diagnosis",
+    "diagnoses", "find", "for", "get", "i", "in", "like", "me", "of", "on", "or",
+    "patients", "please", "related", "the", "to", "want", "with",
+}
+
+
+def concept_tokens(text: str) -> list[str]:
+    """Lowercase content words of a concept request, plural 's' stripped, sorted unique."""
+    words = re.findall(r"[a-z0-9]+", (text or "").lower())
+    tokens = set()
+    for w in words:
+        if w in STOPWORDS:
+            continue
+        if len(w) > 4 and w.endswith("s") and not w.endswith("ss"):
+            w = w[:-1]
+        tokens.add(w)
+    return sorted(tokens)
+
+
+def normalize_concept(text: str) -> str:
+    """Registry key: "cardiomyopathy and atherosclerosis" == "Atherosclerosis, cardiomyopathy"."""
+    return " ".join(concept_tokens(text))
+
+
+def _json_default(obj):
+    if isinstance(obj, (pd.Timestamp, datetime.date)):
+        return obj.isoformat()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    if isinstance(obj, pd.DataFrame):
+        return None
+    return str(obj)
+
+
+class MappingRegistry:
+    """SQLite-backed store of accepted mappings (see module docstring)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # connections do not cross processes; workers reconnect lazily
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA foreign_keys = ON")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # ---------- Writes ----------
+
+    def save(
+        self,
+        concept: str,
+        result: dict,
+        history: list[dict] = None,
+        fingerprint: str = "",
+        daily: tuple = None,
+    ) -> int:
+        """
+        Store (or replace) the mapping for concept on this dataset.
+        result: a refinement result (hypothesis, score, artificial_break, comment,
+        break_analysis). daily: optional (start_date, flag_daily, all_daily).
+        Returns the mapping id.
+        """
+        key = normalize_concept(concept)
+        h = result["hypothesis"]
+        row = (
+            key,
+            concept,
+            fingerprint or "",
+            json.dumps(canonical_codes(h.get("icd9_codes", []))),
+            json.dumps(canonical_codes(h.get("icd10_codes", []))),
+            int(bool(result.get("artificial_break"))),
+            None if result.get("score") is None else float(result["score"]),
+            None if result.get("artificial_slope") is None else float(result["artificial_slope"]),
+            result.get("comment"),
+            json.dumps(result.get("break_analysis") or {}, default=_json_default),
+            json.dumps(history or [], default=_json_default),
+            datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        )
+        with self._lock, self.conn as conn:
+            conn.execute(
+                "DELETE FROM mappings WHERE concept = ? AND fingerprint = ?",
+                (key, fingerprint or ""),
+            )
+            mapping_id = conn.execute(
+                "INSERT INTO mappings (concept, concept_raw, fingerprint, icd9, icd10, "
+                "artificial_break, score, artificial_slope, comment, break_stats, history, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                row,
+            ).lastrowid
+            conn.executemany(
+                "INSERT INTO concept_tokens (token, mapping_id) VALUES (?, ?)",
+                [(t, mapping_id) for t in key.split()],
+            )
+            if daily is not None:
+                start_date, flag_daily, all_daily = daily
+                conn.execute(
+                    "INSERT INTO series (mapping_id, start_date, flag_daily, all_daily) "
+                    "VALUES (?, ?, ?, ?)",
+                    (
+                        mapping_id,
+                        str(pd.Timestamp(start_date).date()),
+                        np.asarray(flag_daily, dtype=np.int32).tobytes(),
+                        np.asarray(all_daily, dtype=np.int32).tobytes(),
+                    ),
+                )
+        print(f"🗂️  Registered mapping for '{key}' (id {mapping_id}).")
+        return mapping_id
+
+    # ---------- Reads ----------
+
+    def _entry(self, row) -> dict:
+        return {
+            "id": row["id"],
+            "concept": row["concept"],
+            "concept_raw": row["concept_raw"],
+            "fingerprint": row["fingerprint"],
+            "hypothesis": {
+                "name": "registered mapping",
+                "icd9_codes": set(json.loads(row["icd9"])),
+                "icd10_codes": set(json.loads(row["icd10"])),
+            },
+            "artificial_break": bool(row["artificial_break"]),
+            "score": row["score"],
+            "artificial_slope": row["artificial_slope"],
+            "comment": row["comment"],
+            "break_analysis": json.loads(row["break_stats"] or "{}"),
+            "history": json.loads(row["history"] or "[]"),
+            "created_at": row["created_at"],
+        }
+
+    def lookup(self, concept: str, fingerprint: str = None) -> dict:
+        """Accepted mapping for exactly this concept (same dataset when fingerprint given)."""
+        key = normalize_concept(concept)
+        sql = "SELECT * FROM mappings WHERE concept = ?"
+        args = [key]
+        if fingerprint is not None:
+            sql += " AND fingerprint = ?"
+            args.append(fingerprint)
+        row = self.conn.execute(sql + " ORDER BY created_at DESC LIMIT 1", args).fetchone()
+        return self._entry(row) if row else None
+
+    def related(self, concept: str, k: int = 3, min_similarity: float = 0.2) -> list[dict]:
+        """Mappings whose concept shares tokens with this one, by Jaccard similarity."""
+        tokens = concept_tokens(concept)
+        if not tokens:
+            return []
+        marks = ",".join("?" * len(tokens))
+        rows = self.conn.execute(
+            f"SELECT m.*, COUNT(*) AS shared FROM concept_tokens t "
+            f"JOIN mappings m ON m.id = t.mapping_id WHERE t.token IN ({marks}) "
+            f"GROUP BY m.id",
+            tokens,
+        ).fetchall()
+        scored = []
+        for row in rows:
+            n_other = len(row["concept"].split())
+            similarity = row["shared"] / (len(tokens) + n_other - row["shared"])
+            if similarity >= min_similarity and row["concept"] != " ".join(tokens):
+                scored.append({**self._entry(row), "similarity": similarity})
+        scored.sort(key=lambda e: (-e["similarity"], e["artificial_break"]))
+        return scored[:k]
+
+    def series(self, mapping_id: int):
+        """(start_date, flag_daily, all_daily) cached for a mapping, or None."""
+        row = self.conn.execute(
+            "SELECT * FROM series WHERE mapping_id = ?", (mapping_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return (
+            pd.Timestamp(row["start_date"]),
+            np.frombuffer(row["flag_daily"], dtype=np.int32).astype(np.int64),
+            np.frombuffer(row["all_daily"], dtype=np.int32).astype(np.int64),
+        )
+
+    def seed_emphasis(self, concept: str, k: int = 2) -> str:
+        """Prompt text pointing the first proposal at accepted mappings of related concepts."""
+        lines = [
+            f"- '{e['concept_raw']}': ICD-9 {sorted(e['hypothesis']['icd9_codes'])}, "
+            f"ICD-10 {sorted(e['hypothesis']['icd10_codes'])}"
+            for e in self.related(concept, k=k)
+            if not e["artificial_break"]
+        ]
+        if not lines:
+            return ""
+        return (
+            "These validated mappings for related concepts had no artificial break at the "
+            "ICD transition; reuse their codes where they fit this concept:\n" + "\n".join(lines)
+        )
+
+
+mapping_registry = MappingRegistry(
+    os.environ.get("ENHA_REGISTRY_PATH", os.path.join(".cache", "registry.sqlite"))
+)
@@ -0,0 +1,252 @@
+# mapping/utils/profiler.py
+"""
+Lightweight span timers for the mapping pipeline.
+- Disabled by default; set ENHA_PROFILE=1 (or call profiler.enable()) to record.
+- Each span records wall time, CPU time, rows processed and, when
+  ENHA_PROFILE_MEMORY=1, the peak traced memory while the span was open.
+- Spans nest per thread, so "detect_breaks/chow" is recorded under "detect_breaks".
+- Records are plain dicts: dump them as JSON lines, attach them to the Firestore
+  run doc or the UI payload.
+
+Usage:
+    from utils.profiler import profiler
+
+    profiler.set_iteration(i)
+    with profiler.span("flag_dataframe", rows=len(df)):
+        ...
+"""
+
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Optional
+
+
+class _NullSpan:
+    """Returned when profiling is off: entering/exiting costs two no-op calls."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set_rows(self, rows):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = (
+        "profiler",
+        "stage",
+        "rows",
+        "meta",
+        "path",
+        "t0",
+        "c0",
+        "mem0",
+        "peak",
+    )
+
+    def __init__(self, profiler, stage, rows, meta):
+        self.profiler = profiler
+        self.stage = stage
+        self.rows = rows
+        self.meta = meta
+
+    def set_rows(self, rows):
+        """Record the number of rows once it is known inside the span."""
+        self.rows = None if rows is None else int(rows)
+
+    def __enter__(self):
+        stack = self.profiler._stack()
+        parent = stack[-1] if stack else None
+        self.path = self.stage if parent is None else f"{parent.path}/{self.stage}"
+        self.peak = 0
+        if self.profiler.track_memory:
+            cur, peak = tracemalloc.get_traced_memory()
+            for s in stack:
+                s.peak = max(s.peak, peak)
+            tracemalloc.reset_peak()
+            self.mem0 = cur
+        stack.append(self)
+        self.c0 = time.process_time()
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.t0
+        cpu = time.process_time() - self.c0
+        stack = self.profiler._stack()
+        stack.pop()
+        peak_mb = None
+        if self.profiler.track_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            self.peak = max(self.peak, peak)
+            for s in stack:
+                s.peak = max(s.peak, peak)
+            peak_mb = round(max(0, self.peak - self.mem0) / 1e6, 3)
+        self.profiler._record(
+            {
+                "run_id": self.profiler.run_id,
+                "iteration": self.profiler.iteration,
+                "stage": self.path,
+                "wall_s": round(wall, 6),
+                "cpu_s": round(cpu, 6),
+                "rows": self.rows,
+                "peak_mem_mb": peak_mb,
+                "ok": exc_type is None,
+                **self.meta,
+            }
+        )
+        return False
+
+
+class Profiler:
+    """Collects per-stage, per-iteration timings for one pipeline run."""
+
+    def __init__(self, enabled=False, track_memory=False, jsonl_path=None):
+        self.enabled = False
+        self.track_memory = False
+        self.jsonl_path = None
+        self.run_id = None
+        self.iteration = None
+        self._records = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if enabled:
+            self.enable(track_memory=track_memory, jsonl_path=jsonl_path)
+
+    # ---------- Configuration ----------
+
+    def enable(self, track_memory=False, jsonl_path=None):
+        self.enabled = True
+        self.track_memory = bool(track_memory)
+        self.jsonl_path = jsonl_path
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self):
+        self.enabled = False
+        if self.track_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.track_memory = False
+
+    def start_run(self, run_id: Optional[str] = None):
+        """Clear previous records and tag everything that follows with run_id."""
+        with self._lock:
+            self._records = []
+        self.run_id = run_id
+        self.iteration = None
+
+    def set_iteration(self, i: Optional[int]):
+        self.iteration = None if i is None else int(i)
+
+    # ---------- Recording ----------
+
+    def span(self, stage: str, rows: Optional[int] = None, **meta):
+        """Context manager timing one stage. A shared no-op object when disabled."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, stage, None if rows is None else int(rows), meta)
+
+    def timed(self, stage: str):
+        """Decorator form of span() for whole functions."""
+
+        def decorator(fn):
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with _Span(self, stage, None, {}):
+                    return fn(*args, **kwargs)
+
+            wrapper.__name__ = fn.__name__
+            wrapper.__doc__ = fn.__doc__
+            wrapper.__wrapped__ = fn
+            return wrapper
+
+        return decorator
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record(self, rec: dict):
+        with self._lock:
+            self._records.append(rec)
+        if self.jsonl_path:
+            with open(self.jsonl_path, "a") as fh:
+                fh.write(json.dumps(rec, default=str) + "\n")
+
+    # ---------- Output ----------
+
+    def records(self) -> list[dict]:
+        with self._lock:
+            return list(self._records)
+
+    def to_jsonl(self) -> str:
+        return "".join(json.dumps(r, default=str) + "\n" for r in self.records())
+
+    def summary(self) -> dict:
+        """Aggregate records per stage and per (iteration, stage)."""
+        by_stage = defaultdict(lambda: _empty_totals())
+        by_iter = defaultdict(lambda: defaultdict(lambda: _empty_totals()))
+        for r in self.records():
+            for tot in (by_stage[r["stage"]], by_iter[r["iteration"]][r["stage"]]):
+                tot["calls"] += 1
+                tot["wall_s"] += r["wall_s"]
+                tot["cpu_s"] += r["cpu_s"]
+                tot["rows"] += r["rows"] or 0
+                if r["peak_mem_mb"] is not None:
+                    tot["peak_mem_mb"] = max(tot["peak_mem_mb"] or 0.0, r["peak_mem_mb"])
+        return {
+            "stages": {k: _rounded(v) for k, v in by_stage.items()},
+            "iterations": {
+                str(i): {k: _rounded(v) for k, v in stages.items()}
+                for i, stages in by_iter.items()
+            },
+        }
+
+    def print_report(self):
+        """Console table of total time per stage, slowest first."""
+        stages = self.summary()["stages"]
+        if not stages:
+            return
+        print("\n⏱️  STAGE TIMINGS")
+        print("=" * 60)
+        for name, tot in sorted(stages.items(), key=lambda kv: -kv[1]["wall_s"]):
+            mem = (
+                f", peak {tot['peak_mem_mb']:.1f} MB"
+                if tot["peak_mem_mb"] is not None
+                else ""
+            )
+            print(
+                f"{name:<36} {tot['wall_s']:9.3f}s wall {tot['cpu_s']:9.3f}s cpu "
+                f"x{tot['calls']}{mem}"
+            )
+
+
+def _empty_totals():
+    return {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "rows": 0, "peak_mem_mb": None}
+
+
+def _rounded(tot):
+    return {k: round(v, 6) if isinstance(v, float) else v for k, v in tot.items()}
+
+
+# Global instance: off unless ENHA_PROFILE=1
+profiler = Profiler(
+    enabled=os.environ.get("ENHA_PROFILE") == "1",
+    track_memory=os.environ.get("ENHA_PROFILE_MEMORY") == "1",
+    jsonl_path=os.environ.get("ENHA_PROFILE_PATH"),
+)
@@ -0,0 +1,242 @@
+"""
+Checkpoints for refinement runs (SQLite, one file), so a run that dies midway
+(route timeout, LLM quota error, worker restart) resumes where it stopped.
+- runs: one row per run with the concept, dataset fingerprint, loop mode and
+  its parameters, status, and the prompt state (history the next proposal is
+  built from, rounds completed) as JSON.
+- steps: one row per proposal, keyed (run, round, slot). The hypothesis is
+  written as soon as the LLM returns it, the packaged result (pickled, with its
+  time series) once it is evaluated; neither is computed twice on resume.
+
+Each step can also be mirrored to Firestore (ENHA_CHECKPOINT_FIRESTORE=1): the
+run doc (create_run_doc / finalize_run with the profiler summary), every
+evaluated step (log_checkpoint) and stage timings per serial iteration
+(log_iteration_timings) or speculative round (log_round_timings, see
+utils.firestore_logger). Resuming always reads the
+local file.
+The path is ENHA_CHECKPOINT_PATH (default .cache/checkpoints.sqlite).
+"""
+
+import datetime
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import uuid
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    concept TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    params TEXT,
+    status TEXT NOT NULL,
+    state TEXT,
+    best_iteration INTEGER,
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS steps (
+    run_id TEXT NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+    round INTEGER NOT NULL,
+    slot INTEGER NOT NULL,
+    icd9 TEXT NOT NULL,
+    icd10 TEXT NOT NULL,
+    name TEXT,
+    result BLOB,
+    PRIMARY KEY (run_id, round, slot)
+);
+"""
+
+
+def _now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def new_run_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+class RunCheckpoint:
+    """SQLite-backed refinement checkpoints (see module docstring)."""
+
+    def __init__(self, path: str, mirror: bool = False):
+        self.path = path
+        self.mirror = mirror
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {"path": self.path, "mirror": self.mirror}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA foreign_keys = ON")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # ---------- Runs ----------
+
+    def open_run(
+        self, run_id: str, concept: str, fingerprint: str, mode: str, params: dict = None
+    ) -> dict:
+        """Create the run, or return the existing one (same dataset required)."""
+        run = self.run(run_id)
+        if run is not None:
+            if run["fingerprint"] != fingerprint:
+                raise ValueError(f"Run {run_id} was started on a different claims dataset.")
+            if run["mode"] != mode:
+                raise ValueError(f"Run {run_id} is a {run['mode']} run, not {mode}.")
+            print(f"♻️  Resuming run {run_id} ({run['status']}).")
+            return run
+        with self._lock, self.conn as conn:
+            conn.execute(
+                "INSERT INTO runs (run_id, concept, fingerprint, mode, params, status, state, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, ?, 'running', '{}', ?, ?)",
+                (run_id, concept, fingerprint, mode, json.dumps(params or {}), _now(), _now()),
+            )
+        print(f"💾 Checkpointing run {run_id} to {self.path}.")
+        if self.mirror:
+            self._mirror("create_run_doc", run_id, concept)
+        return self.run(run_id)
+
+    def run(self, run_id: str) -> dict:
+        row = self.conn.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            **dict(row),
+            "params": json.loads(row["params"] or "{}"),
+            "state": json.loads(row["state"] or "{}"),
+        }
+
+    def save_state(self, run_id: str, state: dict) -> None:
+        """Prompt state after a completed iteration/round (JSON-serializable)."""
+        with self._lock, self.conn as conn:
+            conn.execute(
+                "UPDATE runs SET state = ?, updated_at = ? WHERE run_id = ?",
+                (json.dumps(state), _now(), run_id),
+            )
+
+    def finish(
+        self,
+        run_id: str,
+        best_iteration=None,
+        status: str = "completed",
+        best: dict = None,
+        timings: dict = None,
+    ) -> None:
+        """Close the run; best / timings (profiler.summary()) go to the Firestore run doc."""
+        with self._lock, self.conn as conn:
+            conn.execute(
+                "UPDATE runs SET status = ?, best_iteration = ?, updated_at = ? WHERE run_id = ?",
+                (status, best_iteration, _now(), run_id),
+            )
+        if self.mirror and best:
+            self._mirror(
+                "finalize_run",
+                run_id,
+                best,
+                status="succeeded" if status == "completed" else status,
+                best_iteration_index=best_iteration,
+                timings=timings,
+            )
+
+    def save_timings(self, run_id: str, iteration: int, records: list[dict]) -> None:
+        """Profiler records of one serial iteration (Firestore only, not checkpointed)."""
+        if self.mirror and records:
+            self._mirror("log_iteration_timings", run_id, iteration, records)
+
+    def save_round_timings(self, run_id: str, round_: int, records: list[dict]) -> None:
+        """Profiler records of one speculative round; results of a round carry their own
+        global iteration numbers, so round timings are kept apart from them."""
+        if self.mirror and records:
+            self._mirror("log_round_timings", run_id, round_, records)
+
+    def unfinished(self, concept: str = None) -> list[dict]:
+        """Runs that have not completed, newest first."""
+        sql = "SELECT run_id FROM runs WHERE status != 'completed'"
+        args = []
+        if concept is not None:
+            sql += " AND concept = ?"
+            args.append(concept)
+        rows = self.conn.execute(sql + " ORDER BY updated_at DESC", args).fetchall()
+        return [self.run(r["run_id"]) for r in rows]
+
+    # ---------- Steps ----------
+
+    def save_proposal(self, run_id: str, round_: int, slot: int, hypothesis: dict) -> None:
+        with self._lock, self.conn as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO steps (run_id, round, slot, icd9, icd10, name, result) "
+                "VALUES (?, ?, ?, ?, ?, ?, NULL)",
+                (
+                    run_id,
+                    round_,
+                    slot,
+                    json.dumps(sorted(hypothesis["icd9_codes"])),
+                    json.dumps(sorted(hypothesis["icd10_codes"])),
+                    hypothesis.get("name"),
+                ),
+            )
+
+    def save_result(self, run_id: str, round_: int, slot: int, result: dict) -> None:
+        with self._lock, self.conn as conn:
+            conn.execute(
+                "UPDATE steps SET result = ? WHERE run_id = ? AND round = ? AND slot = ?",
+                (pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL), run_id, round_, slot),
+            )
+        if self.mirror:
+            self._mirror("log_checkpoint", run_id, result)
+
+    def steps(self, run_id: str, round_: int = None) -> list[dict]:
+        """[{round, slot, hypothesis, result or None}] in (round, slot) order."""
+        sql = "SELECT * FROM steps WHERE run_id = ?"
+        args = [run_id]
+        if round_ is not None:
+            sql += " AND round = ?"
+            args.append(round_)
+        rows = self.conn.execute(sql + " ORDER BY round, slot", args).fetchall()
+        return [
+            {
+                "round": row["round"],
+                "slot": row["slot"],
+                "hypothesis": {
+                    "name": row["name"],
+                    "icd9_codes": set(json.loads(row["icd9"])),
+                    "icd10_codes": set(json.loads(row["icd10"])),
+                },
+                "result": pickle.loads(row["result"]) if row["result"] is not None else None,
+            }
+            for row in rows
+        ]
+
+    def _mirror(self, name: str, *args, **kwargs) -> None:
+        """Call utils.firestore_logger.<name>; imported lazily (needs Firestore credentials)."""
+        try:
+            from utils import firestore_logger
+
+            getattr(firestore_logger, name)(*args, **kwargs)
+        except Exception as e:  # the local checkpoint is the source of truth
+            print(f"⚠️ Firestore checkpoint mirror failed: {e}")
+
+
+run_checkpoint = RunCheckpoint(
+    os.environ.get("ENHA_CHECKPOINT_PATH", os.path.join(".cache", "checkpoints.sqlite")),
+    mirror=os.environ.get("ENHA_CHECKPOINT_FIRESTORE") == "1",
+)
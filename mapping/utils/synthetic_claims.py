@@ -0,0 +1,375 @@
+# mapping/utils/synthetic_claims.py
+"""
+Vectorized synthetic claims generator for benchmarks and tests.
+- Claims are drawn over [start_date, end_date], uniformly or with an annual
+  (winter peak) and weekly (weekend dip) seasonal profile.
+- Diagnosis columns follow the synthetic dataset layout: diag_p, odiag1..odiag10,
+  filled at fill_decay ** n or at explicit per-column fill_rates (e.g.
+  REALISTIC_FILL_RATES; a claim with odiag{n} empty has every later column empty).
+- Before the transition date codes come from an ICD-9 vocabulary, after it from ICD-10.
+  vocab="gem" draws the background codes from the GEM crosswalk
+  (hypothesis_refinement/files/icd10cmtoicd9gem.csv), so post-transition background
+  claims carry a GEM target of the ICD-9 code they would have had.
+- A "target concept" (the thing a user would ask about) is planted with a known
+  ICD-9 -> ICD-10 mapping; `artifact_share` of its post-transition claims are hit
+  by a mapping artifact with known ground truth (see ARTIFACTS), which creates a
+  transition break for the naive mapping.
+- write_claims_parquet streams any number of claims to Parquet in chunks, with the
+  ground truth in the file metadata (read_ground_truth).
+"""
+
+import functools
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+DIAG_COLNAMES = ["diag_p"] + [f"odiag{n}" for n in range(1, 11)]
+
+CONCEPT_ICD9 = ["4254", "4255", "4409"]
+# naive one-to-one targets: each is a GEM target of the ICD-9 code at the same index,
+# so every planted code passes the vocabulary check in icd_parsing_script.validate_codes
+CONCEPT_ICD10 = ["I429", "I426", "I7090"]
+ARTIFACT_ICD10 = ["I428"]
+
+# Fill rate per diagnosis column, roughly what inpatient claims extracts show
+REALISTIC_FILL_RATES = [1.0, 0.85, 0.72, 0.6, 0.5, 0.41, 0.33, 0.27, 0.22, 0.18, 0.15]
+
+# artifact -> what happens to `artifact_share` of the post-transition concept claims
+ARTIFACTS = {
+    "unmapped": "coded with an ICD-10 code the naive mapping misses (ARTIFACT_ICD10)",
+    "dropped": "coded with background codes: the concept code is lost, no mapping recovers it",
+    "split": "spread over the other GEM targets of their ICD-9 code (one-to-many split)",
+}
+
+GEM_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "hypothesis_refinement",
+    "files",
+    "icd10cmtoicd9gem.csv",
+)
+
+
+def diag_colnames(n_diag_cols: int) -> list[str]:
+    if not 1 <= n_diag_cols <= len(DIAG_COLNAMES):
+        raise ValueError(f"n_diag_cols must be in [1, {len(DIAG_COLNAMES)}]")
+    return DIAG_COLNAMES[:n_diag_cols]
+
+
+@functools.lru_cache(maxsize=1)
+def _gem_pairs() -> pd.DataFrame:
+    gem = pd.read_csv(GEM_PATH, dtype=str, usecols=["icd10cm", "icd9cm", "no_map"])
+    return gem[gem["no_map"] == "0"][["icd9cm", "icd10cm"]].reset_index(drop=True)
+
+
+def gem_targets(icd9_code: str) -> list[str]:
+    """ICD-10 codes the GEM maps icd9_code to."""
+    gem = _gem_pairs()
+    return sorted(gem.loc[gem["icd9cm"] == icd9_code, "icd10cm"])
+
+
+def split_targets() -> dict:
+    """Concept ICD-9 code -> GEM targets other than its naive CONCEPT_ICD10 code."""
+    return {
+        code9: [c for c in gem_targets(code9) if c != code10]
+        for code9, code10 in zip(CONCEPT_ICD9, CONCEPT_ICD10)
+    }
+
+
+def _background_vocab(vocab_size: int, vocab: str = "synthetic", seed: int = 0):
+    """ICD-9 / ICD-10 background codes (disjoint from the concept), paired by index."""
+    if vocab == "gem":
+        concept = set(CONCEPT_ICD9) | set(CONCEPT_ICD10) | set(ARTIFACT_ICD10)
+        concept |= {c for targets in split_targets().values() for c in targets}
+        gem = _gem_pairs()
+        gem = gem[~gem["icd9cm"].isin(concept) & ~gem["icd10cm"].isin(concept)]
+        first = gem.groupby("icd9cm", sort=True)["icd10cm"].first()
+        pick = np.random.default_rng(seed).choice(
+            len(first), size=min(vocab_size, len(first)), replace=False
+        )
+        pick.sort()
+        return (
+            first.index.to_numpy(dtype=object)[pick],
+            first.to_numpy(dtype=object)[pick],
+        )
+    if vocab != "synthetic":
+        raise ValueError(f"Unknown vocab '{vocab}'; use 'synthetic' or 'gem'.")
+    icd9 = np.array([f"{700 + i // 10:03d}{i % 10}" for i in range(vocab_size)], dtype=object)
+    icd10 = np.array(
+        [f"{chr(ord('J') + (i // 1000) % 16)}{i % 1000:03d}" for i in range(vocab_size)],
+        dtype=object,
+    )
+    return icd9, icd10
+
+
+def _day_weights(start: pd.Timestamp, n_days: int, seasonal_amplitude: float, weekly_amplitude: float):
+    """Sampling probability per day, or None for uniform days."""
+    if not seasonal_amplitude and not weekly_amplitude:
+        return None
+    dates = pd.date_range(start, periods=n_days, freq="D")
+    w = 1.0 + seasonal_amplitude * np.cos(2 * np.pi * (dates.dayofyear.to_numpy() - 1) / 365.25)
+    w *= np.where(dates.dayofweek.to_numpy() >= 5, 1.0 - weekly_amplitude, 1.0)
+    w = np.clip(w, 0.0, None)
+    return w / w.sum()
+
+
+def generate_claims(
+    n_claims: int = 25_000,
+    n_diag_cols: int = 3,
+    vocab_size: int = 500,
+    start_date: str = "2014-01-01",
+    end_date: str = "2020-12-31",
+    transition_date: str = "2015-10-01",
+    concept_rate: float = 0.05,
+    artifact_share: float = 0.3,
+    fill_decay: float = 0.6,
+    seed: int = 0,
+    chunk_size: int = 5_000_000,
+    **options,
+) -> tuple[pd.DataFrame, dict]:
+    """
+    Build a claims DataFrame with `n_claims` rows and `n_diag_cols` diagnosis columns.
+
+    Column fill rates: diag_p is always filled; odiag{n} is filled with probability
+    fill_decay ** n. Returns (claims_df, ground_truth) where ground_truth holds the
+    correct ICD-9 / ICD-10 code sets for the planted concept and the artifact codes.
+    options: artifact, vocab, fill_rates, seasonal_amplitude, weekly_amplitude
+    (see iter_claims).
+    """
+    chunks = list(
+        iter_claims(
+            n_claims=n_claims,
+            n_diag_cols=n_diag_cols,
+            vocab_size=vocab_size,
+            start_date=start_date,
+            end_date=end_date,
+            transition_date=transition_date,
+            concept_rate=concept_rate,
+            artifact_share=artifact_share,
+            fill_decay=fill_decay,
+            seed=seed,
+            chunk_size=chunk_size,
+            **options,
+        )
+    )
+    claims_df = (
+        pd.concat(chunks, ignore_index=True)
+        if len(chunks) > 1
+        else chunks[0].reset_index(drop=True)
+    )
+    return claims_df, ground_truth(
+        transition_date, options.get("artifact", "unmapped"), artifact_share
+    )
+
+
+def ground_truth(
+    transition_date: str = "2015-10-01", artifact: str = "unmapped", artifact_share: float = 0.3
+) -> dict:
+    """
+    icd9_codes / icd10_codes: the correct mapping; naive_icd10_codes: the one-to-one
+    mapping a naive generator finds; artifact_codes: correct codes it misses.
+    """
+    if artifact == "split":
+        artifact_codes = {c for targets in split_targets().values() for c in targets}
+    elif artifact == "unmapped":
+        artifact_codes = set(ARTIFACT_ICD10)
+    elif artifact == "dropped":
+        artifact_codes = set()
+    else:
+        raise ValueError(f"Unknown artifact '{artifact}'; use one of {list(ARTIFACTS)}.")
+    return {
+        "icd9_codes": set(CONCEPT_ICD9),
+        "icd10_codes": set(CONCEPT_ICD10) | artifact_codes,
+        "naive_icd10_codes": set(CONCEPT_ICD10),
+        "artifact_codes": artifact_codes,
+        "artifact": artifact,
+        "artifact_share": artifact_share,
+        "transition_date": pd.Timestamp(transition_date),
+    }
+
+
+def iter_claims(
+    n_claims: int,
+    n_diag_cols: int = 3,
+    vocab_size: int = 500,
+    start_date: str = "2014-01-01",
+    end_date: str = "2020-12-31",
+    transition_date: str = "2015-10-01",
+    concept_rate: float = 0.05,
+    artifact_share: float = 0.3,
+    fill_decay: float = 0.6,
+    seed: int = 0,
+    chunk_size: int = 5_000_000,
+    artifact: str = "unmapped",
+    vocab: str = "synthetic",
+    fill_rates: list[float] = None,
+    seasonal_amplitude: float = 0.0,
+    weekly_amplitude: float = 0.0,
+):
+    """
+    Yield the claims in DataFrame chunks of at most `chunk_size` rows.
+
+    artifact:           one of ARTIFACTS.
+    vocab:              "synthetic" codes or "gem" (background pairs from the GEM file).
+    fill_rates:         per-column fill probabilities (overrides fill_decay).
+    seasonal_amplitude: relative claim volume swing over the year (peak in January).
+    weekly_amplitude:   relative claim volume drop on weekends.
+    """
+    if artifact not in ARTIFACTS:
+        raise ValueError(f"Unknown artifact '{artifact}'; use one of {list(ARTIFACTS)}.")
+    cols = diag_colnames(n_diag_cols)
+    if fill_rates is not None and len(fill_rates) < n_diag_cols:
+        raise ValueError(f"fill_rates needs one rate per diagnosis column ({n_diag_cols}).")
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp(start_date)
+    n_days = (pd.Timestamp(end_date) - start).days + 1
+    transition_day = (pd.Timestamp(transition_date) - start).days
+    day_weights = _day_weights(start, n_days, seasonal_amplitude, weekly_amplitude)
+
+    bg9, bg10 = _background_vocab(vocab_size, vocab, seed)
+    concept9 = np.array(CONCEPT_ICD9, dtype=object)
+    concept10 = np.array(CONCEPT_ICD10, dtype=object)
+    artifact10 = np.array(ARTIFACT_ICD10, dtype=object)
+    if artifact == "split":
+        # other GEM targets of each concept ICD-9 code, flattened with offsets
+        extra = [split_targets()[c] for c in CONCEPT_ICD9]
+        split10 = np.array([c for targets in extra for c in targets], dtype=object)
+        n_split = np.array([len(t) for t in extra])
+        split_offset = np.concatenate([[0], np.cumsum(n_split)[:-1]])
+
+    remaining = int(n_claims)
+    while remaining > 0:
+        n = min(chunk_size, remaining)
+        remaining -= n
+
+        if day_weights is None:
+            days = rng.integers(0, n_days, size=n, dtype=np.int32)
+        else:
+            days = rng.choice(n_days, size=n, p=day_weights).astype(np.int32)
+        post = days >= transition_day
+        # one draw per claim, so with decreasing fill_rates the filled columns are a prefix
+        fill_draw = rng.random(n) if fill_rates is not None else None
+
+        data = {"date": start + pd.to_timedelta(days, unit="D")}
+        for j, col in enumerate(cols):
+            # Concept claims are concentrated in the primary diagnosis
+            rate = concept_rate if j == 0 else concept_rate * 0.2
+            is_concept = rng.random(n) < rate
+            bg_idx = rng.integers(0, len(bg9), size=n)
+            concept_idx = rng.integers(0, len(CONCEPT_ICD9), size=n)
+
+            codes = np.where(post, bg10[bg_idx], bg9[bg_idx])
+            concept_codes = np.where(post, concept10[concept_idx], concept9[concept_idx])
+            if artifact_share > 0:
+                moved = post & (rng.random(n) < artifact_share)
+                if artifact == "unmapped":
+                    concept_codes = np.where(
+                        moved, artifact10[rng.integers(0, len(artifact10), size=n)], concept_codes
+                    )
+                elif artifact == "dropped":
+                    is_concept &= ~moved
+                else:
+                    moved &= n_split[concept_idx] > 0
+                    pick = split_offset[concept_idx] + (
+                        rng.random(n) * n_split[concept_idx]
+                    ).astype(np.int64)
+                    concept_codes = np.where(
+                        moved, split10[np.minimum(pick, len(split10) - 1)], concept_codes
+                    )
+            codes = np.where(is_concept, concept_codes, codes)
+
+            if fill_rates is not None:
+                codes = np.where(fill_draw < fill_rates[j], codes, None)
+            elif j > 0:
+                filled = rng.random(n) < fill_decay**j
+                codes = np.where(filled, codes, None)
+            data[col] = codes
+
+        yield pd.DataFrame(data)
+
+
+def _truth_to_json(truth: dict) -> str:
+    return json.dumps(
+        {
+            k: sorted(v) if isinstance(v, set) else v.isoformat() if isinstance(v, pd.Timestamp) else v
+            for k, v in truth.items()
+        }
+    )
+
+
+def write_claims_parquet(
+    path: str, n_claims: int, n_diag_cols: int = 11, chunk_size: int = 1_000_000, **kwargs
+) -> dict:
+    """
+    Stream iter_claims to one Parquet file, a row group per chunk, so memory stays
+    at one chunk whatever n_claims is. Codes are dictionary-encoded; the ground
+    truth is stored in the file metadata (read_ground_truth). Returns the ground truth.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    cols = diag_colnames(n_diag_cols)
+    schema = pa.schema(
+        [("date", pa.timestamp("ns"))] + [(c, pa.string()) for c in cols]
+    )
+    truth = ground_truth(
+        kwargs.get("transition_date", "2015-10-01"),
+        kwargs.get("artifact", "unmapped"),
+        kwargs.get("artifact_share", 0.3),
+    )
+    schema = schema.with_metadata({b"enha_ground_truth": _truth_to_json(truth).encode()})
+    written = 0
+    with pq.ParquetWriter(path, schema, use_dictionary=cols) as writer:
+        for chunk in iter_claims(
+            n_claims, n_diag_cols=n_diag_cols, chunk_size=chunk_size, **kwargs
+        ):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            written += len(chunk)
+            print(f"    wrote {written:,}/{n_claims:,} claims to {path}")
+    return truth
+
+
+def read_ground_truth(path: str) -> dict:
+    """Ground truth stored by write_claims_parquet."""
+    import pyarrow.parquet as pq
+
+    truth = json.loads(pq.read_schema(path).metadata[b"enha_ground_truth"])
+    for key in ("icd9_codes", "icd10_codes", "naive_icd10_codes", "artifact_codes"):
+        truth[key] = set(truth[key])
+    truth["transition_date"] = pd.Timestamp(truth["transition_date"])
+    return truth
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write synthetic claims to Parquet.")
+    parser.add_argument("path")
+    parser.add_argument("--n-claims", type=int, default=10_000_000)
+    parser.add_argument("--diag-cols", type=int, default=11)
+    parser.add_argument("--chunk-size", type=int, default=1_000_000)
+    parser.add_argument("--vocab", choices=["synthetic", "gem"], default="gem")
+    parser.add_argument("--vocab-size", type=int, default=5_000)
+    parser.add_argument("--artifact", choices=list(ARTIFACTS), default="unmapped")
+    parser.add_argument("--artifact-share", type=float, default=0.3)
+    parser.add_argument("--seasonal", type=float, default=0.1)
+    parser.add_argument("--weekly", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    truth = write_claims_parquet(
+        args.path,
+        args.n_claims,
+        n_diag_cols=args.diag_cols,
+        chunk_size=args.chunk_size,
+        vocab=args.vocab,
+        vocab_size=args.vocab_size,
+        artifact=args.artifact,
+        artifact_share=args.artifact_share,
+        fill_rates=REALISTIC_FILL_RATES,
+        seasonal_amplitude=args.seasonal,
+        weekly_amplitude=args.weekly,
+        seed=args.seed,
+    )
+    print(f"✅ Wrote {args.n_claims:,} claims; correct ICD-10 mapping: {sorted(truth['icd10_codes'])}")
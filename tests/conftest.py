@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+# modules import each other from the mapping/ root (e.g. "from utils.profiler import profiler")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mapping"))
+
+from time_series_evaluator.create_time_series import clean_data, get_input  # noqa: E402
+from utils.synthetic_claims import generate_claims  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def _run_in_tmp(tmp_path, monkeypatch):
+    """Figures, caches and registries created with relative paths land in tmp_path."""
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture(scope="session")
+def config():
+    return get_input("cardiomyopathy")
+
+
+@pytest.fixture(scope="session")
+def synthetic(config):
+    """(cleaned claims, ground truth) with a planted ICD-transition artifact."""
+    df, gt = generate_claims(n_claims=30_000, n_diag_cols=11, seed=1)
+    return clean_data(df, config["target_colnames"]), gt
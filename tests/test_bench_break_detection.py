@@ -0,0 +1,49 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "benchmarks"))
+
+import bench_break_detection as bench  # noqa: E402
+
+
+def _args(**overrides):
+    args = dict(
+        modes=["forced_chow", "itsa"],
+        series=4,
+        breaks=[0.0, -0.3],
+        noise=[0.0],
+        base=30.0,
+        seasonal=0.1,
+        weekly=0.2,
+        break_jitter=0,
+        start="2014-01-01",
+        end="2018-12-31",
+        seed=0,
+        out=None,
+    )
+    return argparse.Namespace(**{**args, **overrides})
+
+
+def test_benchmark_reports_power_and_false_alarms_per_mode():
+    report = bench.run_benchmarks(_args())
+    rows = {(r["mode"], r["break_size"]): r for r in report["results"]}
+    assert set(rows) == {(m, s) for m in ("forced_chow", "itsa") for s in (0.0, -0.3)}
+    # a 30% drop at the transition is caught, a series without one mostly is not
+    assert rows["forced_chow", -0.3]["detect_rate"] == 1.0
+    assert rows["forced_chow", -0.3]["date_error_days_median"] is not None
+    assert rows["forced_chow", 0.0]["metric"] == "false_alarm"
+    assert rows["forced_chow", 0.0]["detect_rate"] <= 0.25
+    assert [s["mode"] for s in report["summary"]] == ["forced_chow", "itsa"]
+    assert report["params"]["series"] == 4 and "out" not in report["params"]
+
+
+@pytest.mark.parametrize("break_size", [0.0, -0.3])
+def test_make_series_plants_the_break_at_the_requested_date(break_size):
+    s = bench.make_series(np.random.default_rng(0), _args(), break_size, noise=0.0)
+    assert s["break_date"] == (bench.TRANSITION if break_size else None)
+    assert len(s["daily"]) == len(s["ts"]) + 363
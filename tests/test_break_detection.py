@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from break_detection.break_detector import BreakDetector, batch_series
+from time_series_evaluator.create_time_series import timeseries_from_daily_counts
+
+START = pd.Timestamp("2014-01-01")
+VALUE_COL = "flag_count364"
+
+
+@pytest.fixture(scope="module")
+def library():
+    """Rolling series with no break, a drop and a rise at the ICD transition."""
+    rng = np.random.default_rng(0)
+    dates = pd.date_range(START, "2019-12-31", freq="D")
+    post = dates >= pd.Timestamp("2015-10-01")
+    frames = []
+    for shift in (0.0, -0.3, 0.2):
+        flag_daily = rng.poisson(30 * np.where(post, 1 + shift, 1.0))
+        all_daily = flag_daily + rng.poisson(600, len(dates))
+        frames.append(
+            timeseries_from_daily_counts(flag_daily, all_daily, START, "date", "flag_x", cap_year=None)
+        )
+    return frames
+
+
+@pytest.mark.parametrize(
+    "detector",
+    [BreakDetector(), BreakDetector(seasonality="both"), BreakDetector(use_rate=True)],
+    ids=["chow", "seasonal", "rate"],
+)
+def test_batch_chow_matches_single_series(library, detector):
+    dates = library[0]["date"]
+    values = np.vstack([ts[VALUE_COL].to_numpy() for ts in library])
+    denominators = np.vstack([ts["all_count364"].to_numpy() for ts in library])
+    batch = detector.detect_breaks_batch(dates, values, denominators=denominators)
+    for i, ts in enumerate(library):
+        single = detector.detect_breaks(ts, "date", VALUE_COL, plot_results=False)
+        one = batch_series(batch, i)
+        assert one["global_chow_F"] == pytest.approx(single["global_chow_F"], rel=1e-6)
+        assert one["global_chow_p"] == pytest.approx(single["global_chow_p"], rel=1e-6, abs=1e-12)
+        assert [c["F"] for c in one["local_chow"]] == pytest.approx(
+            [c["F"] for c in single["local_chow"]], rel=1e-6
+        )
+        assert [s["slope"] for s in one["segments"]] == pytest.approx(
+            [s["slope"] for s in single["segments"]], rel=1e-6
+        )
+
+
+def test_batch_rejects_mismatched_shapes(library):
+    dates = library[0]["date"]
+    values = np.vstack([ts[VALUE_COL].to_numpy() for ts in library])
+    with pytest.raises(ValueError, match="values has shape"):
+        BreakDetector().detect_breaks_batch(dates, values[:, 1:])
+    with pytest.raises(ValueError, match="denominators has shape"):
+        BreakDetector(use_rate=True).detect_breaks_batch(dates, values, denominators=values[:2])
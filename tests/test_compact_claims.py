@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from time_series_evaluator.create_time_series import (
+    claim_flags,
+    clean_data,
+    create_timeseries_function,
+    flag_dataframe,
+    flagged_daily_counts,
+    load_claims,
+    partitioned_daily_counts,
+    timeseries_from_daily_counts,
+)
+from break_detection.break_detector import BreakDetector
+from time_series_evaluator.evaluation_cache import EvaluationCache, source_fingerprint
+from time_series_evaluator.hypothesis_evaluator import evaluate_hypothesis
+from time_series_evaluator.incremental_series import IncrementalSeriesEvaluator
+from time_series_evaluator.shared_claims import encode_claims
+from utils.synthetic_claims import generate_claims
+
+
+@pytest.fixture(scope="module")
+def claims_csv(tmp_path_factory, config):
+    df, gt = generate_claims(n_claims=20_000, n_diag_cols=11, seed=2)
+    df["extra"] = "not read"
+    path = str(tmp_path_factory.mktemp("claims") / "claims.csv")
+    df.to_csv(path, index=False)
+    return path, gt
+
+
+@pytest.fixture(scope="module")
+def frames(claims_csv, config):
+    """(legacy cleaned string frame, compact frame) of the same claims file."""
+    path, _ = claims_csv
+    cols = config["target_colnames"]
+    legacy = clean_data(pd.read_csv(path, dtype=str), cols)
+    return legacy, load_claims(path, config["date_colname"], cols)
+
+
+def _code_sets(gt):
+    naive = list(gt["icd9_codes"]) + list(gt["naive_icd10_codes"])
+    return {"naive": naive, "correct": naive + list(gt["artifact_codes"]), "none": ["ZZZ9"]}
+
+
+def test_load_claims_is_compact(frames, config, claims_csv):
+    _, compact = frames
+    assert list(compact.columns) == [config["date_colname"]] + config["target_colnames"]
+    assert compact[config["date_colname"]].dtype == np.int32
+    assert all(isinstance(compact[c].dtype, pd.CategoricalDtype) for c in config["target_colnames"])
+    assert source_fingerprint(compact) is not None
+    assert source_fingerprint(compact.iloc[:10]) is None
+
+
+@pytest.mark.parametrize("which", ["naive", "correct", "none"])
+def test_flagged_daily_counts_match_the_flag_dataframe_path(frames, claims_csv, config, which):
+    legacy, compact = frames
+    codes = _code_sets(claims_csv[1])[which]
+    cols, date_col = config["target_colnames"], config["date_colname"]
+
+    flagged = flag_dataframe(legacy.copy(), codes, cols, "flag_x")
+    np.testing.assert_array_equal(
+        claim_flags(compact, codes, cols), flagged["flag_x"].to_numpy() == 1
+    )
+
+    expected = create_timeseries_function(flagged, date_col, "flag_x", cap_year=None)
+    start_date, flag_daily, all_daily = flagged_daily_counts(compact, codes, cols, date_col)
+    ts = timeseries_from_daily_counts(
+        flag_daily, all_daily, start_date, date_col, "flag_x", cap_year=None
+    )
+    pd.testing.assert_frame_equal(
+        ts[expected.columns].reset_index(drop=True),
+        expected.reset_index(drop=True),
+        check_dtype=False,
+    )
+
+
+def test_evaluate_hypothesis_scores_compact_and_legacy_frames_alike(frames, claims_csv, config):
+    legacy, compact = frames
+    gt = claims_csv[1]
+    hypothesis = {
+        "name": "naive",
+        "icd9_codes": set(gt["icd9_codes"]),
+        "icd10_codes": set(gt["naive_icd10_codes"]),
+    }
+    a = evaluate_hypothesis(legacy, hypothesis, config, cache=None)
+    b = evaluate_hypothesis(compact, hypothesis, config, cache=None)
+    assert b["break_analysis"]["global_chow_F"] == pytest.approx(
+        a["break_analysis"]["global_chow_F"], rel=1e-9
+    )
+    np.testing.assert_array_equal(a["daily_counts"][1], b["daily_counts"][1])
+
+
+def test_evaluate_hypothesis_rolls_over_the_detector_window(frames, claims_csv, config, tmp_path):
+    _, compact = frames
+    gt = claims_csv[1]
+    hypothesis = {
+        "name": "naive",
+        "icd9_codes": set(gt["icd9_codes"]),
+        "icd10_codes": set(gt["naive_icd10_codes"]),
+    }
+    cache = EvaluationCache(cache_dir=str(tmp_path / "cache"))
+    default = evaluate_hypothesis(compact, hypothesis, config, BreakDetector(), cache)
+    quarter = evaluate_hypothesis(compact, hypothesis, config, BreakDetector(window=91), cache)
+    assert not quarter["cache_hit"]
+    assert (default["rolling_col"], quarter["rolling_col"]) == ("flag_count364", "flag_count91")
+    f91 = quarter["break_analysis"]["global_chow_F"]
+    assert f91 != pytest.approx(default["break_analysis"]["global_chow_F"], rel=1e-6)
+
+    evaluator = IncrementalSeriesEvaluator(
+        compact, config["target_colnames"], config["date_colname"], cap_year=None
+    )
+    incremental = evaluate_hypothesis(
+        None, hypothesis, config, BreakDetector(window=91), None,
+        fingerprint="unused", evaluator=evaluator,
+    )
+    assert incremental["break_analysis"]["global_chow_F"] == pytest.approx(f91, rel=1e-9)
+
+
+def test_partitioned_daily_counts_treat_missing_flags_as_unflagged():
+    dates = pd.Series(pd.to_datetime(["2015-01-01", "2015-01-01", "2015-01-02", "2015-01-02"]))
+    start, flag_daily, all_daily = partitioned_daily_counts(dates, [1.0, np.nan, None, 0], workers=1)
+    assert start == pd.Timestamp("2015-01-01")
+    np.testing.assert_array_equal(flag_daily, [1, 0])
+    np.testing.assert_array_equal(all_daily, [2, 2])
+
+
+def test_encode_claims_reuses_a_compact_frame(frames, config, capsys):
+    legacy, compact = frames
+    cols, date_col = config["target_colnames"], config["date_colname"]
+    capsys.readouterr()
+    vocab, diag, days, start = encode_claims(compact, cols, date_col)
+    assert "Compacted" not in capsys.readouterr().out
+    expected = encode_claims(legacy, cols, date_col)
+    assert vocab == expected[0] and start == expected[3]
+    np.testing.assert_array_equal(diag, expected[1])
+    np.testing.assert_array_equal(days, expected[2])
@@ -0,0 +1,43 @@
+import pytest
+
+from hypothesis_refinement.icd_index import ICDIndex, build_icd_index, tokenize
+
+
+@pytest.fixture(scope="module")
+def index(tmp_path_factory):
+    """BM25-only index (no LSA embeddings) built from the shipped description files."""
+    return ICDIndex(build_icd_index(str(tmp_path_factory.mktemp("icd_index")), embedding_dims=0))
+
+
+def _top(index, query, k=6):
+    return [h["code"] for h in index.search(query, k=k, semantic_weight=0)]
+
+
+def test_tokenize_stems_to_shared_prefixes():
+    assert tokenize("Atherosclerosis") == tokenize("atherosclerotic") == ["atherosc"]
+    assert tokenize("cardiomyopathy, unspecified") == ["cardiomy"]
+
+
+@pytest.mark.parametrize(
+    "query, prefix, expected",
+    [
+        ("cardiomyopathy", "425", {"4254", "4255"}),
+        ("essential hypertension", "401", {"4019", "4010", "4011"}),
+        ("atherosclerotic extremities", "4402", {"44020", "44029"}),
+    ],
+)
+def test_bm25_ranks_the_matching_codes_first(index, query, prefix, expected):
+    top = _top(index, query)
+    assert expected <= set(top)
+    assert top[0].startswith(prefix)
+
+
+def test_candidates_reach_icd10_through_the_gem(index):
+    candidates = index.candidates("cardiomyopathy")
+    assert {"4254", "4255"} <= set(candidates["icd9"])
+    # synthetic_claims plants these for the cardiomyopathy concept
+    assert {"I429", "I426", "I428"} <= set(candidates["icd10"])
+
+
+def test_unknown_terms_return_nothing(index):
+    assert index.search("zzzqqq", semantic_weight=0) == []
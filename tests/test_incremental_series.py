@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+from utils.epoch_days import EPOCH_DAY_COL, to_epoch_days
+from time_series_evaluator.create_time_series import create_timeseries_function, flag_dataframe
+from time_series_evaluator.incremental_series import IncrementalSeriesEvaluator
+
+TARGET = "flag_hypothesis"
+
+
+def _full_scan(claims, codes, config):
+    flagged = flag_dataframe(claims.copy(), list(codes), config["target_colnames"], TARGET)
+    return create_timeseries_function(flagged, config["date_colname"], TARGET, cap_year=None)
+
+
+def test_incremental_updates_match_full_scans(synthetic, config):
+    claims, gt = synthetic
+    naive = set(gt["icd9_codes"]) | set(gt["naive_icd10_codes"])
+    steps = [
+        naive,
+        naive | set(gt["artifact_codes"]),  # add the missed code
+        naive | set(gt["artifact_codes"]) | {"I10", "4019"},  # add unrelated codes
+        (naive | {"I10"}) - {"4254"},  # remove codes, keep one of the additions
+        set(),
+    ]
+    evaluator = IncrementalSeriesEvaluator(
+        claims, config["target_colnames"], config["date_colname"], TARGET, cap_year=None
+    )
+    for codes in steps:
+        ts = evaluator.set_codes(codes).reset_index(drop=True)
+        full = _full_scan(claims, codes, config).reset_index(drop=True)
+        # the groupby path has no epoch_day column; the counts path adds the int32 day axis
+        pd.testing.assert_frame_equal(ts[full.columns], full, check_dtype=False)
+        np.testing.assert_array_equal(ts[EPOCH_DAY_COL], to_epoch_days(ts[config["date_colname"]]))
@@ -0,0 +1,153 @@
+import sys
+import types
+
+import pytest
+
+import hypothesis_refinement.refinement_loop as rl
+from utils.run_checkpoint import RunCheckpoint
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    return RunCheckpoint(str(tmp_path / "runs.sqlite"))
+
+
+@pytest.fixture
+def proposals(monkeypatch):
+    """Replace the LLM: queue items are returned in order (exceptions are raised)."""
+    state = {"queue": [], "calls": 0}
+
+    def fake(history, prev_results, user_input_desc="", **kwargs):
+        state["calls"] += 1
+        item = state["queue"].pop(0)
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    monkeypatch.setattr(rl, "generate_hypotheses", fake)
+    return state
+
+
+def _mapping(name, gt, icd10):
+    return {"name": name, "icd9_codes": set(gt["icd9_codes"]), "icd10_codes": set(icd10)}
+
+
+def _naive(gt):
+    return _mapping("naive", gt, gt["naive_icd10_codes"])
+
+
+def _broad(gt):
+    return _mapping("broad", gt, set(gt["naive_icd10_codes"]) | {"I10"})
+
+
+def _good(gt):
+    return _mapping("good", gt, gt["icd10_codes"])
+
+
+def test_resume_serial_run_after_a_crash(synthetic, config, checkpoint, proposals):
+    claims, gt = synthetic
+    kwargs = dict(registry=None, cache=None, checkpoint=checkpoint)
+    proposals["queue"] = [_naive(gt), _broad(gt), RuntimeError("quota")]
+    with pytest.raises(RuntimeError):
+        rl.run_refinement(
+            "cardiomyopathy", claims, config, max_iterations=5, run_id="serial", **kwargs
+        )
+    assert checkpoint.run("serial")["state"]["rounds_done"] == 2
+
+    proposals["queue"], proposals["calls"] = [_good(gt)], 0
+    best = rl.resume_refinement("serial", claims, config, **kwargs)
+    assert proposals["calls"] == 1  # only the iteration that crashed is asked again
+    assert best["hypothesis"]["name"] == "good"
+    assert best["iteration"] == 2 and not best["artificial_break"]
+    assert checkpoint.run("serial")["status"] == "completed"
+
+
+def test_resume_speculative_run_after_a_crash(synthetic, config, checkpoint, proposals):
+    claims, gt = synthetic
+    kwargs = dict(registry=None, cache=None, checkpoint=checkpoint)
+    proposals["queue"] = [_naive(gt), _broad(gt), RuntimeError("quota"), RuntimeError("quota")]
+    with pytest.raises(RuntimeError):
+        rl.run_speculative_refinement(
+            "cardiomyopathy", claims, config, k=2, max_rounds=3, workers=1, run_id="spec", **kwargs
+        )
+    assert checkpoint.run("spec")["state"]["rounds_done"] == 1
+
+    proposals["queue"], proposals["calls"] = [_good(gt), _good(gt)], 0
+    best = rl.resume_refinement("spec", claims, config, **kwargs)
+    assert proposals["calls"] == 2  # round 0 comes from the checkpoint
+    assert best["hypothesis"]["name"] == "good"
+    assert best["round"] == 1 and not best["artificial_break"]
+
+
+def test_resume_completed_speculative_run_runs_no_rounds(synthetic, config, checkpoint, proposals):
+    claims, gt = synthetic
+    kwargs = dict(registry=None, cache=None, checkpoint=checkpoint)
+    proposals["queue"] = [_good(gt), _good(gt)]
+    best = rl.run_speculative_refinement(
+        "cardiomyopathy", claims, config, k=2, max_rounds=3, workers=1, run_id="spec", **kwargs
+    )
+    assert not best["artificial_break"]
+    assert checkpoint.run("spec")["status"] == "completed"
+    steps = checkpoint.steps("spec")
+
+    proposals["calls"] = 0
+    resumed = rl.resume_refinement("spec", claims, config, **kwargs)
+    assert proposals["calls"] == 0
+    assert len(checkpoint.steps("spec")) == len(steps)
+    assert resumed["hypothesis"]["icd10_codes"] == best["hypothesis"]["icd10_codes"]
+    assert resumed["round"] == best["round"] == 0
+
+
+def test_serial_run_updates_one_incremental_series(
+    synthetic, config, checkpoint, proposals, monkeypatch
+):
+    claims, gt = synthetic
+    seen = []
+    set_codes = rl.IncrementalSeriesEvaluator.set_codes
+
+    def spy(self, codes):
+        seen.append((id(self), set(codes)))
+        return set_codes(self, codes)
+
+    monkeypatch.setattr(rl.IncrementalSeriesEvaluator, "set_codes", spy)
+    proposals["queue"] = [_naive(gt), _broad(gt), _good(gt)]
+    best = rl.run_refinement(
+        "cardiomyopathy", claims, config, max_iterations=5,
+        registry=None, cache=None, checkpoint=checkpoint,
+    )
+    assert best["hypothesis"]["name"] == "good"
+    assert len(seen) == 3 and len({evaluator for evaluator, _ in seen}) == 1
+    assert seen[-1][1] == set(gt["icd9_codes"]) | set(gt["icd10_codes"])
+
+
+def test_speculative_timings_are_mirrored_per_round(
+    synthetic, config, tmp_path, proposals, monkeypatch
+):
+    import utils
+    from utils.profiler import profiler
+
+    claims, gt = synthetic
+    calls = []
+    fake = types.ModuleType("utils.firestore_logger")
+    for name in ("create_run_doc", "finalize_run", "log_checkpoint"):
+        setattr(fake, name, lambda *args, **kwargs: None)
+    fake.log_checkpoint = lambda run_id, result: calls.append(("iteration", result["iteration"]))
+    fake.log_iteration_timings = lambda run_id, i, records: calls.append(("iteration timings", i))
+    fake.log_round_timings = lambda run_id, r, records: calls.append(("round timings", r))
+    monkeypatch.setitem(sys.modules, "utils.firestore_logger", fake)
+    monkeypatch.setattr(utils, "firestore_logger", fake, raising=False)
+
+    proposals["queue"] = [_naive(gt), _broad(gt), _good(gt), _good(gt)]
+    profiler.enable()
+    try:
+        rl.run_speculative_refinement(
+            "cardiomyopathy", claims, config, k=2, max_rounds=3, workers=1,
+            registry=None, cache=None,
+            checkpoint=RunCheckpoint(str(tmp_path / "runs.sqlite"), mirror=True),
+        )
+    finally:
+        profiler.disable()
+    assert [r for kind, r in calls if kind == "round timings"] == [0, 1]
+    assert not [r for kind, r in calls if kind == "iteration timings"]
+    # round 1's result is iteration 2 (identical proposals are evaluated once)
+    assert sorted(i for kind, i in calls if kind == "iteration") == [0, 1, 2]
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from break_detection.stream_monitor import MappingMonitor, StreamMonitor
+from time_series_evaluator.create_time_series import compact_claims
+from utils.synthetic_claims import generate_claims
+
+# a few weeks after the 364-day calibration: the default CUSUM (drift 0.5, threshold 5)
+# has an in-control run length of ~230 weekly points, so long quiet stretches can alert
+SHIFT = pd.Timestamp("2015-03-02")
+
+
+def _feed(monitor, shift):
+    """Poisson(40) daily counts, level times (1 + shift) from SHIFT on."""
+    rng = np.random.default_rng(1)
+    alerts = []
+    for date in pd.date_range("2014-01-06", "2015-06-30", freq="D"):
+        lam = 40 * (1 + shift if date >= SHIFT else 1)
+        alert = monitor.update(date, float(rng.poisson(lam)), 1000.0)
+        if alert:
+            alerts.append(alert)
+    return alerts
+
+
+@pytest.mark.parametrize("shift, direction", [(-0.3, "down"), (0.3, "up")])
+def test_monitor_alerts_soon_after_a_known_shift(shift, direction):
+    alerts = _feed(MappingMonitor("m", ["X"]), shift)
+    assert alerts, "no alert for a 30% level shift"
+    first = alerts[0]
+    assert SHIFT <= first["date"] <= SHIFT + pd.Timedelta(days=42)
+    assert first["direction"] == direction
+
+
+def test_monitor_stays_quiet_without_a_shift():
+    assert _feed(MappingMonitor("m", ["X"]), 0.0) == []
+
+
+def test_ingest_claims_reads_raw_and_compact_frames_alike(config):
+    df, gt = generate_claims(n_claims=20_000, n_diag_cols=11, seed=3)
+    df = df.sort_values("date", kind="stable")
+    cols = config["target_colnames"]
+    codes = set(gt["icd9_codes"]) | set(gt["naive_icd10_codes"])
+    results = []
+    for frame in (df, compact_claims(df, "date", cols)):
+        monitor = StreamMonitor(cols)
+        monitor.add_mapping("naive", codes, aggregate_days=28, threshold=3.0)
+        monitor.ingest_claims(frame)
+        results.append(monitor.status().drop(columns="last_date"))
+    pd.testing.assert_frame_equal(results[0], results[1])
+    assert results[0]["points"].iloc[0] > 0
@@ -0,0 +1,61 @@
+import pandas as pd
+import pytest
+
+from hypothesis_refinement.icd_parsing_script import validate_codes
+from utils.synthetic_claims import (
+    ARTIFACTS,
+    DIAG_COLNAMES,
+    generate_claims,
+    ground_truth,
+    read_ground_truth,
+    split_targets,
+    write_claims_parquet,
+)
+
+
+@pytest.mark.parametrize("artifact", list(ARTIFACTS))
+def test_ground_truth_codes_are_in_the_icd_vocabulary(artifact):
+    gt = ground_truth(artifact=artifact)
+    codes = {"icd9": sorted(gt["icd9_codes"]), "icd10": sorted(gt["icd10_codes"])}
+    valid, invalid = validate_codes(codes)
+    assert invalid == {"icd9": [], "icd10": []}
+    assert sorted(valid["icd10"]) == codes["icd10"]
+
+
+def test_split_targets_exclude_the_naive_code():
+    assert split_targets()["4409"] == ["I7091"]
+
+
+def test_generate_claims_is_reproducible():
+    a, _ = generate_claims(n_claims=5_000, n_diag_cols=11, seed=7)
+    b, _ = generate_claims(n_claims=5_000, n_diag_cols=11, seed=7)
+    c, _ = generate_claims(n_claims=5_000, n_diag_cols=11, seed=8)
+    pd.testing.assert_frame_equal(a, b)
+    assert not a.equals(c)
+    assert list(a.columns) == ["date"] + DIAG_COLNAMES
+
+
+def test_naive_mapping_loses_the_artifact_share_after_the_transition(synthetic, config):
+    claims, gt = synthetic
+    cols = config["target_colnames"]
+    post = claims["date"] >= pd.Timestamp("2015-10-01")
+
+    def share(codes):
+        flagged = claims[cols].isin(codes).any(axis=1)
+        return flagged[~post].mean(), flagged[post].mean()
+
+    naive_pre, naive_post = share(set(gt["icd9_codes"]) | set(gt["naive_icd10_codes"]))
+    correct_pre, correct_post = share(set(gt["icd9_codes"]) | set(gt["icd10_codes"]))
+    assert naive_post / naive_pre == pytest.approx(1 - gt["artifact_share"], abs=0.1)
+    assert correct_post / correct_pre == pytest.approx(1.0, abs=0.1)
+
+
+def test_parquet_round_trip_keeps_rows_and_ground_truth(tmp_path):
+    path = str(tmp_path / "claims.parquet")
+    truth = write_claims_parquet(path, n_claims=5_000, n_diag_cols=4, chunk_size=2_000, seed=1)
+    df = pd.read_parquet(path)
+    assert len(df) == 5_000
+    assert list(df.columns) == ["date"] + DIAG_COLNAMES[:4]
+    stored = read_ground_truth(path)
+    for key in ("icd9_codes", "icd10_codes", "naive_icd10_codes", "artifact_codes"):
+        assert stored[key] == truth[key]